@@ -3,6 +3,12 @@ ASGI config for backend project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The async AI endpoints under /api/async/ are meant to run here, e.g.
+
+    uvicorn backend.asgi:application --workers 1
+
+so model calls are awaited on the event loop rather than blocking a thread.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/6.0/howto/deployment/asgi/
 """
@@ -14,3 +20,11 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_asgi_application()
+
+# Build the model clients in the background, once per worker process
+# (no-op unless MODEL_CLIENTS['WARM_UP'] is on), and the local recipe index
+from smartpantry.services.model_clients import schedule_warm_up  # noqa: E402
+from smartpantry.services.recipe_service import schedule_index_build  # noqa: E402
+
+schedule_warm_up()
+schedule_index_build()
@@ -54,8 +54,17 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'smartpantry.middleware.ProfilingMiddleware',
 ]
 
+# Sampled per-request profiling (smartpantry/middleware.py)
+REQUEST_PROFILING = {
+    'ENABLED': os.environ.get('REQUEST_PROFILING_ENABLED', 'False') == 'True',
+    'SAMPLE_RATE': float(os.environ.get('REQUEST_PROFILING_SAMPLE_RATE', 0.01)),
+    'PROFILE': os.environ.get('REQUEST_PROFILING_PROFILE', 'True') == 'True',
+    'OUTPUT_DIR': os.environ.get('REQUEST_PROFILING_DIR', str(BASE_DIR / 'profiles')),
+}
+
 ROOT_URLCONF = 'backend.urls'
 
 TEMPLATES = [
@@ -78,14 +87,221 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
+# SQLite by default, tuned for concurrent writers on every new connection
+# (smartpantry/services/storage.py). DATABASE_ENGINE=postgres switches to
+# Postgres with persistent, health-checked connections.
+
+DATABASE_ENGINE = os.environ.get('DATABASE_ENGINE', 'sqlite')
+
+if DATABASE_ENGINE == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'smartpantry'),
+            'USER': os.environ.get('POSTGRES_USER', 'smartpantry'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Each worker thread keeps its connection open between requests
+            # and checks it is still alive before reusing it
+            'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': int(os.environ.get('POSTGRES_CONNECT_TIMEOUT', 5)),
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.environ.get('SQLITE_PATH', BASE_DIR / 'db.sqlite3'),
+            'OPTIONS': {
+                # Take the write lock when a transaction starts, not when it first writes
+                'transaction_mode': 'IMMEDIATE',
+            },
+        }
+    }
+
+STORAGE = {
+    'SQLITE_PRAGMAS': {
+        'journal_mode': 'WAL',
+        'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000)),
+        'synchronous': 'NORMAL',
+    },
+    'WRITE_RETRY_ATTEMPTS': int(os.environ.get('DATABASE_WRITE_RETRY_ATTEMPTS', 4)),
+}
+
 
-DATABASES = {
+# Model providers (smartpantry/services/providers.py)
+# MODEL_PROVIDER=offline swaps the remote model for a deterministic local stand-in,
+# so the AI paths can be load-tested without network access or an API key.
+
+MODEL_PROVIDER = os.environ.get('MODEL_PROVIDER', 'gemini')
+
+MODEL_PROVIDERS = {
+    'gemini': {
+        'BACKEND': 'smartpantry.services.google_gemini_service.GeminiProvider',
+        'OPTIONS': {
+            'api_key': os.environ.get('GOOGLE_API_KEY'),
+        },
+    },
+    'offline': {
+        'BACKEND': 'smartpantry.services.providers.OfflineProvider',
+        'OPTIONS': {
+            'latency_ms': float(os.environ.get('OFFLINE_MODEL_LATENCY_MS', 0)),
+            'latency_sigma': float(os.environ.get('OFFLINE_MODEL_LATENCY_SIGMA', 0)),
+            'error_rate': float(os.environ.get('OFFLINE_MODEL_ERROR_RATE', 0)),
+            'seed': int(os.environ.get('OFFLINE_MODEL_SEED', 0)),
+        },
+    },
+}
+
+
+# Shared google-genai clients and their pooled HTTP transport
+# (smartpantry/services/model_clients.py). With WARM_UP on, each worker
+# builds them in the background right after it starts or is forked.
+MODEL_CLIENTS = {
+    'MAX_CONNECTIONS': int(os.environ.get('MODEL_MAX_CONNECTIONS', 20)),
+    'MAX_KEEPALIVE_CONNECTIONS': int(os.environ.get('MODEL_MAX_KEEPALIVE_CONNECTIONS', 10)),
+    'KEEPALIVE_EXPIRY': float(os.environ.get('MODEL_KEEPALIVE_EXPIRY', 60)),
+    'TIMEOUT': float(os.environ.get('MODEL_HTTP_TIMEOUT', 60)),
+    'WARM_UP': os.environ.get('MODEL_CLIENTS_WARM_UP', 'False') == 'True',
+    'WARM_UP_CONNECT': os.environ.get('MODEL_CLIENTS_WARM_UP_CONNECT', 'False') == 'True',
+    # Points the clients at another Gemini-compatible server, e.g. the
+    # load test's stand-in (benchmarks/fake_gemini.py)
+    'BASE_URL': os.environ.get('GEMINI_BASE_URL') or None,
+}
+
+# Limits applied to every upstream model call (smartpantry/services/governor.py)
+MODEL_GOVERNOR = {
+    'MAX_CONCURRENCY': int(os.environ.get('MODEL_MAX_CONCURRENCY', 8)),
+    'ACQUIRE_TIMEOUT': float(os.environ.get('MODEL_ACQUIRE_TIMEOUT', 30)),
+    'RATE_PER_SECOND': float(os.environ.get('MODEL_RATE_PER_SECOND', 5)),
+    'BURST': int(os.environ.get('MODEL_RATE_BURST', 10)),
+    'RETRY_ATTEMPTS': int(os.environ.get('MODEL_RETRY_ATTEMPTS', 3)),
+    'RETRY_MAX_WAIT': float(os.environ.get('MODEL_RETRY_MAX_WAIT', 4)),
+    'BREAKER_FAILURE_THRESHOLD': int(os.environ.get('MODEL_BREAKER_FAILURE_THRESHOLD', 5)),
+    'BREAKER_RESET_SECONDS': float(os.environ.get('MODEL_BREAKER_RESET_SECONDS', 30)),
+}
+
+
+# Model choice and prompt budgeting (smartpantry/services/model_router.py).
+# MODELS keeps the built-in candidates unless overridden here.
+MODEL_ROUTER = {
+    'DEFAULT_MODEL': os.environ.get('MODEL_ROUTER_DEFAULT_MODEL', 'gemini-2.0-flash'),
+    'ALLOW_CLIENT_HINTS': os.environ.get('MODEL_ROUTER_ALLOW_CLIENT_HINTS', 'True') == 'True',
+    'PROMPT_TOKEN_BUDGET': int(os.environ.get('MODEL_ROUTER_PROMPT_TOKEN_BUDGET', 600)),
+    'SMALL_PROMPT_TOKENS': int(os.environ.get('MODEL_ROUTER_SMALL_PROMPT_TOKENS', 250)),
+    'MAX_ERROR_RATE': float(os.environ.get('MODEL_ROUTER_MAX_ERROR_RATE', 0.5)),
+    'SAMPLE_MAX_AGE': int(os.environ.get('MODEL_ROUTER_SAMPLE_MAX_AGE', 300)),
+}
+
+# Cache
+# The "recipes" alias is the shared tier of the recipe suggestion cache
+# (smartpantry/services/recipe_cache.py). File based so every worker sees it.
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
-    }
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recipes': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('RECIPE_CACHE_DIR', str(BASE_DIR / 'cache' / 'recipes')),
+        'TIMEOUT': int(os.environ.get('RECIPE_CACHE_TTL', 60 * 60 * 24)),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.environ.get('RECIPE_CACHE_MAX_ENTRIES', 10000)),
+        },
+    },
+}
+
+RECIPE_CACHE = {
+    'ENABLED': os.environ.get('RECIPE_CACHE_ENABLED', 'True') == 'True',
+    'TTL': int(os.environ.get('RECIPE_CACHE_TTL', 60 * 60 * 24)),
+    'LOCAL_MAX_ENTRIES': int(os.environ.get('RECIPE_CACHE_LOCAL_MAX_ENTRIES', 512)),
+    'SHARED_CACHE_ALIAS': 'recipes',
+}
+
+# Ingredient-name canonicalization (smartpantry/services/canonical.py); these
+# entries are added to the built-in alias and qualifier tables
+INGREDIENT_CANONICALIZER = {
+    'ALIASES': {},
+    'QUALIFIERS': [],
+}
+
+# Local recipe engine tried before the model (smartpantry/services/recipe_service.py)
+RECIPE_ENGINE = {
+    'ENABLED': os.environ.get('RECIPE_ENGINE_ENABLED', 'True') == 'True',
+    'MIN_COVERAGE': float(os.environ.get('RECIPE_ENGINE_MIN_COVERAGE', 0.75)),
+    'MAX_RESULTS': 3,
+    'REFRESH_SECONDS': int(os.environ.get('RECIPE_ENGINE_REFRESH_SECONDS', 300)),
+    'BUILD_AT_STARTUP': os.environ.get('RECIPE_ENGINE_BUILD_AT_STARTUP', 'True') == 'True',
+    'CORPUS_PATH': os.environ.get('RECIPE_CORPUS_PATH', str(BASE_DIR / 'smartpantry' / 'data' / 'recipes.json')),
+}
+
+# Perceptual-hash dedupe of scanned images (smartpantry/services/image_cache.py)
+IMAGE_CACHE = {
+    'ENABLED': os.environ.get('IMAGE_CACHE_ENABLED', 'True') == 'True',
+    'MAX_DISTANCE': int(os.environ.get('IMAGE_CACHE_MAX_DISTANCE', 3)),  # 0-3
+    'MIN_DETAIL': float(os.environ.get('IMAGE_CACHE_MIN_DETAIL', 1.0)),
+    'TTL': int(os.environ.get('IMAGE_CACHE_TTL', 60 * 60 * 24 * 7)),
+    'MAX_ENTRIES': int(os.environ.get('IMAGE_CACHE_MAX_ENTRIES', 5000)),
+    'EVICT_EVERY': int(os.environ.get('IMAGE_CACHE_EVICT_EVERY', 100)),
+}
+
+# In-memory decode/downscale of scan uploads (smartpantry/services/image_ingest.py)
+IMAGE_INGEST = {
+    'MAX_UPLOAD_BYTES': int(os.environ.get('IMAGE_MAX_UPLOAD_BYTES', 10 * 1024 * 1024)),
+    'MAX_PIXELS': int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000)),
+    'MAX_EDGE': int(os.environ.get('IMAGE_MAX_EDGE', 1024)),
+    'FORMAT': os.environ.get('IMAGE_FORMAT', 'JPEG'),
+    'QUALITY': int(os.environ.get('IMAGE_QUALITY', 85)),
+    'MIN_QUALITY': int(os.environ.get('IMAGE_MIN_QUALITY', 50)),
+    'MAX_BYTES': int(os.environ.get('IMAGE_MAX_BYTES', 300 * 1024)),
+}
+
+# Background scans (smartpantry/services/job_queue.py). Set SCAN_JOBS_IN_PROCESS=False
+# when running dedicated workers with `manage.py run_scan_workers`. Finished jobs
+# older than the retention window are removed by `manage.py purge_scan_jobs`.
+SCAN_JOBS = {
+    'CONCURRENCY': int(os.environ.get('SCAN_JOBS_CONCURRENCY', 2)),
+    'LEASE_SECONDS': int(os.environ.get('SCAN_JOBS_LEASE_SECONDS', 120)),
+    'MAX_ATTEMPTS': int(os.environ.get('SCAN_JOBS_MAX_ATTEMPTS', 3)),
+    'POLL_INTERVAL': float(os.environ.get('SCAN_JOBS_POLL_INTERVAL', 1.0)),
+    'IN_PROCESS': os.environ.get('SCAN_JOBS_IN_PROCESS', 'True') == 'True',
+    'RETENTION_HOURS': int(os.environ.get('SCAN_JOBS_RETENTION_HOURS', 24)),
+}
+
+# Pantry delta sync (GET /api/ingredients/changes/). Tombstones older than the
+# retention window are removed by `manage.py compact_tombstones`.
+PANTRY_SYNC = {
+    'PAGE_SIZE': int(os.environ.get('PANTRY_SYNC_PAGE_SIZE', 500)),
+    'TOMBSTONE_RETENTION_DAYS': int(os.environ.get('PANTRY_TOMBSTONE_RETENTION_DAYS', 30)),
 }
 
+# Expiry queries and digests (smartpantry/services/expiry.py)
+EXPIRY = {
+    'DEFAULT_WITHIN_DAYS': 7,
+    'MAX_WITHIN_DAYS': 365,
+    'DIGEST_WITHIN_DAYS': int(os.environ.get('EXPIRY_DIGEST_WITHIN_DAYS', 7)),
+    # Scanned items come without a date; they get today + this many days
+    'SCAN_DEFAULT_SHELF_LIFE_DAYS': int(os.environ.get('SCAN_DEFAULT_SHELF_LIFE_DAYS', 14)),
+}
+
+# Bulk pantry edits (POST /api/ingredients/bulk/)
+PANTRY_BULK = {
+    'MAX_OPERATIONS': int(os.environ.get('PANTRY_BULK_MAX_OPERATIONS', 200)),
+}
+
+# Multi-image scans (POST /api/ingredients/scan/batch/)
+BATCH_SCAN = {
+    'MAX_IMAGES': int(os.environ.get('BATCH_SCAN_MAX_IMAGES', 6)),
+    'CONCURRENCY': int(os.environ.get('BATCH_SCAN_CONCURRENCY', 3)),
+}
+
+# Keep uploads up to the ingest limit in memory instead of spooling them to a temp file
+FILE_UPLOAD_MAX_MEMORY_SIZE = IMAGE_INGEST['MAX_UPLOAD_BYTES']
+
 
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
@@ -130,8 +346,47 @@ AUTH_USER_MODEL = 'smartpantry.CustomUser'
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
-    )
+        'smartpantry.authentication.CachedJWTAuthentication',
+    ),
+    # JSON through orjson when installed, with the stdlib as fallback
+    'DEFAULT_RENDERER_CLASSES': (
+        'smartpantry.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'smartpantry.parsers.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
+}
+
+# Bearer token required by /metrics; leave empty to allow any scraper
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
+# Errors of the app's services (model calls, caches, scan jobs) go to stderr
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'default': {'format': '%(asctime)s %(levelname)s %(name)s [%(process)d]: %(message)s'},
+    },
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler', 'formatter': 'default'},
+    },
+    'loggers': {
+        'smartpantry': {
+            'handlers': ['console'],
+            'level': os.environ.get('SMARTPANTRY_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
+
+# Short-lived cache of JWT users (smartpantry/authentication.py)
+AUTH_USER_CACHE = {
+    'ENABLED': os.environ.get('AUTH_USER_CACHE_ENABLED', 'True') == 'True',
+    'TTL': int(os.environ.get('AUTH_USER_CACHE_TTL', 60)),
+    'MAX_ENTRIES': 10000,
 }
 
 
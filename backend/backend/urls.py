@@ -2,6 +2,8 @@ from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
+from smartpantry.views import metrics
+
 urlpatterns = [
     path('admin/', admin.site.urls),
     
@@ -11,4 +13,7 @@ urlpatterns = [
     
     # 2. Your existing app routes
     path('api/', include('smartpantry.urls')),
+
+    # Prometheus scrape endpoint
+    path('metrics', metrics, name='metrics'),
 ]
\ No newline at end of file
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
 
 application = get_wsgi_application()
+
+# Build the model clients in the background, once per worker process
+# (no-op unless MODEL_CLIENTS['WARM_UP'] is on), and the local recipe index
+from smartpantry.services.model_clients import schedule_warm_up  # noqa: E402
+from smartpantry.services.recipe_service import schedule_index_build  # noqa: E402
+
+schedule_warm_up()
+schedule_index_build()
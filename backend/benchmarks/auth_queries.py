@@ -0,0 +1,70 @@
+"""
+Queries and latency per authenticated request with the JWT user cache off
+and on (AUTH_USER_CACHE['ENABLED']).
+
+    SECRET_KEY=x python -m benchmarks.auth_queries [--requests 200]
+"""
+import argparse
+from datetime import date, timedelta
+
+from .harness import Timer, auth_headers, make_user, print_table, summarize, test_database
+
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+
+
+def run(requests):
+    from smartpantry.authentication import user_cache
+    from smartpantry.models import Ingredient
+
+    user = make_user()
+    expires = date.today() + timedelta(days=3)
+    Ingredient.objects.bulk_create([
+        Ingredient(user=user, name=f'item {n}', quantity=1, expiration_date=expires) for n in range(50)
+    ])
+    first = Ingredient.objects.filter(user=user).first()
+    headers = auth_headers(user)
+    client = Client()
+
+    endpoints = [
+        ('pantry list', '/api/ingredients/?page_size=50', {}),
+        ('pantry list (304)', '/api/ingredients/?page_size=50', {'HTTP_IF_NONE_MATCH': '*'}),
+        ('ingredient detail', f'/api/ingredients/{first.pk}/', {}),
+        ('expiring soon', '/api/ingredients/expiring/?within=7d', {}),
+    ]
+
+    rows = []
+    for enabled in (False, True):
+        with override_settings(AUTH_USER_CACHE={'ENABLED': enabled, 'TTL': 60, 'MAX_ENTRIES': 10000}):
+            user_cache.clear()
+            for label, url, extra in endpoints:
+                client.get(url, **headers, **extra)  # warm up
+                samples = []
+                with CaptureQueriesContext(connection) as queries:
+                    for _ in range(requests):
+                        with Timer() as timer:
+                            response = client.get(url, **headers, **extra)
+                        samples.append(timer.elapsed)
+                assert response.status_code in (200, 304), response.status_code
+                stats = summarize(samples)
+                rows.append({
+                    'endpoint': label,
+                    'user cache': 'on' if enabled else 'off',
+                    'queries/req': len(queries) / requests,
+                    'mean ms': stats['mean'],
+                    'p95 ms': stats['p95'],
+                })
+    print_table(rows, ['endpoint', 'user cache', 'queries/req', 'mean ms', 'p95 ms'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    args = parser.parse_args()
+    with test_database():
+        run(args.requests)
+
+
+if __name__ == '__main__':
+    main()
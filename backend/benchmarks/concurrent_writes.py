@@ -0,0 +1,150 @@
+"""
+Concurrent pantry writers against each storage configuration: several
+threads write to their users' pantries at the same time, alternating scan
+merges (merge_pantry, which writes first) and bulk edits (apply_operations,
+which reads the rows before writing). The script counts the writes that
+failed with "database is locked" along with write latency and throughput.
+
+Each configuration runs in a fresh interpreter against a fresh database:
+
+- sqlite-default: Django's SQLite defaults (rollback journal, deferred
+  transactions, no retries), i.e. the settings before services/storage.py;
+- sqlite-tuned: the project settings (WAL, busy timeout, BEGIN IMMEDIATE,
+  retried transactions);
+- postgres: the project settings with DATABASE_ENGINE=postgres, only run
+  with --postgres (uses the POSTGRES_* variables; the database must exist).
+
+    SECRET_KEY=x python -m benchmarks.concurrent_writes [--threads 8] [--writes 50] [--postgres]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from .harness import print_table, summarize
+
+# Run in a fresh interpreter with the configuration in BENCH_CONFIG; prints one JSON object
+CHILD = r"""
+import json, os, random, threading, time
+config = json.loads(os.environ['BENCH_CONFIG'])
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+from django.conf import settings
+if config['baseline']:
+    settings.DATABASES['default']['OPTIONS'] = {}
+    settings.STORAGE = {'SQLITE_PRAGMAS': {}, 'WRITE_RETRY_ATTEMPTS': 1}
+import django
+django.setup()
+
+from datetime import date, timedelta
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from smartpantry.models import CustomUser, Ingredient
+from smartpantry.services.metrics import DB_WRITE_RETRIES
+from smartpantry.services.pantry_bulk import apply_operations
+
+if connection.vendor == 'postgresql':
+    call_command('flush', interactive=False, verbosity=0)
+call_command('migrate', verbosity=0)
+users = [
+    CustomUser.objects.create_user(username=f'writer{n}', email=f'writer{n}@example.com', password='x')
+    for n in range(config['threads'])
+]
+names = [f'item {n}' for n in range(40)]
+expires = date.today() + timedelta(days=7)
+pantries = {}
+for user in users:
+    Ingredient.objects.merge_pantry(user, names, expires)
+    pantries[user.pk] = list(Ingredient.objects.filter(user=user).values_list('pk', flat=True))
+connections.close_all()
+
+latencies, locked, other = [], [], []
+started = []
+barrier = threading.Barrier(config['threads'], action=lambda: started.append(time.perf_counter()))
+
+def writer(user, seed):
+    rng = random.Random(seed)
+    ids = pantries[user.pk]
+    barrier.wait()
+    try:
+        for n in range(config['writes']):
+            start = time.perf_counter()
+            try:
+                if n % 2:
+                    apply_operations(user, [
+                        {'op': 'update', 'id': pk, 'quantity': rng.randint(1, 9)} for pk in rng.sample(ids, 3)
+                    ])
+                else:
+                    Ingredient.objects.merge_pantry(user, rng.sample(names, 5), expires)
+            except OperationalError as e:
+                (locked if 'locked' in str(e) else other).append(str(e))
+                continue
+            latencies.append(time.perf_counter() - start)
+    finally:
+        connection.close()
+
+threads = [threading.Thread(target=writer, args=(user, n)) for n, user in enumerate(users)]
+for thread in threads:
+    thread.start()
+for thread in threads:
+    thread.join()
+elapsed = time.perf_counter() - started[0]
+
+retries = sum(sample.value for metric in DB_WRITE_RETRIES.collect() for sample in metric.samples
+              if sample.name.endswith('_total'))
+print(json.dumps({
+    'latencies': latencies, 'locked': len(locked), 'other_errors': len(other),
+    'retries': retries, 'elapsed': elapsed,
+}))
+"""
+
+
+def measure(name, threads, writes, baseline=False, postgres=False):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(
+            os.environ,
+            BENCH_CONFIG=json.dumps({'threads': threads, 'writes': writes, 'baseline': baseline}),
+            SQLITE_PATH=os.path.join(directory, 'bench.sqlite3'),
+            DATABASE_ENGINE='postgres' if postgres else 'sqlite',
+        )
+        env.setdefault('SECRET_KEY', 'benchmark')
+        result = subprocess.run(
+            [sys.executable, '-c', CHILD], env=env, capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        )
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    data = json.loads(result.stdout.strip().splitlines()[-1])
+    stats = summarize(data['latencies'])
+    return {
+        'config': name,
+        'writes': threads * writes,
+        'ok': len(data['latencies']),
+        'locked': data['locked'],
+        'other errors': data['other_errors'],
+        'retries': int(data['retries']),
+        'writes/s': len(data['latencies']) / data['elapsed'],
+        'p50 ms': stats.get('p50'),
+        'p95 ms': stats.get('p95'),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--writes', type=int, default=50, help="write transactions per thread")
+    parser.add_argument('--postgres', action='store_true')
+    args = parser.parse_args()
+
+    rows = [
+        measure('sqlite-default', args.threads, args.writes, baseline=True),
+        measure('sqlite-tuned', args.threads, args.writes),
+    ]
+    if args.postgres:
+        rows.append(measure('postgres', args.threads, args.writes, postgres=True))
+    print_table(rows, ['config', 'writes', 'ok', 'locked', 'other errors', 'retries', 'writes/s', 'p50 ms', 'p95 ms'])
+
+
+if __name__ == '__main__':
+    main()
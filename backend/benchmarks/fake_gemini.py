@@ -0,0 +1,141 @@
+"""
+Local HTTP stand-in for the Gemini API, so the real client path (google-genai,
+the pooled transport, retries) can be load-tested without network access.
+
+It answers generateContent and streamGenerateContent (SSE) the way the API
+does, with the deterministic answers of the offline provider
+(services/providers.py): the same image or ingredient list always gives the
+same result. Latency is log-normal around --latency-ms and a fraction
+--error-rate of calls fail with 503, both drawn from a seeded generator.
+
+Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:<port>.
+
+    python -m benchmarks.fake_gemini [--port 8090] [--latency-ms 800] [--latency-sigma 0.3]
+"""
+import argparse
+import json
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from smartpantry.services.providers import OfflineProvider
+
+PATH_PATTERN = re.compile(r'^/[^/]+/models/(?P<model>[^/:]+):(?P<method>generateContent|streamGenerateContent)')
+INGREDIENTS_PATTERN = re.compile(r'I have these ingredients: (.*)\.\s*$', re.MULTILINE)
+
+
+def _candidate(text, model):
+    return {
+        "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+        "modelVersion": model,
+    }
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0, latency_sigma=0.0, error_rate=0.0, seed=0, stream_chunks=4):
+        super().__init__(address, FakeGeminiHandler)
+        self.model = OfflineProvider(latency_ms, latency_sigma, error_rate, seed, stream_chunks)
+        self.calls = Counter()
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def count(self, key):
+        with self._lock:
+            self.calls[key] += 1
+
+    def start(self):
+        threading.Thread(target=self.serve_forever, name='fake-gemini', daemon=True).start()
+        return self
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real API
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        match = PATH_PATTERN.match(self.path)
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if match is None:
+            self._send_json(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+        model, method = match.group('model'), match.group('method')
+        parts = [part for content in json.loads(body).get('contents', []) for part in content.get('parts', [])]
+        images = [part['inlineData'] for part in parts if 'inlineData' in part]
+        prompt = "\n".join(part.get('text', '') for part in parts)
+
+        server = self.server
+        operation = 'identify' if images else 'recipes'
+        server.count(f"{operation}:{model}")
+        latency, failed = server.model._draw()
+        if failed:
+            time.sleep(latency)
+            server.count('errors')
+            self._send_json(503, {"error": {"code": 503, "message": "Simulated overload", "status": "UNAVAILABLE"}})
+            return
+
+        if images:
+            # The encoded image is as good a key as the decoded one
+            text = server.model._identify_text(images[0].get('data', '').encode('ascii'))
+        else:
+            found = INGREDIENTS_PATTERN.search(prompt)
+            text = server.model._recipes_text(found.group(1).split(', ') if found else [])
+
+        if method == 'generateContent':
+            time.sleep(latency)
+            self._send_json(200, _candidate(text, model))
+            return
+
+        # Server-sent events, one chunk of the answer per event
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+        chunks = server.model.stream_chunks
+        size = max(1, -(-len(text) // chunks))
+        for start in range(0, len(text), size):
+            time.sleep(latency / chunks)
+            event = json.dumps(_candidate(text[start:start + size], model))
+            self.wfile.write(f"data: {event}\r\n\r\n".encode('utf-8'))
+            self.wfile.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8090)
+    parser.add_argument('--latency-ms', type=float, default=800)
+    parser.add_argument('--latency-sigma', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+    server = FakeGeminiServer(
+        (args.host, args.port), args.latency_ms, args.latency_sigma, args.error_rate, args.seed
+    )
+    print(f"Fake Gemini API on {server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
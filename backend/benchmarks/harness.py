@@ -0,0 +1,90 @@
+"""
+Shared setup for the scripts in this directory. Each script boots Django
+with the project settings and runs against a throwaway test database, so
+db.sqlite3 is never touched:
+
+    cd backend
+    SECRET_KEY=x MODEL_PROVIDER=offline python -m benchmarks.auth_queries
+"""
+import os
+import statistics
+import time
+from contextlib import contextmanager
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.db import connection  # noqa: E402
+from django.test.utils import setup_test_environment, teardown_test_environment  # noqa: E402
+
+
+@contextmanager
+def test_database():
+    setup_test_environment()
+    old_name = connection.settings_dict['NAME']
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        teardown_test_environment()
+
+
+def make_user(email='bench@example.com', **extra):
+    from smartpantry.models import CustomUser
+
+    return CustomUser.objects.create_user(
+        username=email.split('@')[0], email=email, password='bench-password', **extra
+    )
+
+
+def auth_headers(user):
+    from rest_framework_simplejwt.tokens import RefreshToken
+
+    return {'HTTP_AUTHORIZATION': f'Bearer {RefreshToken.for_user(user).access_token}'}
+
+
+def summarize(samples):
+    """
+    Latency summary in milliseconds for a list of durations in seconds.
+    """
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000
+
+    return {
+        'n': len(ordered),
+        'mean': statistics.fmean(ordered) * 1000,
+        'p50': pct(50),
+        'p95': pct(95),
+        'p99': pct(99),
+        'max': ordered[-1] * 1000,
+    }
+
+
+def print_table(rows, columns):
+    widths = [max(len(str(c)), *(len(_fmt(row.get(c))) for row in rows)) for c in columns]
+    print('  '.join(str(c).ljust(w) for c, w in zip(columns, widths)))
+    for row in rows:
+        print('  '.join(_fmt(row.get(c)).ljust(w) for c, w in zip(columns, widths)))
+
+
+def _fmt(value):
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    return '' if value is None else str(value)
+
+
+class Timer:
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.elapsed = time.perf_counter() - self.start
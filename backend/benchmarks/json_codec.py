@@ -0,0 +1,101 @@
+"""
+Encoding and decoding cost of the JSON paths: DRF's stdlib renderer and
+parser against the orjson-backed ones in settings, and the old fence
+stripping plus json.loads against the validating model-output parser.
+
+    SECRET_KEY=x python -m benchmarks.json_codec [--rounds 2000] [--items 200]
+"""
+import argparse
+import io
+import json
+import time
+
+from .harness import print_table
+
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+
+def pantry_page(items):
+    return {
+        'next': 'http://localhost/api/ingredients/?cursor=cD0yMDI2LTEwLTE3',
+        'previous': None,
+        'results': [
+            {
+                'id': n,
+                'name': f'ingredient {n}',
+                'quantity': n % 7 + 0.5,
+                'expiration_date': '2026-11-01',
+                'created_at': '2026-10-17T10:00:00.123456Z',
+                'updated_at': '2026-10-17T10:00:00.123456Z',
+            }
+            for n in range(items)
+        ],
+    }
+
+
+def model_answer():
+    recipes = [
+        {
+            'title': f'Recipe {n}',
+            'ingredients': ['egg', 'milk', 'flour', 'butter'],
+            'instructions': "Ingredients:\n- egg\n- milk\n\nStep-by-Step:\n1. Mix.\n2. Cook.",
+        }
+        for n in range(3)
+    ]
+    return "```json\n" + json.dumps(recipes, indent=2) + "\n```"
+
+
+def old_model_parse(text):
+    clean_text = text.strip()
+    if clean_text.startswith("```"):
+        clean_text = clean_text.replace("```json", "").replace("```", "").strip()
+    try:
+        return json.loads(clean_text)
+    except ValueError:
+        return []
+
+
+def per_call_us(func, rounds):
+    func()
+    start = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start) / rounds * 1e6
+
+
+def run(rounds, items):
+    from smartpantry.parsers import FastJSONParser
+    from smartpantry.renderers import FastJSONRenderer
+    from smartpantry.services.jsonio import orjson
+    from smartpantry.services.model_output import parse_recipes
+
+    page = pantry_page(items)
+    body = JSONRenderer().render(page)
+    answer = model_answer()
+    assert FastJSONRenderer().render(page) == body
+
+    cases = [
+        ('render pantry page', lambda: JSONRenderer().render(page), lambda: FastJSONRenderer().render(page)),
+        ('parse request body', lambda: JSONParser().parse(io.BytesIO(body)),
+         lambda: FastJSONParser().parse(io.BytesIO(body))),
+        ('parse model answer', lambda: old_model_parse(answer), lambda: parse_recipes(answer)),
+    ]
+    rows = []
+    for label, before, after in cases:
+        old, new = per_call_us(before, rounds), per_call_us(after, rounds)
+        rows.append({'case': label, 'stdlib us': old, 'current us': new, 'speedup': old / new})
+    print(f"orjson: {'yes' if orjson is not None else 'not installed'}; pantry page of {items} items, {len(body)} bytes")
+    print_table(rows, ['case', 'stdlib us', 'current us', 'speedup'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=200)
+    args = parser.parse_args()
+    run(args.rounds, args.items)
+
+
+if __name__ == '__main__':
+    main()
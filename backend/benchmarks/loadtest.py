@@ -0,0 +1,414 @@
+"""
+End-to-end load test of the API on one machine, without network access.
+
+For each server (gunicorn for WSGI, uvicorn for ASGI) the script:
+
+1. creates a fresh SQLite database (or flushes the configured Postgres one,
+   with DATABASE_ENGINE=postgres: use a throwaway database) and seeds
+   --users users with --pantry-size ingredients each;
+2. starts the local Gemini stand-in (benchmarks/fake_gemini.py) with the
+   given latency and error rate, and the server pointed at it;
+3. drives each endpoint in turn with --concurrency closed-loop clients for
+   --duration seconds (after a short warm-up), on keep-alive connections;
+4. reports p50/p95/p99 latency, throughput, errors and SQL queries per
+   request (from the Server-Timing header of the profiling middleware,
+   with cProfile off) for each endpoint.
+
+Under ASGI, scan and suggest use the async endpoints (/api/async/...).
+Users, payloads and model answers come from --seed, so two runs with the
+same arguments send the same requests. Write the results with --output and
+compare two runs with --compare:
+
+    SECRET_KEY=x python -m benchmarks.loadtest --output before.json
+    SECRET_KEY=x python -m benchmarks.loadtest --output after.json
+    python -m benchmarks.loadtest --compare before.json after.json
+"""
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+from .fake_gemini import FakeGeminiServer
+from .harness import print_table, summarize
+
+from smartpantry.services.providers import OFFLINE_INGREDIENTS
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = 'loadtest-password'
+ENDPOINTS = ('login', 'pantry_list', 'suggest', 'scan')
+SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+# Run in a fresh interpreter against the run's database; prints one JSON object
+SEED = r"""
+import json, os, random
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+import django
+django.setup()
+
+from datetime import date, timedelta
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.db import connection
+from rest_framework_simplejwt.tokens import RefreshToken
+from smartpantry.models import CustomUser, Ingredient
+from smartpantry.services.providers import OFFLINE_INGREDIENTS
+
+config = json.loads(os.environ['LOADTEST_SEED'])
+if connection.vendor == 'postgresql':
+    call_command('flush', interactive=False, verbosity=0)
+call_command('migrate', verbosity=0)
+
+rng = random.Random(config['seed'])
+password = make_password(config['password'])  # hashed once for every user
+users = CustomUser.objects.bulk_create([
+    CustomUser(username=f'load{n}', email=f'load{n}@example.com', password=password)
+    for n in range(config['users'])
+])
+names = OFFLINE_INGREDIENTS + [f'pantry item {n}' for n in range(config['pantry_size'])]
+today = date.today()
+for user in users:
+    Ingredient.objects.bulk_create([
+        Ingredient(user=user, name=name, quantity=rng.randint(1, 5),
+                   expiration_date=today + timedelta(days=rng.randint(-3, 30)))
+        for name in rng.sample(names, config['pantry_size'])
+    ])
+print(json.dumps([
+    {'email': user.email, 'token': str(RefreshToken.for_user(user).access_token)} for user in users
+]))
+"""
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def make_images(count, seed):
+    """
+    `count` distinct JPEG photos of noise, so scans are not all image-cache hits.
+    """
+    from PIL import Image
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        buffer = io.BytesIO()
+        Image.frombytes('RGB', (320, 240), rng.randbytes(320 * 240 * 3)).save(buffer, 'JPEG', quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def multipart(field, filename, data, content_type='image/jpeg'):
+    boundary = f"loadtest{random.getrandbits(64):016x}"
+    body = b''.join([
+        f'--{boundary}\r\n'.encode(),
+        f'Content-Disposition: form-data; name="{field}"; filename="{filename}"\r\n'.encode(),
+        f'Content-Type: {content_type}\r\n\r\n'.encode(),
+        data,
+        f'\r\n--{boundary}--\r\n'.encode(),
+    ])
+    return body, f'multipart/form-data; boundary={boundary}'
+
+
+class Workload:
+    """
+    Builds the requests for each endpoint: (method, path, body, headers).
+    """
+
+    def __init__(self, server, accounts, images, vocabulary):
+        self.server = server
+        self.accounts = accounts
+        self.images = images
+        self.vocabulary = vocabulary
+
+    def request(self, endpoint, rng):
+        account = rng.choice(self.accounts)
+        auth = {'Authorization': f"Bearer {account['token']}"}
+        if endpoint == 'login':
+            body = json.dumps({'username': account['email'], 'password': PASSWORD}).encode()
+            return 'POST', '/api/login/', body, {'Content-Type': 'application/json'}
+        if endpoint == 'pantry_list':
+            return 'GET', '/api/ingredients/?page_size=50', None, auth
+        if endpoint == 'suggest':
+            path = '/api/async/recipes/suggest/' if self.server == 'asgi' else '/api/recipes/suggest/'
+            body = json.dumps({'ingredients': rng.sample(self.vocabulary, rng.randint(3, 6))}).encode()
+            return 'POST', path, body, {**auth, 'Content-Type': 'application/json'}
+        if endpoint == 'scan':
+            path = '/api/async/ingredients/scan/' if self.server == 'asgi' else '/api/ingredients/scan/'
+            body, content_type = multipart('image', 'shelf.jpg', rng.choice(self.images))
+            return 'POST', path, body, {**auth, 'Content-Type': content_type}
+        raise ValueError(endpoint)
+
+
+def drive(port, workload, endpoint, concurrency, duration, seed, timeout):
+    """
+    Runs `concurrency` closed-loop clients for `duration` seconds. Returns
+    the samples: (latency, status, queries) per request; status 0 is a
+    connection error.
+    """
+    samples = []
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def client(number):
+        rng = random.Random(f"{seed}-{endpoint}-{number}")
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=timeout)
+        local = []
+        while time.monotonic() < deadline:
+            method, path, body, headers = workload.request(endpoint, rng)
+            start = time.perf_counter()
+            try:
+                connection.request(method, path, body=body, headers={**headers, 'Host': 'localhost'})
+                response = connection.getresponse()
+                response.read()
+                status = response.status
+                timing = SERVER_TIMING_QUERIES.search(response.getheader('Server-Timing') or '')
+                queries = int(timing.group(1)) if timing else None
+                if response.getheader('Connection', '').lower() == 'close':
+                    connection.close()
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                status, queries = 0, None
+            local.append((time.perf_counter() - start, status, queries))
+        connection.close()
+        with lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=client, args=(n,)) for n in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return samples
+
+
+def report(server, endpoint, samples, duration):
+    ok = [latency for latency, status, _ in samples if 200 <= status < 400]
+    queries = [q for _, status, q in samples if q is not None and 200 <= status < 400]
+    stats = summarize(ok)
+    return {
+        'server': server,
+        'endpoint': endpoint,
+        'requests': len(samples),
+        'errors': len(samples) - len(ok),
+        'throughput_rps': len(ok) / duration,
+        'latency_ms': {key: stats.get(key) for key in ('mean', 'p50', 'p95', 'p99', 'max')},
+        'queries_per_request': {
+            'mean': sum(queries) / len(queries) if queries else None,
+            'max': max(queries) if queries else None,
+        },
+    }
+
+
+def server_command(server, port, args):
+    if server == 'wsgi':
+        return [
+            sys.executable, '-m', 'gunicorn', 'backend.wsgi:application',
+            '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers), '--threads', str(args.threads),
+            '--worker-class', 'gthread', '--timeout', '120', '--log-level', 'warning',
+        ]
+    return [
+        sys.executable, '-m', 'uvicorn', 'backend.asgi:application',
+        '--host', '127.0.0.1', '--port', str(port), '--workers', str(args.workers), '--log-level', 'warning',
+    ]
+
+
+def wait_until_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with status {process.returncode}")
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/metrics', headers={'Host': 'localhost'})
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("server did not start in time")
+
+
+def run_server(server, args, images):
+    directory = tempfile.mkdtemp(prefix=f'loadtest-{server}-')
+    fake = FakeGeminiServer(
+        ('127.0.0.1', 0), args.model_latency_ms, args.model_latency_sigma, args.model_error_rate, args.seed
+    ).start()
+    env = dict(os.environ)
+    env.setdefault('SECRET_KEY', 'loadtest-secret-key-not-for-production-use')
+    # The upstream rate limits would cap the model-backed endpoints otherwise
+    env.setdefault('MODEL_RATE_PER_SECOND', '0')
+    env.setdefault('MODEL_MAX_CONCURRENCY', '64')
+    env.update(
+        DEBUG='False',
+        SQLITE_PATH=os.path.join(directory, 'loadtest.sqlite3'),
+        RECIPE_CACHE_DIR=os.path.join(directory, 'recipe-cache'),
+        MODEL_PROVIDER='gemini',
+        GOOGLE_API_KEY='loadtest',
+        GEMINI_BASE_URL=fake.url,
+        MODEL_CLIENTS_WARM_UP='True',
+        REQUEST_PROFILING_ENABLED='True',
+        REQUEST_PROFILING_SAMPLE_RATE='1',
+        REQUEST_PROFILING_PROFILE='False',
+        REQUEST_PROFILING_DIR='',
+        LOADTEST_SEED=json.dumps({
+            'users': args.users, 'pantry_size': args.pantry_size, 'seed': args.seed, 'password': PASSWORD,
+        }),
+    )
+    process = None
+    try:
+        seeded = subprocess.run(
+            [sys.executable, '-c', SEED], env=env, cwd=BACKEND_DIR, capture_output=True, text=True,
+        )
+        if seeded.returncode:
+            raise RuntimeError(seeded.stderr)
+        accounts = json.loads(seeded.stdout.strip().splitlines()[-1])
+
+        workload = Workload(server, accounts, images, OFFLINE_INGREDIENTS)
+        port = free_port()
+        process = subprocess.Popen(server_command(server, port, args), env=env, cwd=BACKEND_DIR)
+        wait_until_ready(port, process)
+
+        results = []
+        for endpoint in args.endpoints:
+            drive(port, workload, endpoint, args.concurrency, args.warmup, args.seed, args.timeout)
+            calls_before = fake.calls.copy()
+            samples = drive(port, workload, endpoint, args.concurrency, args.duration, args.seed, args.timeout)
+            result = report(server, endpoint, samples, args.duration)
+            # Upstream calls made while measuring; fewer than requests when caches answer
+            result['model_calls'] = dict(fake.calls - calls_before)
+            results.append(result)
+        return results
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+        fake.shutdown()
+        fake.server_close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True, text=True,
+        ).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def print_results(results):
+    rows = [
+        {
+            'server': r['server'],
+            'endpoint': r['endpoint'],
+            'requests': r['requests'],
+            'errors': r['errors'],
+            'rps': r['throughput_rps'],
+            'p50 ms': r['latency_ms']['p50'],
+            'p95 ms': r['latency_ms']['p95'],
+            'p99 ms': r['latency_ms']['p99'],
+            'queries': r['queries_per_request']['mean'],
+        }
+        for r in results
+    ]
+    print_table(rows, ['server', 'endpoint', 'requests', 'errors', 'rps', 'p50 ms', 'p95 ms', 'p99 ms', 'queries'])
+
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = {(r['server'], r['endpoint']): r for r in json.load(f)['results']}
+    with open(after_path) as f:
+        after = json.load(f)['results']
+
+    def change(old, new):
+        if not old or new is None:
+            return None
+        return f"{(new - old) / old * 100:+.1f}%"
+
+    rows = []
+    for r in after:
+        old = before.get((r['server'], r['endpoint']))
+        if old is None:
+            continue
+        rows.append({
+            'server': r['server'],
+            'endpoint': r['endpoint'],
+            'rps': change(old['throughput_rps'], r['throughput_rps']),
+            'p50': change(old['latency_ms']['p50'], r['latency_ms']['p50']),
+            'p95': change(old['latency_ms']['p95'], r['latency_ms']['p95']),
+            'p99': change(old['latency_ms']['p99'], r['latency_ms']['p99']),
+            'queries': change(old['queries_per_request']['mean'], r['queries_per_request']['mean']),
+            'errors': f"{old['errors']} -> {r['errors']}",
+        })
+    print_table(rows, ['server', 'endpoint', 'rps', 'p50', 'p95', 'p99', 'queries', 'errors'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', nargs='+', choices=('wsgi', 'asgi'), default=['wsgi', 'asgi'])
+    parser.add_argument('--endpoints', nargs='+', choices=ENDPOINTS, default=list(ENDPOINTS))
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--pantry-size', type=int, default=100, help="ingredients per user")
+    parser.add_argument('--concurrency', type=int, default=16, help="concurrent clients")
+    parser.add_argument('--duration', type=float, default=20, help="seconds per endpoint")
+    parser.add_argument('--warmup', type=float, default=3, help="seconds per endpoint, not measured")
+    parser.add_argument('--workers', type=int, default=2, help="server processes")
+    parser.add_argument('--threads', type=int, default=8, help="threads per gunicorn worker")
+    parser.add_argument('--model-latency-ms', type=float, default=800)
+    parser.add_argument('--model-latency-sigma', type=float, default=0.3)
+    parser.add_argument('--model-error-rate', type=float, default=0.0)
+    parser.add_argument('--distinct-images', type=int, default=50)
+    parser.add_argument('--timeout', type=float, default=120, help="per request, seconds")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the results as JSON to this file")
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help="compare two result files")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    started = datetime.now(timezone.utc)
+    images = make_images(args.distinct_images, args.seed)
+    results = []
+    for server in args.server:
+        results.extend(run_server(server, args, images))
+    print_results(results)
+
+    if args.output:
+        document = {
+            'meta': {
+                'started_at': started.isoformat(),
+                'revision': git_revision(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'cpus': os.cpu_count(),
+                'database': os.environ.get('DATABASE_ENGINE', 'sqlite'),
+                'arguments': {key: value for key, value in vars(args).items() if key not in ('output', 'compare')},
+            },
+            'results': results,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
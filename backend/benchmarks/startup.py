@@ -0,0 +1,87 @@
+"""
+Cold-start cost of a worker: import time of the project (settings, URLconf
+and views), time to the first response and the one-off cost of building the
+model client, each measured in a fresh interpreter.
+
+The "eager" rows import google-genai up front, as the services did before
+the client registry (services/model_clients.py) made it lazy.
+
+    SECRET_KEY=x python -m benchmarks.startup [--runs 5]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+from .harness import print_table, summarize
+
+# Run in a fresh interpreter; prints one JSON object
+CHILD = r"""
+import json, os, sys, time
+start = time.perf_counter()
+if os.environ.get('BENCH_EAGER') == '1':
+    from google import genai  # noqa: F401
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+import django
+django.setup()
+import backend.urls  # noqa: F401  (imports every view)
+imported = time.perf_counter()
+genai_loaded = 'google.genai' in sys.modules
+
+from django.test import Client
+response = Client(HTTP_HOST='localhost').get('/metrics')
+assert response.status_code == 200, response.status_code
+first_response = time.perf_counter()
+
+from smartpantry.services.providers import get_provider
+get_provider('gemini').client
+client_built = time.perf_counter()
+
+print(json.dumps({
+    'import': imported - start,
+    'first_response': first_response - start,
+    'model_client': client_built - first_response,
+    'genai_at_import': genai_loaded,
+}))
+"""
+
+
+def measure(eager):
+    env = dict(os.environ, BENCH_EAGER='1' if eager else '0', METRICS_TOKEN='')
+    env.setdefault('GOOGLE_API_KEY', 'benchmark-placeholder')
+    env.setdefault('SECRET_KEY', 'benchmark')
+    result = subprocess.run(
+        [sys.executable, '-c', CHILD], env=env, capture_output=True, text=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    if result.returncode:
+        raise RuntimeError(result.stderr)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def run(runs):
+    rows = []
+    for eager in (True, False):
+        samples = [measure(eager) for _ in range(runs)]
+        for key, label in (('import', 'import'), ('first_response', 'first response'), ('model_client', 'first model client')):
+            stats = summarize([sample[key] for sample in samples])
+            rows.append({
+                'mode': 'eager' if eager else 'lazy',
+                'phase': label,
+                'genai at import': samples[0]['genai_at_import'],
+                'p50 ms': stats['p50'],
+                'max ms': stats['max'],
+            })
+    print_table(rows, ['mode', 'phase', 'genai at import', 'p50 ms', 'max ms'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    run(args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class SmartpantryConfig(AppConfig):
     name = 'smartpantry'
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,152 @@
+"""
+Async versions of the AI endpoints, meant to be served by backend/asgi.py.
+
+The model calls are awaited on the event loop instead of holding a worker
+thread, so a single ASGI worker can keep many scans in flight. DRF views
+are sync-only, so these are plain Django async views that authenticate with
+the same JWT backend. When the client disconnects, Django cancels the view
+task, which cancels the pending upstream call.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from rest_framework.exceptions import AuthenticationFailed
+
+from .authentication import CachedJWTAuthentication
+from .models import Ingredient, ScanJob
+from .services.google_gemini_service import identify_ingredients_async
+from .services.image_cache import image_cache
+from .services.image_ingest import ImageIngestError, prepare_image
+from .services.jsonio import loads
+from .services.metrics import timed
+from .services.recipe_service import asuggest_recipes
+from .services.expiry import default_expiration_date
+from .serializers import ScanJobSerializer
+from .services.scan_pipeline import load_recipes, parse_detected_names
+from .views import JOB_POLL_INTERVAL, JOB_POLL_MAX_WAIT_ASYNC, cache_bypass_requested, poll_wait
+
+
+async def _authenticate(request):
+    try:
+        result = await sync_to_async(CachedJWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return result[0] if result else None
+
+
+def _request_data(request):
+    if request.content_type == 'application/json':
+        try:
+            return loads(request.body or b'{}')
+        except ValueError:
+            return {}
+    return request.POST
+
+
+def _unauthorized():
+    return JsonResponse(
+        {"detail": "Authentication credentials were not provided or are invalid."}, status=401
+    )
+
+
+# --- SCANNING LOGIC ---
+@csrf_exempt
+@require_POST
+async def scan_ingredient_gemini_async(request):
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    data = _request_data(request)
+    image_file = request.FILES.get('image')
+    selected_model = data.get('model', '')
+    bypass = cache_bypass_requested(data, request.headers)
+
+    if not image_file:
+        return JsonResponse({"error": "No image provided"}, status=400)
+
+    # Decoding and resizing is CPU work; keep it off the event loop
+    try:
+        prepared = await sync_to_async(prepare_image, thread_sensitive=False)(image_file)
+    except ImageIngestError as e:
+        return JsonResponse({"error": str(e)}, status=e.status_code)
+
+    try:
+        with timed('identify'):
+            raw_text = await image_cache.aget_or_identify(
+                prepared.data,
+                lambda: identify_ingredients_async(prepared.data, mime_type=prepared.mime_type),
+                bypass=bypass,
+                image=prepared.image,
+            )
+        detected_names = parse_detected_names(raw_text)
+
+        with timed('merge'):
+            await sync_to_async(Ingredient.objects.merge_pantry)(
+                user, detected_names, expiration_date=default_expiration_date(), increment=False
+            )
+
+        with timed('recipes'):
+            recipes_json = await asuggest_recipes(detected_names, selected_model, bypass=bypass)
+
+        return JsonResponse({
+            "detected_ingredients": detected_names,
+            "pantry_updated": True,
+            "suggested_recipes": load_recipes(recipes_json)
+        })
+
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+
+# --- RECIPE LOGIC ---
+@csrf_exempt
+@require_POST
+async def suggest_recipes_async(request):
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    data = _request_data(request)
+    ingredients = data.get("ingredients", [])
+    selected_model = data.get('model', '')
+
+    if not ingredients:
+        return JsonResponse({"error": "Ingredients list required"}, status=400)
+
+    with timed('recipes'):
+        recipes_json_str = await asuggest_recipes(
+            ingredients, selected_model, bypass=cache_bypass_requested(data, request.headers)
+        )
+
+    return JsonResponse({"recipes": load_recipes(recipes_json_str)})
+
+
+# --- BACKGROUND SCANS ---
+@require_GET
+async def scan_job_status_async(request, pk):
+    """
+    Long-polling job status (see views.scan_job_status) that waits on the
+    event loop instead of a worker thread, for up to JOB_POLL_MAX_WAIT_ASYNC.
+    """
+    user = await _authenticate(request)
+    if user is None:
+        return _unauthorized()
+
+    try:
+        job = await ScanJob.objects.defer('image').aget(pk=pk, user=user)
+    except ScanJob.DoesNotExist:
+        return JsonResponse({"detail": "Not found."}, status=404)
+
+    deadline = time.monotonic() + poll_wait(request.GET, JOB_POLL_MAX_WAIT_ASYNC)
+    seen = (job.status, job.stage)
+
+    while not job.is_finished and (job.status, job.stage) == seen and time.monotonic() < deadline:
+        await asyncio.sleep(JOB_POLL_INTERVAL)
+        await job.arefresh_from_db()
+
+    return JsonResponse(ScanJobSerializer(job).data)
@@ -0,0 +1,58 @@
+"""
+JWT authentication that resolves the token's user from a short-lived
+in-process cache instead of loading the CustomUser row on every request.
+
+Entries are keyed by user id and remember the token version they were
+loaded for (simplejwt's password-hash claim when CHECK_REVOKE_TOKEN is on),
+so a token minted after a password change never gets the old entry. Saving
+or deleting a user evicts its entry in this process (see signals.py); other
+processes pick the change up when the entry expires after TTL seconds.
+"""
+import copy
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.settings import api_settings
+
+from .services.recipe_cache import LocalLRUCache
+
+# Defaults, overridable through settings.AUTH_USER_CACHE
+DEFAULTS = {
+    'ENABLED': True,
+    'TTL': 60,
+    'MAX_ENTRIES': 10000,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'AUTH_USER_CACHE', {}))
+    return config
+
+
+_config = get_config()
+user_cache = LocalLRUCache(_config['MAX_ENTRIES'], _config['TTL'])
+
+
+def evict_user(user_id):
+    user_cache.delete(str(user_id))
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        if not get_config()['ENABLED'] or api_settings.USER_ID_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+
+        key = str(validated_token[api_settings.USER_ID_CLAIM])
+        version = validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) if api_settings.CHECK_REVOKE_TOKEN else None
+        entry = user_cache.get(key)
+        if entry is None or entry[0] != version:
+            # The parent does the lookup and the active / revocation checks
+            user = super().get_user(validated_token)
+            user_cache.set(key, (version, user))
+        else:
+            user = entry[1]
+        # Each request gets its own instance, so nothing a view sets on
+        # request.user leaks into other requests
+        return copy.copy(user)
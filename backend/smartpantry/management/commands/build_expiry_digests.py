@@ -0,0 +1,22 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from smartpantry.services.expiry import build_digests
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the expiring-soon digest of every user in one batched pass."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--within', type=int,
+            help="Days ahead to include (defaults to EXPIRY['DIGEST_WITHIN_DAYS']).",
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help="Digests per upsert.")
+
+    def handle(self, *args, **options):
+        within = options['within']
+        if within is None:
+            within = settings.EXPIRY['DIGEST_WITHIN_DAYS']
+        written = build_digests(within, batch_size=options['batch_size'])
+        self.stdout.write(f"Built {written} expiry digests ({within} days ahead).")
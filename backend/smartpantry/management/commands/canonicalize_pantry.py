@@ -0,0 +1,80 @@
+from collections import defaultdict
+from itertools import groupby
+from operator import attrgetter
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from smartpantry.models import Ingredient, bump_pantry_version
+from smartpantry.services.canonical import canonical_name
+
+
+def plan_merges(rows):
+    """
+    Groups one user's live rows by canonical name. Returns the rows to keep,
+    renamed and carrying the group's total quantity and earliest expiry, and
+    the ids of the rows merged into them. Rows already canonical and alone
+    in their group are left out; so are names with no canonical form.
+    """
+    groups = defaultdict(list)
+    for row in rows:
+        name = canonical_name(row.name)
+        if name:
+            groups[name].append(row)
+
+    kept, merged = [], []
+    for name, group in groups.items():
+        if len(group) == 1 and group[0].name == name:
+            continue
+        # The row that already has the name keeps its id; otherwise the oldest
+        keeper = next((row for row in group if row.name == name), group[0])
+        keeper.name = name
+        keeper.quantity = sum(row.quantity for row in group)
+        keeper.expiration_date = min(row.expiration_date for row in group)
+        kept.append(keeper)
+        merged.extend(row.pk for row in group if row is not keeper)
+    return kept, merged
+
+
+class Command(BaseCommand):
+    help = "Rewrites pantry ingredient names in canonical form, merging rows that end up with the same name."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report the changes without writing them.")
+
+    def handle(self, *args, **options):
+        # Tombstones keep their names: the unique constraint leaves them out
+        # and sync clients have already dropped them
+        rows = (
+            Ingredient.objects.order_by('user_id', 'pk')
+            .only('id', 'user_id', 'name', 'quantity', 'expiration_date')
+            .iterator()
+        )
+        users = renamed = merged = 0
+        for user_id, user_rows in groupby(rows, key=attrgetter('user_id')):
+            kept, merged_ids = plan_merges(list(user_rows))
+            if not kept:
+                continue
+            users += 1
+            renamed += len(kept)
+            merged += len(merged_ids)
+            if not options['dry_run']:
+                self.apply(user_id, kept, merged_ids)
+
+        prefix = "Would rewrite" if options['dry_run'] else "Rewrote"
+        self.stdout.write(f"{prefix} {renamed} ingredients for {users} users ({merged} merged into them).")
+
+    @staticmethod
+    def apply(user_id, kept, merged_ids):
+        now = timezone.now()
+        with transaction.atomic():
+            # Merged rows become tombstones first, freeing their names, so the
+            # changes feed tells sync clients to drop them
+            if merged_ids:
+                Ingredient.objects.filter(pk__in=merged_ids).update(deleted_at=now, updated_at=now)
+            for row in kept:
+                row.updated_at = now
+            Ingredient.objects.bulk_update(kept, ['name', 'quantity', 'expiration_date', 'updated_at'])
+            # Bulk queries send no signals, so bump the version here
+            bump_pantry_version(user_id)
@@ -0,0 +1,37 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from smartpantry.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = "Permanently removes ingredient tombstones older than the sync retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            help="Retention in days (defaults to PANTRY_SYNC['TOMBSTONE_RETENTION_DAYS']).",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        days = options['days']
+        if days is None:
+            days = settings.PANTRY_SYNC['TOMBSTONE_RETENTION_DAYS']
+        cutoff = timezone.now() - timedelta(days=days)
+        stale = Ingredient.all_objects.filter(deleted_at__lt=cutoff)
+
+        # Delete in batches so a large backlog doesn't hold one long write lock
+        removed = 0
+        while True:
+            ids = list(stale.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            # The post_delete receiver leaves pantry versions alone for tombstones
+            count, _ = Ingredient.all_objects.filter(id__in=ids).delete()
+            removed += count
+
+        self.stdout.write(f"Removed {removed} tombstones older than {days} days.")
@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from smartpantry.models import Recipe
+from smartpantry.services.recipe_service import get_config, invalidate_index, read_corpus
+
+
+class Command(BaseCommand):
+    help = "Loads recipes for the local recipe engine from a JSON or CSV corpus."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            help="Corpus file (defaults to RECIPE_ENGINE['CORPUS_PATH']).",
+        )
+        parser.add_argument(
+            '--replace', action='store_true',
+            help="Delete corpus recipes that are not in the file.",
+        )
+
+    def handle(self, *args, **options):
+        path = options['path'] or get_config()['CORPUS_PATH']
+        if not path:
+            raise CommandError("No corpus file given.")
+        try:
+            recipes = read_corpus(path)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Could not read {path}: {e}")
+
+        with transaction.atomic():
+            # Recipes already stored (from an earlier load, or generated by the
+            # model) are updated in place
+            Recipe.objects.bulk_create(
+                recipes,
+                batch_size=500,
+                update_conflicts=True,
+                unique_fields=['fingerprint'],
+                update_fields=['title', 'instructions', 'source', 'updated_at'],
+            )
+            removed = 0
+            if options['replace']:
+                removed, _ = (
+                    Recipe.objects.filter(source=Recipe.SOURCE_CORPUS)
+                    .exclude(fingerprint__in=[recipe.fingerprint for recipe in recipes])
+                    .delete()
+                )
+        invalidate_index()
+
+        self.stdout.write(f"Loaded {len(recipes)} recipes from {path} ({removed} removed).")
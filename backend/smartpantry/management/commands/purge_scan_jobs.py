@@ -0,0 +1,38 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from smartpantry.models import ScanJob
+from smartpantry.services.job_queue import get_config
+
+
+class Command(BaseCommand):
+    help = "Removes finished and failed scan jobs, with their stored images, older than the retention window."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours', type=int,
+            help="Retention in hours (defaults to SCAN_JOBS['RETENTION_HOURS']).",
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        hours = options['hours']
+        if hours is None:
+            hours = get_config()['RETENTION_HOURS']
+        cutoff = timezone.now() - timedelta(hours=hours)
+        stale = ScanJob.objects.filter(
+            status__in=[ScanJob.STATUS_SUCCEEDED, ScanJob.STATUS_FAILED], updated_at__lt=cutoff
+        )
+
+        # Delete in batches so a large backlog doesn't hold one long write lock
+        removed = 0
+        while True:
+            ids = list(stale.values_list('id', flat=True)[:options['batch_size']])
+            if not ids:
+                break
+            count, _ = ScanJob.objects.filter(id__in=ids).delete()
+            removed += count
+
+        self.stdout.write(f"Removed {removed} finished scan jobs older than {hours} hours.")
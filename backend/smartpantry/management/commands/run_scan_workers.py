@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from smartpantry.services.job_queue import ScanWorkerPool, get_config
+
+
+class Command(BaseCommand):
+    help = "Runs background scan workers until interrupted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, help="Worker threads (defaults to SCAN_JOBS['CONCURRENCY']).")
+
+    def handle(self, *args, **options):
+        config = get_config()
+        if options['concurrency']:
+            config['CONCURRENCY'] = options['concurrency']
+
+        pool = ScanWorkerPool(config)
+        pool.start()
+        self.stdout.write(f"Started {config['CONCURRENCY']} scan workers. Press Ctrl+C to stop.")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            self.stdout.write("Stopping scan workers...")
+            pool.stop()
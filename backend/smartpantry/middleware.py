@@ -0,0 +1,196 @@
+"""
+Opt-in request profiling. A fraction SAMPLE_RATE of requests (and, with
+DEBUG on, any request sent with an `X-Profile: 1` header) is run under
+cProfile with every SQL query timed. For each sampled request:
+
+- a Server-Timing header reports total and SQL time, plus the query count;
+- one JSON line (path, status, wall time, queries, SQL time) is appended to
+  OUTPUT_DIR/requests.jsonl;
+- the cProfile stats are dumped to OUTPUT_DIR as a .prof file, for
+  `python -m pstats` or snakeviz.
+
+Enable it with REQUEST_PROFILING['ENABLED'] (env REQUEST_PROFILING_ENABLED).
+When disabled the middleware removes itself from the chain at startup.
+
+The middleware is async-capable, so under ASGI the async views keep running
+on the event loop. There only the timers run: cProfile follows one thread,
+and the event loop thread interleaves every request in flight.
+"""
+import cProfile
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through settings.REQUEST_PROFILING
+DEFAULTS = {
+    'ENABLED': False,
+    'SAMPLE_RATE': 0.01,
+    'PROFILE': True,          # also run cProfile, not only the timers
+    'OUTPUT_DIR': None,
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'REQUEST_PROFILING', {}))
+    return config
+
+
+class QueryTimer:
+    """
+    Counts the queries of one request and the time they take. Unlike
+    connection.queries it works with DEBUG off.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+# The timer of the sampled request being served. A context variable follows
+# the request into sync_to_async threads, where its queries run under ASGI.
+_current_timer = ContextVar('request_query_timer', default=None)
+
+
+def _timed_execute(execute, sql, params, many, context):
+    timer = _current_timer.get()
+    if timer is None:
+        return execute(sql, params, many, context)
+    return timer(execute, sql, params, many, context)
+
+
+def install_query_timer(connection):
+    """
+    Adds the request query timer to a database connection; called for every
+    new connection (signals.py). Outside a sampled request it costs one
+    context variable lookup per query.
+    """
+    if _timed_execute not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_timed_execute)
+
+
+class ProfilingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    # cProfile allows one active profiler per process
+    _profiler_lock = threading.Lock()
+
+    def __init__(self, get_response):
+        self.config = get_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def _sampled(self, request):
+        if settings.DEBUG and request.headers.get('X-Profile') == '1':
+            return True
+        return random.random() < self.config['SAMPLE_RATE']
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not self._sampled(request):
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        profiler = None
+        if self.config['PROFILE'] and self._profiler_lock.acquire(blocking=False):
+            profiler = cProfile.Profile()
+
+        token = _current_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            if profiler is not None:
+                profiler.enable()
+            try:
+                response = self.get_response(request)
+            finally:
+                if profiler is not None:
+                    profiler.disable()
+            elapsed = time.perf_counter() - start
+        finally:
+            _current_timer.reset(token)
+            if profiler is not None:
+                self._profiler_lock.release()
+
+        _add_server_timing(response, elapsed, timer)
+        _write_report(self.config, request, response, elapsed, timer, profiler)
+        return response
+
+    async def __acall__(self, request):
+        if not self._sampled(request):
+            return await self.get_response(request)
+
+        timer = QueryTimer()
+        token = _current_timer.set(timer)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current_timer.reset(token)
+        elapsed = time.perf_counter() - start
+
+        _add_server_timing(response, elapsed, timer)
+        if self.config['OUTPUT_DIR']:
+            await sync_to_async(_write_report, thread_sensitive=False)(
+                self.config, request, response, elapsed, timer, None
+            )
+        return response
+
+
+def _add_server_timing(response, elapsed, timer):
+    response['Server-Timing'] = (
+        f'total;dur={elapsed * 1000:.1f}, '
+        f'db;dur={timer.duration * 1000:.1f};desc="{timer.count} queries"'
+    )
+
+
+def _write_report(config, request, response, elapsed, timer, profiler):
+    output_dir = config['OUTPUT_DIR']
+    if not output_dir:
+        return
+    try:
+        os.makedirs(output_dir, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        slug = re.sub(r'[^a-zA-Z0-9]+', '-', request.path).strip('-') or 'root'
+        profile_file = ''
+        if profiler is not None:
+            profile_file = f"{stamp}-{request.method}-{slug}-{os.getpid()}-{random.randrange(1 << 16):04x}.prof"
+            profiler.dump_stats(os.path.join(output_dir, profile_file))
+        report = {
+            'at': stamp,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'wall_ms': round(elapsed * 1000, 2),
+            'queries': timer.count,
+            'sql_ms': round(timer.duration * 1000, 2),
+            'profile': profile_file,
+        }
+        with open(os.path.join(output_dir, 'requests.jsonl'), 'a', encoding='utf-8') as f:
+            f.write(json.dumps(report) + "\n")
+    except OSError as e:
+        logger.warning("Could not write the request profile to %s: %s", output_dir, e)
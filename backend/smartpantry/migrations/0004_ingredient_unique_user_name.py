@@ -0,0 +1,37 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:01
+
+from django.db import migrations, models
+from django.db.models import Count, Min, Sum
+
+
+def merge_duplicate_ingredients(apps, schema_editor):
+    """
+    Folds duplicate (user, name) rows into the oldest one, summing quantities,
+    so the unique constraint can be added to existing databases.
+    """
+    Ingredient = apps.get_model('smartpantry', 'Ingredient')
+    duplicates = (
+        Ingredient.objects.values('user_id', 'name')
+        .annotate(rows=Count('id'), keep_id=Min('id'), total=Sum('quantity'))
+        .filter(rows__gt=1)
+    )
+    for group in duplicates:
+        Ingredient.objects.filter(pk=group['keep_id']).update(quantity=group['total'])
+        Ingredient.objects.filter(user_id=group['user_id'], name=group['name']).exclude(
+            pk=group['keep_id']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartpantry', '0003_scanresultcache'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_ingredients, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='ingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'name'), name='unique_ingredient_per_user'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartpantry', '0004_ingredient_unique_user_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScanJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=16)),
+                ('stage', models.CharField(choices=[('identify', 'Identifying ingredients'), ('merge', 'Updating pantry'), ('recipes', 'Suggesting recipes'), ('done', 'Done')], default='identify', max_length=16)),
+                ('image', models.BinaryField()),
+                ('mime_type', models.CharField(max_length=32)),
+                ('model_name', models.CharField(max_length=100)),
+                ('bypass_cache', models.BooleanField(default=False)),
+                ('detected_ingredients', models.JSONField(blank=True, null=True)),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('lease_owner', models.CharField(blank=True, max_length=64)),
+                ('lease_expires_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'lease_expires_at'], name='scanjob_claim_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartpantry', '0005_scanjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='customuser',
+            name='pantry_updated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='customuser',
+            name='pantry_version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
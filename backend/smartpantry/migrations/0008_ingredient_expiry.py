@@ -0,0 +1,35 @@
+# Generated by Django 6.0.2 on 2026-10-17 12:10
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartpantry', '0007_ingredient_sync_tombstones'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpiryDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('within_days', models.PositiveIntegerField()),
+                ('items', models.JSONField(default=list)),
+                ('expired_count', models.PositiveIntegerField(default=0)),
+                ('expiring_count', models.PositiveIntegerField(default=0)),
+                ('generated_at', models.DateTimeField(db_index=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(condition=models.Q(('deleted_at__isnull', True)), fields=['user', 'expiration_date'], name='ingredient_user_expiry_idx'),
+        ),
+        migrations.AddField(
+            model_name='expirydigest',
+            name='user',
+            field=models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='expiry_digest', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -0,0 +1,363 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:13
+
+from django.db import migrations, models
+
+# Frozen copy of smartpantry/data/recipes.json as it shipped with this migration.
+# The file keeps changing and is loaded with `manage.py load_recipe_corpus`;
+# the migration must seed the same rows whenever it runs.
+CORPUS = [
+    {
+        'title': 'Scrambled Eggs',
+        'ingredients': ['egg', 'butter', 'milk'],
+        'steps': [
+            'Whisk the eggs with the milk and a pinch of salt.',
+            'Melt the butter in a pan over low heat.',
+            'Add the eggs and stir gently until just set.',
+        ],
+    },
+    {
+        'title': 'Cheese Omelette',
+        'ingredients': ['egg', 'cheese', 'butter'],
+        'steps': [
+            'Beat the eggs.',
+            'Melt the butter in a pan and pour in the eggs.',
+            'Scatter the cheese over, fold and serve.',
+        ],
+    },
+    {
+        'title': 'Spinach and Mushroom Omelette',
+        'ingredients': ['egg', 'spinach', 'mushroom', 'butter'],
+        'steps': [
+            'Fry the mushrooms in the butter until golden.',
+            'Add the spinach and let it wilt.',
+            'Pour in the beaten eggs and cook until set.',
+        ],
+    },
+    {
+        'title': 'French Toast',
+        'ingredients': ['bread', 'egg', 'milk', 'butter'],
+        'steps': [
+            'Whisk the eggs and milk.',
+            'Soak the bread slices in the mixture.',
+            'Fry in butter until golden on both sides.',
+        ],
+    },
+    {
+        'title': 'Grilled Cheese Sandwich',
+        'ingredients': ['bread', 'cheese', 'butter'],
+        'steps': [
+            'Butter the outside of two bread slices.',
+            'Put the cheese between them.',
+            'Toast in a pan until the cheese melts.',
+        ],
+    },
+    {
+        'title': 'Tomato Soup',
+        'ingredients': ['tomato', 'onion', 'garlic', 'butter'],
+        'steps': [
+            'Soften the onion and garlic in the butter.',
+            'Add chopped tomatoes and a cup of water.',
+            'Simmer for 20 minutes and blend.',
+        ],
+    },
+    {
+        'title': 'Garlic Butter Pasta',
+        'ingredients': ['pasta', 'garlic', 'butter', 'cheese'],
+        'steps': [
+            'Boil the pasta.',
+            'Melt the butter with sliced garlic.',
+            'Toss the pasta in the garlic butter and top with cheese.',
+        ],
+    },
+    {
+        'title': 'Tomato Pasta',
+        'ingredients': ['pasta', 'tomato', 'garlic', 'onion'],
+        'steps': [
+            'Boil the pasta.',
+            'Cook the onion and garlic, then add tomatoes and simmer.',
+            'Toss the pasta with the sauce.',
+        ],
+    },
+    {
+        'title': 'Mushroom Risotto',
+        'ingredients': ['rice', 'mushroom', 'onion', 'butter', 'cheese'],
+        'steps': [
+            'Soften the onion in butter and fry the mushrooms.',
+            'Stir in the rice, then add hot water a ladle at a time.',
+            'Finish with cheese when the rice is creamy.',
+        ],
+    },
+    {
+        'title': 'Egg Fried Rice',
+        'ingredients': ['rice', 'egg', 'onion', 'carrot'],
+        'steps': [
+            'Fry the onion and diced carrot.',
+            'Add cooked rice and stir-fry.',
+            'Push aside, scramble the eggs and mix through.',
+        ],
+    },
+    {
+        'title': 'Chicken Fried Rice',
+        'ingredients': ['rice', 'chicken', 'egg', 'onion', 'pepper'],
+        'steps': [
+            'Stir-fry the diced chicken until cooked.',
+            'Add onion and pepper, then cooked rice.',
+            'Scramble in the eggs and serve.',
+        ],
+    },
+    {
+        'title': 'Roast Chicken and Potatoes',
+        'ingredients': ['chicken', 'potato', 'garlic', 'lemon'],
+        'steps': [
+            'Rub the chicken with garlic and lemon.',
+            'Surround it with chopped potatoes.',
+            'Roast at 200C for about an hour.',
+        ],
+    },
+    {
+        'title': 'Lemon Garlic Chicken',
+        'ingredients': ['chicken', 'lemon', 'garlic', 'butter'],
+        'steps': [
+            'Brown the chicken in butter.',
+            'Add garlic and lemon juice.',
+            'Cover and cook through.',
+        ],
+    },
+    {
+        'title': 'Chicken Curry',
+        'ingredients': ['chicken', 'onion', 'garlic', 'tomato', 'rice'],
+        'steps': [
+            'Fry the onion and garlic, add curry spices.',
+            'Add the chicken and tomatoes and simmer for 25 minutes.',
+            'Serve over rice.',
+        ],
+    },
+    {
+        'title': 'Mashed Potatoes',
+        'ingredients': ['potato', 'butter', 'milk'],
+        'steps': [
+            'Boil the potatoes until tender.',
+            'Mash with butter and warm milk.',
+            'Season to taste.',
+        ],
+    },
+    {
+        'title': 'Potato Soup',
+        'ingredients': ['potato', 'onion', 'milk', 'butter'],
+        'steps': [
+            'Soften the onion in butter.',
+            'Add diced potatoes and water and simmer until soft.',
+            'Stir in the milk and blend.',
+        ],
+    },
+    {
+        'title': 'Carrot Soup',
+        'ingredients': ['carrot', 'onion', 'garlic', 'butter'],
+        'steps': [
+            'Soften the onion and garlic in butter.',
+            'Add sliced carrots and water and simmer.',
+            'Blend until smooth.',
+        ],
+    },
+    {
+        'title': 'Bean Chili',
+        'ingredients': ['beans', 'tomato', 'onion', 'pepper', 'garlic'],
+        'steps': [
+            'Fry the onion, pepper and garlic.',
+            'Add tomatoes, beans and chili spices.',
+            'Simmer for 30 minutes.',
+        ],
+    },
+    {
+        'title': 'Beans on Toast',
+        'ingredients': ['beans', 'bread', 'butter'],
+        'steps': [
+            'Heat the beans.',
+            'Toast and butter the bread.',
+            'Spoon the beans over the toast.',
+        ],
+    },
+    {
+        'title': 'Rice and Beans',
+        'ingredients': ['rice', 'beans', 'onion', 'garlic'],
+        'steps': [
+            'Fry the onion and garlic.',
+            'Add rice, beans and water.',
+            'Cover and cook until the rice is tender.',
+        ],
+    },
+    {
+        'title': 'Stuffed Peppers',
+        'ingredients': ['pepper', 'rice', 'tomato', 'cheese', 'onion'],
+        'steps': [
+            'Halve and seed the peppers.',
+            'Fill with cooked rice mixed with onion and tomato.',
+            'Top with cheese and bake for 25 minutes.',
+        ],
+    },
+    {
+        'title': 'Pancakes',
+        'ingredients': ['flour', 'egg', 'milk', 'butter'],
+        'steps': [
+            'Whisk the flour, eggs and milk into a batter.',
+            'Melt a little butter in a pan.',
+            'Cook ladlefuls of batter until golden on both sides.',
+        ],
+    },
+    {
+        'title': 'Banana Pancakes',
+        'ingredients': ['banana', 'egg', 'flour', 'milk'],
+        'steps': [
+            'Mash the banana.',
+            'Whisk in the eggs, flour and milk.',
+            'Cook small pancakes in a hot pan.',
+        ],
+    },
+    {
+        'title': 'Banana Bread',
+        'ingredients': ['banana', 'flour', 'egg', 'butter'],
+        'steps': [
+            'Mash the bananas and mix with melted butter and egg.',
+            'Fold in the flour.',
+            'Bake in a loaf tin at 175C for an hour.',
+        ],
+    },
+    {
+        'title': 'Apple Crumble',
+        'ingredients': ['apple', 'flour', 'butter'],
+        'steps': [
+            'Slice the apples into a dish.',
+            'Rub the butter into the flour with sugar.',
+            'Scatter over the apples and bake for 35 minutes.',
+        ],
+    },
+    {
+        'title': 'Fruit Yogurt Bowl',
+        'ingredients': ['yogurt', 'banana', 'apple'],
+        'steps': [
+            'Slice the fruit.',
+            'Spoon the yogurt into a bowl.',
+            'Top with the fruit.',
+        ],
+    },
+    {
+        'title': 'Banana Smoothie',
+        'ingredients': ['banana', 'milk', 'yogurt'],
+        'steps': [
+            'Put everything in a blender.',
+            'Blend until smooth.',
+        ],
+    },
+    {
+        'title': 'Creamed Spinach',
+        'ingredients': ['spinach', 'butter', 'milk', 'garlic'],
+        'steps': [
+            'Wilt the spinach in butter with garlic.',
+            'Pour in the milk and simmer until thick.',
+        ],
+    },
+    {
+        'title': 'Garlic Mushrooms on Toast',
+        'ingredients': ['mushroom', 'garlic', 'butter', 'bread'],
+        'steps': [
+            'Fry the mushrooms in butter with garlic.',
+            'Toast the bread.',
+            'Pile the mushrooms on top.',
+        ],
+    },
+    {
+        'title': 'Shakshuka',
+        'ingredients': ['egg', 'tomato', 'onion', 'pepper', 'garlic'],
+        'steps': [
+            'Cook the onion, pepper and garlic.',
+            'Add tomatoes and simmer into a sauce.',
+            'Make wells, crack in the eggs and cover until set.',
+        ],
+    },
+    {
+        'title': 'Macaroni and Cheese',
+        'ingredients': ['pasta', 'cheese', 'milk', 'butter', 'flour'],
+        'steps': [
+            'Boil the pasta.',
+            'Make a sauce from butter, flour and milk, then melt in the cheese.',
+            'Mix with the pasta and bake until bubbling.',
+        ],
+    },
+    {
+        'title': 'Chicken Pasta',
+        'ingredients': ['chicken', 'pasta', 'garlic', 'spinach'],
+        'steps': [
+            'Boil the pasta.',
+            'Fry the chicken, then add garlic and spinach.',
+            'Toss everything together.',
+        ],
+    },
+    {
+        'title': 'Vegetable Stir Fry',
+        'ingredients': ['carrot', 'pepper', 'onion', 'mushroom', 'garlic'],
+        'steps': [
+            'Slice the vegetables thinly.',
+            'Stir-fry over high heat with garlic.',
+            'Season with soy sauce and serve.',
+        ],
+    },
+    {
+        'title': 'Potato Omelette',
+        'ingredients': ['potato', 'egg', 'onion'],
+        'steps': [
+            'Fry sliced potato and onion slowly until soft.',
+            'Add the beaten eggs.',
+            'Cook on both sides until set.',
+        ],
+    },
+    {
+        'title': 'Lemon Rice',
+        'ingredients': ['rice', 'lemon', 'butter'],
+        'steps': [
+            'Cook the rice.',
+            'Stir in butter and lemon juice and zest.',
+        ],
+    },
+]
+
+
+def load_bundled_corpus(apps, schema_editor):
+    """
+    Seeds the recipe table with the corpus shipped with the app. Later
+    changes to the file are loaded with `manage.py load_recipe_corpus`.
+    """
+    Recipe = apps.get_model('smartpantry', 'Recipe')
+    Recipe.objects.bulk_create([
+        Recipe(
+            title=row['title'],
+            ingredients=row['ingredients'],
+            instructions="\n".join(
+                ["Ingredients:"] + [f"- {name}" for name in row['ingredients']]
+                + ["Step-by-Step:"] + [f"{number}. {step}" for number, step in enumerate(row['steps'], 1)]
+            ),
+        )
+        for row in CORPUS
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartpantry', '0008_ingredient_expiry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Recipe',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('title', models.CharField(max_length=200, unique=True)),
+                ('ingredients', models.JSONField(default=list)),
+                ('instructions', models.TextField()),
+                ('source', models.CharField(choices=[('corpus', 'Recipe corpus')], default='corpus', max_length=16)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunPython(load_bundled_corpus, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 6.0.2 on 2026-10-17 10:40
+
+import hashlib
+
+from django.db import migrations, models
+
+
+def _normalize(name):
+    return ' '.join(str(name).strip().lower().split())
+
+
+def fill_fingerprints(apps, schema_editor):
+    """
+    The formula services.recipe_service.recipe_fingerprint used at the time.
+    """
+    Recipe = apps.get_model('smartpantry', 'Recipe')
+    recipes = list(Recipe.objects.all())
+    for recipe in recipes:
+        names = sorted({_normalize(name) for name in recipe.ingredients if _normalize(name)})
+        raw = f"{_normalize(recipe.title)}|{','.join(names)}"
+        recipe.fingerprint = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+    Recipe.objects.bulk_update(recipes, ['fingerprint'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartpantry', '0009_recipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='fingerprint',
+            field=models.CharField(max_length=64, null=True),
+        ),
+        migrations.RunPython(fill_fingerprints, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='recipe',
+            name='fingerprint',
+            field=models.CharField(max_length=64, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='title',
+            field=models.CharField(max_length=200),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='model_name',
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='source',
+            field=models.CharField(choices=[('corpus', 'Recipe corpus'), ('generated', 'Generated by a model')], default='corpus', max_length=16),
+        ),
+    ]
@@ -0,0 +1,160 @@
+# Generated by Django 6.0.2 on 2026-10-17 11:05
+
+import hashlib
+import re
+
+from django.db import migrations
+
+# A frozen copy of services/canonical.py (built-in tables only) as it was
+# when this migration was written, so later edits to the live tables don't
+# change what it writes on a fresh database.
+
+QUALIFIERS = {
+    'fresh', 'freshly', 'frozen', 'dried', 'canned', 'tinned', 'raw', 'cooked', 'ripe', 'organic',
+    'whole', 'sliced', 'chopped', 'diced', 'minced', 'grated', 'shredded', 'crushed', 'ground',
+    'peeled', 'boneless', 'skinless', 'large', 'small', 'medium', 'big', 'baby', 'some', 'few',
+    'of', 'a', 'an', 'the', 'piece', 'pieces', 'bunch', 'pack', 'packet', 'bag', 'box', 'jar', 'bottle',
+}
+
+ALIASES = {
+    'roma tomato': 'tomato',
+    'cherry tomato': 'tomato',
+    'plum tomato': 'tomato',
+    'scallion': 'green onion',
+    'spring onion': 'green onion',
+    'aubergine': 'eggplant',
+    'courgette': 'zucchini',
+    'coriander': 'cilantro',
+    'capsicum': 'pepper',
+    'bell pepper': 'pepper',
+    'sweet pepper': 'pepper',
+    'garbanzo': 'chickpea',
+    'garbanzo bean': 'chickpea',
+    'chicken breast': 'chicken',
+    'chicken thigh': 'chicken',
+    'hen egg': 'egg',
+    'chicken egg': 'egg',
+    'cheddar': 'cheese',
+    'cheddar cheese': 'cheese',
+    'yoghurt': 'yogurt',
+    'greek yogurt': 'yogurt',
+    'spaghetti': 'pasta',
+    'penne': 'pasta',
+    'macaroni': 'pasta',
+    'white rice': 'rice',
+    'brown rice': 'rice',
+    'basmati rice': 'rice',
+    'jasmine rice': 'rice',
+    'russet potato': 'potato',
+    'white onion': 'onion',
+    'yellow onion': 'onion',
+    'brown onion': 'onion',
+    'button mushroom': 'mushroom',
+    'champignon': 'mushroom',
+    'whole milk': 'milk',
+    'skim milk': 'milk',
+    'all purpose flour': 'flour',
+    'plain flour': 'flour',
+    'wheat flour': 'flour',
+    'unsalted butter': 'butter',
+    'salted butter': 'butter',
+    'garlic clove': 'garlic',
+    'kidney bean': 'bean',
+    'black bean': 'bean',
+    'baked bean': 'bean',
+}
+
+IRREGULAR = {
+    'leaves': 'leaf',
+    'loaves': 'loaf',
+    'halves': 'half',
+    'cookies': 'cookie',
+    'brownies': 'brownie',
+    'smoothies': 'smoothie',
+    'pies': 'pie',
+    'cloves': 'clove',
+    'olives': 'olive',
+    'chives': 'chive',
+    'anchovies': 'anchovy',
+}
+INVARIANT = {'molasses', 'greens', 'brussels', 'series', 'species'}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def singular(word):
+    if word in IRREGULAR:
+        return IRREGULAR[word]
+    if len(word) <= 3 or word in INVARIANT or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('oes'):
+        return word[:-2]
+    if word.endswith(('ches', 'shes', 'xes', 'zes', 'sses')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+
+def _words(text):
+    return [
+        singular(word) for word in TOKEN_PATTERN.findall(str(text).lower())
+        if word not in QUALIFIERS and not word.isdigit()
+    ]
+
+
+_ALIAS_KEYS = {' '.join(_words(alias)): ' '.join(_words(target)) for alias, target in ALIASES.items()}
+
+
+def canonical_name(name):
+    words = _words(name)
+    for start in range(len(words)):
+        target = _ALIAS_KEYS.get(' '.join(words[start:]))
+        if target is not None:
+            return target
+    return ' '.join(words)
+
+
+def canonical_names(names):
+    return list(dict.fromkeys(name for name in map(canonical_name, names) if name))
+
+
+def canonicalize_recipes(apps, schema_editor):
+    """
+    Rewrites stored recipe ingredients in canonical form and recomputes the
+    fingerprints, keeping the oldest row where two recipes now coincide.
+    """
+    Recipe = apps.get_model('smartpantry', 'Recipe')
+    seen = set()
+    duplicates = []
+    recipes = []
+    for recipe in Recipe.objects.order_by('pk'):
+        recipe.ingredients = canonical_names(recipe.ingredients)
+        title = ' '.join(recipe.title.strip().lower().split())
+        raw = f"{title}|{','.join(sorted(recipe.ingredients))}"
+        recipe.fingerprint = hashlib.sha256(raw.encode('utf-8')).hexdigest()
+        if recipe.fingerprint in seen:
+            duplicates.append(recipe.pk)
+        else:
+            seen.add(recipe.fingerprint)
+            recipes.append(recipe)
+    Recipe.objects.filter(pk__in=duplicates).delete()
+    # Move every row to a placeholder first so a new fingerprint can't collide
+    # with an old one that has not been rewritten yet
+    placeholders = [Recipe(pk=recipe.pk, fingerprint=f"migrating-{recipe.pk}") for recipe in recipes]
+    Recipe.objects.bulk_update(placeholders, ['fingerprint'], batch_size=500)
+    Recipe.objects.bulk_update(recipes, ['ingredients', 'fingerprint'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('smartpantry', '0010_recipe_generated'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_recipes, migrations.RunPython.noop),
+    ]
@@ -1,27 +1,266 @@
-from django.db import models
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Case, F, Value, When
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
+
+from .services.storage import retry_on_locked
 
 # Create your models here.
 class CustomUser(AbstractUser):
 
     email = models.EmailField(unique=True)
+    # Bumped on every pantry change; lets the pantry list answer conditional
+    # GETs (ETag / Last-Modified) without querying or serializing ingredients
+    pantry_version = models.PositiveIntegerField(default=0)
+    pantry_updated_at = models.DateTimeField(null=True, blank=True)
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
     def __str__(self) -> str:
         return self.email
+
+
+def bump_pantry_version(user_id):
+    CustomUser.objects.filter(pk=user_id).update(
+        pantry_version=F('pantry_version') + 1, pantry_updated_at=timezone.now()
+    )
     
 
+class IngredientQuerySet(models.QuerySet):
+
+    @retry_on_locked
+    def merge_pantry(self, user, items, expiration_date, increment=True):
+        """
+        Merges detected items into a user's pantry in one transaction and a
+        constant number of queries, however many items there are.
+
+        `items` is an iterable of names or (name, quantity) pairs; repeated
+        names are summed. With increment=True missing rows are created in one
+        INSERT that skips existing (user, name) pairs, then every row gets its
+        quantity bumped in one UPDATE. Otherwise one SELECT finds the names
+        already there and only the missing ones are inserted, so merging
+        items that are all present writes nothing and keeps the pantry version.
+        """
+        quantities = Counter()
+        for item in items:
+            name, quantity = (item, 1) if isinstance(item, str) else item
+            quantities[name] += quantity
+        if not quantities:
+            return self.none()
+
+        with transaction.atomic():
+            if increment:
+                missing = quantities
+            else:
+                existing = set(self.filter(user=user, name__in=quantities).values_list('name', flat=True))
+                missing = {name: quantity for name, quantity in quantities.items() if name not in existing}
+            if missing:
+                self.bulk_create(
+                    [
+                        Ingredient(
+                            user=user,
+                            name=name,
+                            # New rows start at zero when the UPDATE below adds the quantity
+                            quantity=0 if increment else quantity,
+                            expiration_date=expiration_date,
+                        )
+                        for name, quantity in missing.items()
+                    ],
+                    # A concurrent merge may have added the same name since
+                    ignore_conflicts=True,
+                )
+            updated = 0
+            if increment:
+                updated = self.filter(user=user, name__in=quantities).update(
+                    quantity=F('quantity') + Case(
+                        *[When(name=name, then=Value(quantity)) for name, quantity in quantities.items()],
+                        default=Value(0),
+                        output_field=models.FloatField(),
+                    ),
+                    # update() skips auto_now; the changes feed depends on it
+                    updated_at=timezone.now(),
+                )
+            if missing or updated:
+                # Bulk queries send no signals, so bump the version here
+                bump_pantry_version(user.pk)
+
+        return self.filter(user=user, name__in=quantities)
+
+
+class IngredientManager(models.Manager.from_queryset(IngredientQuerySet)):
+    """
+    Live ingredients only. Deleted rows stay behind as tombstones for the
+    changes feed and are reachable through Ingredient.all_objects.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Ingredient(models.Model):
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     name = models.CharField(max_length=100)
     quantity = models.FloatField()
     expiration_date = models.DateField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Set instead of deleting the row, so sync clients learn about deletions
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = IngredientManager()
+    all_objects = IngredientQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # Also serves as the (user, name) lookup index. Tombstones are left
+            # out so a deleted name can be added again.
+            models.UniqueConstraint(
+                fields=['user', 'name'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='unique_ingredient_per_user',
+            ),
+        ]
+        indexes = [
+            # The changes feed reads a user's rows in updated_at order
+            models.Index(fields=['user', 'updated_at'], name='ingredient_user_updated_idx'),
+            # "What expires this week" for one user; tombstones are never asked for
+            models.Index(
+                fields=['user', 'expiration_date'],
+                condition=models.Q(deleted_at__isnull=True),
+                name='ingredient_user_expiry_idx',
+            ),
+        ]
 
     def __str__(self):
         return self.name
-    
 
+    def soft_delete(self):
+        self.deleted_at = timezone.now()
+        self.save(update_fields=['deleted_at', 'updated_at'])
+
+
+class ExpiryDigest(models.Model):
+    """
+    Precomputed list of a user's ingredients expiring soon, rebuilt for all
+    users at once by `manage.py build_expiry_digests`.
+    """
+    user = models.OneToOneField(CustomUser, on_delete=models.CASCADE, related_name='expiry_digest')
+    within_days = models.PositiveIntegerField()
+    items = models.JSONField(default=list)
+    expired_count = models.PositiveIntegerField(default=0)
+    expiring_count = models.PositiveIntegerField(default=0)
+    generated_at = models.DateTimeField(db_index=True)
+
+    def __str__(self):
+        return f"Expiry digest for {self.user}"
+
+
+class Recipe(models.Model):
+    """
+    A recipe the local engine (services/recipe_service.py) can suggest
+    without calling a model. `ingredients` holds normalized names.
+    Recipes come from the bundled corpus or are kept from model answers;
+    `fingerprint` identifies a normalized title and ingredient set, so the
+    same recipe generated twice is stored once.
+    """
+    SOURCE_CORPUS = 'corpus'
+    SOURCE_GENERATED = 'generated'
+    SOURCE_CHOICES = [
+        (SOURCE_CORPUS, 'Recipe corpus'),
+        (SOURCE_GENERATED, 'Generated by a model'),
+    ]
+
+    title = models.CharField(max_length=200)
+    fingerprint = models.CharField(max_length=64, unique=True)
+    ingredients = models.JSONField(default=list)
+    instructions = models.TextField()
+    source = models.CharField(max_length=16, choices=SOURCE_CHOICES, default=SOURCE_CORPUS)
+    model_name = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return self.title
+
+
+class ScanResultCache(models.Model):
+    """
+    Detection results keyed on image content, used to skip repeat vision calls.
+    The 64-bit perceptual hash is also split into four 16-bit bands; any two
+    hashes within Hamming distance 3 share at least one band exactly, so
+    near-duplicate lookups only scan rows matching an indexed band.
+    """
+    digest = models.CharField(max_length=64, unique=True)
+    phash = models.BigIntegerField()
+    band0 = models.PositiveIntegerField(db_index=True)
+    band1 = models.PositiveIntegerField(db_index=True)
+    band2 = models.PositiveIntegerField(db_index=True)
+    band3 = models.PositiveIntegerField(db_index=True)
+    result = models.TextField()
+    hits = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    last_used_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    def __str__(self):
+        return self.digest
+
+
+class ScanJob(models.Model):
+    """
+    A queued background scan (POST /api/ingredients/scan/?async=1).
+    Workers in services/job_queue.py claim rows by taking a time-limited
+    lease; a job whose worker died is picked up again once its lease expires.
+    """
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    STAGE_IDENTIFY = 'identify'
+    STAGE_MERGE = 'merge'
+    STAGE_RECIPES = 'recipes'
+    STAGE_DONE = 'done'
+    STAGE_CHOICES = [
+        (STAGE_IDENTIFY, 'Identifying ingredients'),
+        (STAGE_MERGE, 'Updating pantry'),
+        (STAGE_RECIPES, 'Suggesting recipes'),
+        (STAGE_DONE, 'Done'),
+    ]
+
+    user = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=16, choices=STAGE_CHOICES, default=STAGE_IDENTIFY)
+    image = models.BinaryField()
+    mime_type = models.CharField(max_length=32)
+    model_name = models.CharField(max_length=100)
+    bypass_cache = models.BooleanField(default=False)
+    detected_ingredients = models.JSONField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    attempts = models.PositiveIntegerField(default=0)
+    lease_owner = models.CharField(max_length=64, blank=True)
+    lease_expires_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for claimable jobs by status and lease expiry
+            models.Index(fields=['status', 'lease_expires_at'], name='scanjob_claim_idx'),
+        ]
 
+    @property
+    def is_finished(self):
+        return self.status in (self.STATUS_SUCCEEDED, self.STATUS_FAILED)
+
+    def __str__(self):
+        return f"ScanJob {self.pk} ({self.status})"
@@ -0,0 +1,13 @@
+from rest_framework.pagination import CursorPagination
+
+
+class PantryCursorPagination(CursorPagination):
+    """
+    Keyset pagination over a user's pantry. Names are unique per user and
+    covered by the (user, name) index, so every page is an index range scan
+    and inserts or deletes never shift items between pages.
+    """
+    ordering = 'name'
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 200
@@ -0,0 +1,34 @@
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+from .services.jsonio import orjson
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    DRF's JSONRenderer, encoding with orjson when it is installed.
+
+    The output matches DRF's: dates and times, Decimals, lazy strings and
+    querysets go through DRF's encoder, and U+2028/U+2029 are escaped.
+    Indented output (?indent= / Accept parameters) and anything orjson
+    refuses, such as integers beyond 64 bits, use DRF's renderer.
+    """
+    _encoder = JSONEncoder()
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is None or self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            ret = orjson.dumps(
+                data,
+                default=self._encoder.default,
+                option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS,
+            )
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as DRF: these are valid JSON but break JavaScript string literals
+        if b'\xe2\x80\xa8' in ret or b'\xe2\x80\xa9' in ret:
+            ret = ret.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+        return ret
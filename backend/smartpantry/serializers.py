@@ -1,5 +1,7 @@
-from .models import CustomUser, Ingredient
+from .models import CustomUser, Ingredient, ScanJob
+from .services.canonical import canonical_name
 from rest_framework import serializers
+from django.conf import settings
 from django.contrib.auth import authenticate, get_user_model
 
 User = get_user_model()
@@ -44,8 +46,118 @@ class UserLoginSerializer(serializers.Serializer):
             return user 
         raise serializers.ValidationError("Incorrect credentials provided.")
 
-class IngredientSerializer(serializers.ModelSerializer):
+class SparseFieldsetMixin:
+    """
+    Lets clients ask for a subset of fields with ?fields=id,name on GET
+    requests. Unknown names are ignored; the rest of the fields are dropped
+    before serialization, so they cost nothing.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method != 'GET':
+            return
+        requested = request.query_params.get('fields')
+        if not requested:
+            return
+        wanted = {name.strip() for name in requested.split(',') if name.strip()}
+        if wanted & set(self.fields):
+            for name in set(self.fields) - wanted:
+                self.fields.pop(name)
+
+
+def validate_ingredient_name(value):
+    # Stored in canonical form, so "Tomatoes" and "fresh tomato" are one row
+    name = canonical_name(value)
+    if not name:
+        raise serializers.ValidationError("Enter an ingredient name.")
+    return name
+
+
+class IngredientSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    class Meta:
+        model = Ingredient
+        fields = ['id', 'user', 'name', 'quantity', 'expiration_date', 'created_at', 'updated_at']
+        read_only_fields = ['id', 'user', 'created_at', 'updated_at']
+
+    def validate_name(self, value):
+        value = validate_ingredient_name(value)
+        # (user, name) is unique; report it as a validation error rather than a 500
+        request = self.context.get('request')
+        if request is not None and request.user.is_authenticated:
+            existing = Ingredient.objects.filter(user=request.user, name=value)
+            if self.instance is not None:
+                existing = existing.exclude(pk=self.instance.pk)
+            if existing.exists():
+                raise serializers.ValidationError("This ingredient is already in your pantry.")
+        return value
+
+class IngredientChangeSerializer(serializers.ModelSerializer):
+    """
+    One entry of the changes feed. Deleted ingredients are sent as
+    tombstones carrying only their id.
+    """
+    deleted = serializers.SerializerMethodField()
+
     class Meta:
         model = Ingredient
-        fields = ['id', 'user', 'name', 'quantity', 'expiration_date', 'created_at']
-        read_only_fields = ['id', 'user', 'created_at']
\ No newline at end of file
+        fields = ['id', 'name', 'quantity', 'expiration_date', 'created_at', 'updated_at', 'deleted']
+
+    def get_deleted(self, obj):
+        return obj.deleted_at is not None
+
+    def to_representation(self, instance):
+        if instance.deleted_at is not None:
+            return {
+                'id': instance.pk,
+                'updated_at': self.fields['updated_at'].to_representation(instance.updated_at),
+                'deleted': True,
+            }
+        return super().to_representation(instance)
+
+
+class IngredientOperationSerializer(serializers.Serializer):
+    """
+    One entry of a bulk request: create (name, quantity, expiration_date),
+    update (id plus any of those fields) or delete (id).
+    """
+    op = serializers.ChoiceField(choices=['create', 'update', 'delete'])
+    id = serializers.IntegerField(required=False)
+    name = serializers.CharField(max_length=100, required=False)
+    quantity = serializers.FloatField(required=False)
+    expiration_date = serializers.DateField(required=False)
+
+    def validate_name(self, value):
+        return validate_ingredient_name(value)
+
+    def validate(self, attrs):
+        op = attrs['op']
+        if op == 'create':
+            missing = [f for f in ('name', 'quantity', 'expiration_date') if f not in attrs]
+            if missing:
+                raise serializers.ValidationError({f: "This field is required." for f in missing})
+            attrs.pop('id', None)
+        elif 'id' not in attrs:
+            raise serializers.ValidationError({'id': "This field is required."})
+        elif op == 'update' and not any(f in attrs for f in ('name', 'quantity', 'expiration_date')):
+            raise serializers.ValidationError("Nothing to update.")
+        return attrs
+
+
+class BulkIngredientSerializer(serializers.Serializer):
+    operations = IngredientOperationSerializer(many=True, allow_empty=False)
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Checked by the list itself, before any operation is validated
+        operations = self.fields['operations']
+        operations.max_length = settings.PANTRY_BULK['MAX_OPERATIONS']
+        operations.error_messages['max_length'] = "At most {max_length} operations per request."
+
+
+class ScanJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ScanJob
+        fields = ['id', 'status', 'stage', 'detected_ingredients', 'result', 'error', 'attempts', 'created_at', 'updated_at']
+        read_only_fields = fields
\ No newline at end of file
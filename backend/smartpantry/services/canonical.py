@@ -0,0 +1,192 @@
+"""
+Ingredient-name canonicalization, so that "Tomatoes", "tomato" and
+"fresh roma tomato" all become "tomato": one pantry row, one cache key.
+
+A name is lowercased and split into words; amounts and preparation and
+size qualifiers ("2", "fresh", "sliced", "large") are dropped, each word is made singular, and
+the result is looked up in the alias table, trying the whole phrase first
+and then ever shorter trailing phrases ("roma tomato" before "tomato").
+The word and alias tables are compiled into plain dicts and sets once, and
+results are memoized, so a repeated name costs one dict lookup.
+"""
+import re
+import threading
+
+from django.conf import settings
+
+# Defaults, overridable through settings.INGREDIENT_CANONICALIZER; the
+# settings entries are added to these
+DEFAULTS = {
+    'ALIASES': {},
+    'QUALIFIERS': [],
+    'MEMO_MAX_ENTRIES': 50000,
+}
+
+QUALIFIERS = {
+    'fresh', 'freshly', 'frozen', 'dried', 'canned', 'tinned', 'raw', 'cooked', 'ripe', 'organic',
+    'whole', 'sliced', 'chopped', 'diced', 'minced', 'grated', 'shredded', 'crushed', 'ground',
+    'peeled', 'boneless', 'skinless', 'large', 'small', 'medium', 'big', 'baby', 'some', 'few',
+    'of', 'a', 'an', 'the', 'piece', 'pieces', 'bunch', 'pack', 'packet', 'bag', 'box', 'jar', 'bottle',
+}
+
+ALIASES = {
+    'roma tomato': 'tomato',
+    'cherry tomato': 'tomato',
+    'plum tomato': 'tomato',
+    'scallion': 'green onion',
+    'spring onion': 'green onion',
+    'aubergine': 'eggplant',
+    'courgette': 'zucchini',
+    'coriander': 'cilantro',
+    'capsicum': 'pepper',
+    'bell pepper': 'pepper',
+    'sweet pepper': 'pepper',
+    'garbanzo': 'chickpea',
+    'garbanzo bean': 'chickpea',
+    'chicken breast': 'chicken',
+    'chicken thigh': 'chicken',
+    'hen egg': 'egg',
+    'chicken egg': 'egg',
+    'cheddar': 'cheese',
+    'cheddar cheese': 'cheese',
+    'yoghurt': 'yogurt',
+    'greek yogurt': 'yogurt',
+    'spaghetti': 'pasta',
+    'penne': 'pasta',
+    'macaroni': 'pasta',
+    'white rice': 'rice',
+    'brown rice': 'rice',
+    'basmati rice': 'rice',
+    'jasmine rice': 'rice',
+    'russet potato': 'potato',
+    'white onion': 'onion',
+    'yellow onion': 'onion',
+    'brown onion': 'onion',
+    'button mushroom': 'mushroom',
+    'champignon': 'mushroom',
+    'whole milk': 'milk',
+    'skim milk': 'milk',
+    'all purpose flour': 'flour',
+    'plain flour': 'flour',
+    'wheat flour': 'flour',
+    'unsalted butter': 'butter',
+    'salted butter': 'butter',
+    'garlic clove': 'garlic',
+    'kidney bean': 'bean',
+    'black bean': 'bean',
+    'baked bean': 'bean',
+}
+
+# Plurals the suffix rules get wrong, and words that only look plural
+IRREGULAR = {
+    'leaves': 'leaf',
+    'loaves': 'loaf',
+    'halves': 'half',
+    'cookies': 'cookie',
+    'brownies': 'brownie',
+    'smoothies': 'smoothie',
+    'pies': 'pie',
+    'cloves': 'clove',
+    'olives': 'olive',
+    'chives': 'chive',
+    'anchovies': 'anchovy',
+}
+# Words ending in -ss, -us or -is are never touched ("hummus", "swiss")
+INVARIANT = {'molasses', 'greens', 'brussels', 'series', 'species'}
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'INGREDIENT_CANONICALIZER', {}))
+    return config
+
+
+def singular(word):
+    if word in IRREGULAR:
+        return IRREGULAR[word]
+    if len(word) <= 3 or word in INVARIANT or word.endswith(('ss', 'us', 'is')):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith('oes'):
+        return word[:-2]
+    if word.endswith(('ches', 'shes', 'xes', 'zes', 'sses')):
+        return word[:-2]
+    if word.endswith('s'):
+        return word[:-1]
+    return word
+
+
+class Canonicalizer:
+    """
+    Maps free-form ingredient names to canonical ones. Thread safe.
+    """
+
+    def __init__(self, aliases=None, qualifiers=None, memo_max_entries=50000):
+        self.qualifiers = frozenset(QUALIFIERS) | frozenset(q.lower() for q in (qualifiers or ()))
+        self.memo_max_entries = memo_max_entries
+        self._memo = {}
+        self._lock = threading.Lock()
+        # Keys are stored in their singular, qualifier-free word form, so the
+        # lookup below can use the tokens it has already processed
+        self.aliases = {}
+        for alias, target in {**ALIASES, **(aliases or {})}.items():
+            key = ' '.join(self._words(alias))
+            if key:
+                self.aliases[key] = ' '.join(self._words(target)) or key
+
+    def _words(self, text):
+        return [
+            singular(word) for word in TOKEN_PATTERN.findall(str(text).lower())
+            if word not in self.qualifiers and not word.isdigit()
+        ]
+
+    def _compute(self, name):
+        words = self._words(name)
+        if not words:
+            return ''
+        for start in range(len(words)):
+            target = self.aliases.get(' '.join(words[start:]))
+            if target is not None:
+                return target
+        return ' '.join(words)
+
+    def __call__(self, name):
+        result = self._memo.get(name)
+        if result is None:
+            result = self._compute(name)
+            with self._lock:
+                if len(self._memo) >= self.memo_max_entries:
+                    self._memo.clear()
+                self._memo[name] = result
+        return result
+
+    def many(self, names):
+        """
+        Canonical names for `names`, without blanks or repeats, in first-seen order.
+        """
+        return list(dict.fromkeys(name for name in map(self, names) if name))
+
+
+_canonicalizer = None
+_canonicalizer_lock = threading.Lock()
+
+
+def get_canonicalizer():
+    global _canonicalizer
+    if _canonicalizer is None:
+        with _canonicalizer_lock:
+            if _canonicalizer is None:
+                config = get_config()
+                _canonicalizer = Canonicalizer(config['ALIASES'], config['QUALIFIERS'], config['MEMO_MAX_ENTRIES'])
+    return _canonicalizer
+
+
+def canonical_name(name):
+    return get_canonicalizer()(name)
+
+
+def canonical_names(names):
+    return get_canonicalizer().many(names)
@@ -0,0 +1,96 @@
+import re
+from datetime import timedelta
+from itertools import groupby
+
+from django.conf import settings
+from django.utils import timezone
+
+from ..models import ExpiryDigest, Ingredient
+
+WITHIN_PATTERN = re.compile(r'^\s*(\d+)\s*([dw]?)\s*$', re.IGNORECASE)
+
+
+def parse_within(value, default_days):
+    """
+    Parses "7d", "2w" or a bare number of days. Raises ValueError otherwise.
+    """
+    if value in (None, ''):
+        return default_days
+    match = WITHIN_PATTERN.match(str(value))
+    if not match:
+        raise ValueError(f"Invalid duration: {value!r}")
+    days = int(match.group(1)) * (7 if match.group(2).lower() == 'w' else 1)
+    if days > settings.EXPIRY['MAX_WITHIN_DAYS']:
+        raise ValueError(f"At most {settings.EXPIRY['MAX_WITHIN_DAYS']} days")
+    return days
+
+
+def default_expiration_date():
+    """
+    Expiry given to scanned items, which come without one.
+    """
+    return timezone.localdate() + timedelta(days=settings.EXPIRY['SCAN_DEFAULT_SHELF_LIFE_DAYS'])
+
+
+def expiring_for_user(user, within_days, include_expired=True):
+    """
+    The user's ingredients expiring within `within_days`, soonest first.
+    Served by the (user, expiration_date) index.
+    """
+    today = timezone.localdate()
+    items = Ingredient.objects.filter(user=user, expiration_date__lte=today + timedelta(days=within_days))
+    if not include_expired:
+        items = items.filter(expiration_date__gte=today)
+    return items.order_by('expiration_date', 'name')
+
+
+def build_digests(within_days, batch_size=500):
+    """
+    Rebuilds every user's digest in one pass: a single ordered scan of all
+    expiring ingredients, grouped by user in Python, written back with batched
+    upserts. Digests of users with nothing expiring are removed.
+    Returns the number of digests written.
+    """
+    today = timezone.localdate()
+    generated_at = timezone.now()
+    rows = (
+        Ingredient.objects.filter(expiration_date__lte=today + timedelta(days=within_days))
+        .order_by('user_id', 'expiration_date', 'name')
+        .values_list('user_id', 'id', 'name', 'quantity', 'expiration_date')
+        .iterator(chunk_size=2000)
+    )
+
+    written = 0
+    pending = []
+
+    def flush():
+        ExpiryDigest.objects.bulk_create(
+            pending,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['within_days', 'items', 'expired_count', 'expiring_count', 'generated_at'],
+        )
+        pending.clear()
+
+    for user_id, group in groupby(rows, key=lambda row: row[0]):
+        items = [
+            {'id': pk, 'name': name, 'quantity': quantity, 'expiration_date': expires.isoformat()}
+            for _, pk, name, quantity, expires in group
+        ]
+        expired = sum(1 for item in items if item['expiration_date'] < today.isoformat())
+        pending.append(ExpiryDigest(
+            user_id=user_id,
+            within_days=within_days,
+            items=items,
+            expired_count=expired,
+            expiring_count=len(items) - expired,
+            generated_at=generated_at,
+        ))
+        written += 1
+        if len(pending) >= batch_size:
+            flush()
+    if pending:
+        flush()
+
+    ExpiryDigest.objects.filter(generated_at__lt=generated_at).delete()
+    return written
@@ -1,42 +1,43 @@
 import os
-import json
-from google import genai
-from google.genai import types
-from PIL import Image
+import hashlib
+import logging
+import time
 
-# Initialize client
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
+from .governor import get_governor
+from .jsonio import dumps
+from .metrics import STAGE_SECONDS, UPSTREAM_ERRORS
+from .model_clients import get_client
+from .model_output import parse_recipes
+from .model_router import get_router
+from .providers import ModelProvider, get_provider
+from .recipe_cache import make_key
+
+logger = logging.getLogger(__name__)
 
 # Use one of the IDs confirmed by your check_models script
-MODEL_NAME = "gemma-3-12b-it" 
+MODEL_NAME = "gemma-3-12b-it"
 
-def identify_ingredients(image_path):
-    """
-    Opens a local image file and identifies ingredients.
-    """
-    try:
-        image = Image.open(image_path)
-        
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=[
-                "Identify all food ingredients in this image. Return ONLY a comma-separated list of items (e.g. 'tomato, onion, egg'). No other text.",
-                image
-            ]
-        )
-        return response.text.strip()
-    except Exception as e:
-        print(f"!!! GEMINI ERROR !!!: {e}")
-        raise e
+IDENTIFY_PROMPT = "Identify all food ingredients in this image. Return ONLY a comma-separated list of items (e.g. 'tomato, onion, egg'). No other text."
 
-def suggest_recipes_from_ingredients(ingredients_list, model_name="gemini-3-flash-preview"):
+
+# google-genai is imported on the first model call, not with this module
+# (see services/model_clients.py)
+
+def _identify_contents(image_bytes, mime_type):
+    from google.genai import types
+
+    return [IDENTIFY_PROMPT, types.Part.from_bytes(data=image_bytes, mime_type=mime_type)]
+
+
+def _recipe_prompt(ingredients_list):
     ingredients_string = ', '.join(ingredients_list)
-    
-    prompt = f"""
+
+    return f"""
 You are an expert chef. I have these ingredients: {ingredients_string}.
 Suggest up to 3 recipes.
 IMPORTANT: Return the response ONLY as a valid JSON array of objects.
-Each object must have: "title" and "instructions".
+Each object must have: "title", "ingredients" and "instructions".
+"ingredients" is a list of the ingredient names the recipe needs, spelled as in my list where possible.
 
 Format for "instructions":
 Ingredients:
@@ -45,146 +46,188 @@ Step-by-Step:
 1. [Action]
 """
 
-    try:
-        # 1. Prepare the config
-        # We ONLY use response_mime_type if it's NOT a Gemma model
-        config = None
-        if "gemma" not in model_name.lower():
-            config = types.GenerateContentConfig(response_mime_type="application/json")
-
-        # 2. Call the API
-        response = client.models.generate_content(
+
+def _recipe_config(model_name):
+    # We ONLY use response_mime_type if it's NOT a Gemma model
+    if "gemma" not in model_name.lower():
+        from google.genai import types
+
+        return types.GenerateContentConfig(response_mime_type="application/json")
+    return None
+
+
+def _clean_response_text(text):
+    # Gemma often adds ```json ... ``` blocks or a sentence around the array;
+    # keep only the recipes that validate, as compact JSON
+    return dumps(parse_recipes(text, source='model'))
+
+
+class GeminiProvider(ModelProvider):
+    """
+    Calls the Google Gemini / Gemma models through google-genai, using the
+    process-wide client for its API key.
+    """
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key or os.getenv("GOOGLE_API_KEY")
+
+    @property
+    def client(self):
+        return get_client(self.api_key)
+
+    def identify(self, image_bytes, mime_type, model_name):
+        response = self.client.models.generate_content(
             model=model_name,
-            contents=prompt,
-            config=config # This will be None for Gemma
+            contents=_identify_contents(image_bytes, mime_type)
         )
-        
-        # 3. Clean the text (Gemma often adds ```json ... ``` blocks)
-        clean_text = response.text.strip()
-        if clean_text.startswith("```"):
-            # This removes ```json at the start and ``` at the end
-            clean_text = clean_text.replace("```json", "").replace("```", "").strip()
-            
-        return clean_text
+        return response.text
 
-    except Exception as e:
-        print(f"!!! {model_name} ERROR !!!: {e}")
-        return "[]"
-    # If the user didn't pick one, we default to the new Gemini 3 Flash
-    prompt = f""" ... (keep your existing prompt here) ... """
-    
-    try:
-        response = client.models.generate_content(
-            model=model_name, # Use the dynamic model name!
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
+    def suggest_recipes(self, ingredients_list, model_name):
+        response = self.client.models.generate_content(
+            model=model_name,
+            contents=_recipe_prompt(ingredients_list),
+            config=_recipe_config(model_name) # This will be None for Gemma
         )
-        return response.text.strip()
+        return response.text
+
+    def stream_recipes(self, ingredients_list, model_name):
+        for chunk in self.client.models.generate_content_stream(
+            model=model_name,
+            contents=_recipe_prompt(ingredients_list),
+            config=_recipe_config(model_name)
+        ):
+            if chunk.text:
+                yield chunk.text
+
+    # The aio interface holds no worker thread while waiting on the model, and
+    # the pending call is cancelled together with the view task on disconnect
+    async def aidentify(self, image_bytes, mime_type, model_name):
+        response = await self.client.aio.models.generate_content(
+            model=model_name,
+            contents=_identify_contents(image_bytes, mime_type)
+        )
+        return response.text
+
+    async def asuggest_recipes(self, ingredients_list, model_name):
+        response = await self.client.aio.models.generate_content(
+            model=model_name,
+            contents=_recipe_prompt(ingredients_list),
+            config=_recipe_config(model_name)
+        )
+        return response.text
+
+
+# Every model call goes through the governor (services/governor.py). Calls with the
+# same key while one is in flight share its result instead of calling upstream again.
+# Each upstream attempt is timed for the metrics (services/metrics.py), and recipe
+# calls also for the model router (services/model_router.py), which only picks
+# models for recipes: identify latency would skew its view of the recipe models.
+ROUTED_OPERATIONS = frozenset({'recipes', 'stream'})
+
+
+def _record(operation, model_name, elapsed, ok):
+    if operation in ROUTED_OPERATIONS:
+        get_router().record(model_name, elapsed, ok)
+    STAGE_SECONDS.labels(f'model_{operation}', model_name).observe(elapsed)
+    if not ok:
+        UPSTREAM_ERRORS.labels(operation, model_name).inc()
+
+
+def _observed(operation, model_name, call):
+    start = time.monotonic()
+    try:
+        result = call()
+    except Exception:
+        _record(operation, model_name, time.monotonic() - start, ok=False)
+        raise
+    _record(operation, model_name, time.monotonic() - start, ok=True)
+    return result
+
+
+async def _aobserved(operation, model_name, call):
+    start = time.monotonic()
+    try:
+        result = await call()
+    except Exception:
+        _record(operation, model_name, time.monotonic() - start, ok=False)
+        raise
+    _record(operation, model_name, time.monotonic() - start, ok=True)
+    return result
+
+
+def _identify_key(image_bytes):
+    return ('identify', MODEL_NAME, hashlib.sha256(image_bytes).hexdigest())
+
+
+def _recipes_key(ingredients_list, model_name):
+    return ('recipes', make_key(ingredients_list, model_name))
+
+
+def identify_ingredients(image_bytes, mime_type="image/jpeg"):
+    """
+    Identifies ingredients in an encoded image (see services/image_ingest.py).
+    """
+    try:
+        return get_governor().call(
+            _identify_key(image_bytes),
+            lambda: _observed('identify', MODEL_NAME, lambda: get_provider().identify(image_bytes, mime_type, MODEL_NAME))
+        ).strip()
     except Exception as e:
-        print(f"!!! {model_name} ERROR !!!: {e}")
-        return "[]"
-    # Use the 2.0 Flash model for instant responses
-    MODEL_NAME = "gemini-2.0-flash" 
-    
-    ingredients_string = ', '.join(ingredients_list)
-    
-    prompt = f"""
-You are a fast-paced short-order chef. Use these ingredients: {ingredients_string}.
-Suggest 3 quick recipes. Return ONLY a JSON array.
+        logger.warning("Identifying ingredients with %s failed: %s", MODEL_NAME, e)
+        raise e
 
-Format for "instructions":
-Ingredients:
-- [Item]
-Step-by-Step:
-1. [Action]
 
-Keys: "title", "instructions". 
-Keep steps short and direct. No preamble.
-"""
-    
+def suggest_recipes_from_ingredients(ingredients_list, model_name="gemini-3-flash-preview"):
     try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json",
-                temperature=0.7 # Lower temperature = faster, more focused answers
-            )
-        )
-        return response.text.strip()
+        return _clean_response_text(get_governor().call(
+            _recipes_key(ingredients_list, model_name),
+            lambda: _observed('recipes', model_name, lambda: get_provider().suggest_recipes(ingredients_list, model_name))
+        ))
+
     except Exception as e:
-        print(f"!!! SPEED ERROR !!!: {e}")
+        logger.warning("Recipe suggestion from %s failed: %s", model_name, e)
         return "[]"
-    ingredients_string = ', '.join(ingredients_list)
-    
-    prompt = f"""
-You are an expert chef. I have the following ingredients: {ingredients_string}.
-Please suggest up to 3 recipes I can make using some or all of these items. 
-You can assume I have basic staples like salt, pepper, oil, and water.
 
-IMPORTANT: You must return the response ONLY as a valid JSON array of objects. Do not include markdown formatting like ```json.
-Each object must have exactly two keys: "title" and "instructions".
 
-The "instructions" string MUST strictly follow this exact format:
+# --- ASYNC VARIANTS ---
+# Used by the ASGI views in async_views.py.
 
-Ingredients:
-- [Ingredient 1]
-- [Ingredient 2]
+async def identify_ingredients_async(image_bytes, mime_type="image/jpeg"):
+    try:
+        return (await get_governor().acall(
+            _identify_key(image_bytes),
+            lambda: _aobserved('identify', MODEL_NAME, lambda: get_provider().aidentify(image_bytes, mime_type, MODEL_NAME))
+        )).strip()
+    except Exception as e:
+        logger.warning("Identifying ingredients with %s failed: %s", MODEL_NAME, e)
+        raise e
 
-Step-by-Step:
-1. [Step 1]
-2. [Step 2]
-"""
-    
+
+async def suggest_recipes_from_ingredients_async(ingredients_list, model_name="gemini-3-flash-preview"):
     try:
-        # NOTICE: We removed the config=types.GenerateContentConfig(...) part below!
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt
-        )
-        
-        clean_text = response.text.strip()
-        if clean_text.startswith("```"):
-            clean_text = clean_text.replace("```json", "").replace("```", "").strip()
-            
-        return clean_text
+        return _clean_response_text(await get_governor().acall(
+            _recipes_key(ingredients_list, model_name),
+            lambda: _aobserved('recipes', model_name, lambda: get_provider().asuggest_recipes(ingredients_list, model_name))
+        ))
     except Exception as e:
-        print(f"!!! RECIPE ERROR !!!: {e}")
+        logger.warning("Recipe suggestion from %s failed: %s", model_name, e)
         return "[]"
+
+
+# --- STREAMING ---
+
+def stream_recipes_from_ingredients(ingredients_list, model_name="gemini-3-flash-preview"):
     """
-    Suggests 3 recipes based on ingredients and ensures clean JSON output.
-    """
-    prompt = f"""
-    I have these ingredients: {', '.join(ingredients_list)}.
-    Suggest 3 recipes I can make. 
-    Return ONLY raw JSON. Do not include Markdown formatting or backticks.
-    Structure:
-    [
-        {{
-            "title": "Recipe Name",
-            "ingredients_needed": ["item1", "item2"],
-            "instructions": "Step 1..."
-        }}
-    ]
+    Yields the raw response text chunk by chunk as the model generates it.
+    Feed the chunks to services.recipe_stream.RecipeArrayParser to get recipes
+    as soon as each one is complete. Errors propagate to the caller.
+    Streams are admitted by the governor but not coalesced or retried.
     """
-    
-    try:
-        response = client.models.generate_content(
-            model=MODEL_NAME,
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
-        )
-        
-        # Clean up the response text in case the model adds markdown backticks
-        clean_text = response.text.strip()
-        if clean_text.startswith("```"):
-            clean_text = clean_text.replace("```json", "").replace("```", "").strip()
-            
-        return clean_text
-    except Exception as e:
-        print(f"!!! RECIPE ERROR !!!: {e}")
-        return "[]"
\ No newline at end of file
+    with get_governor().admit():
+        start = time.monotonic()
+        try:
+            yield from get_provider().stream_recipes(ingredients_list, model_name)
+        except Exception:
+            _record('stream', model_name, time.monotonic() - start, ok=False)
+            raise
+        _record('stream', model_name, time.monotonic() - start, ok=True)
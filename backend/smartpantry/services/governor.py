@@ -0,0 +1,467 @@
+"""
+Governs every upstream model call made by google_gemini_service.
+
+- Single-flight: concurrent identical calls (same key) share one upstream call.
+- A concurrency cap on calls in flight, with queue-depth and wait-time stats.
+- A token bucket keeping the call rate under the provider's limits.
+- A circuit breaker that fails fast after repeated errors, and jittered
+  exponential retries (tenacity) for transient ones.
+
+The sync path (threads) and the async path (event loops) share the rate
+limiter, the breaker and the stats. The concurrency cap is one semaphore for
+the process's threads plus one per event loop, since asyncio cannot wait on a
+thread semaphore.
+"""
+import asyncio
+import threading
+import time
+import weakref
+
+from django.conf import settings
+from tenacity import (
+    AsyncRetrying,
+    Retrying,
+    retry_if_exception,
+    stop_after_attempt,
+    wait_random_exponential,
+)
+
+# Defaults, overridable through settings.MODEL_GOVERNOR
+DEFAULTS = {
+    'MAX_CONCURRENCY': 8,            # upstream calls in flight per process (per event loop for async)
+    'ACQUIRE_TIMEOUT': 30,           # seconds a call may queue for a slot
+    'RATE_PER_SECOND': 5.0,          # sustained upstream call rate; 0 disables the limiter
+    'BURST': 10,
+    'RETRY_ATTEMPTS': 3,
+    'RETRY_MAX_WAIT': 4,             # cap on the jittered backoff, seconds
+    'BREAKER_FAILURE_THRESHOLD': 5,  # consecutive failures that open the circuit
+    'BREAKER_RESET_SECONDS': 30,     # how long it stays open before a trial call
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MODEL_GOVERNOR', {}))
+    return config
+
+
+class CircuitOpenError(Exception):
+    """
+    Raised without calling upstream while the circuit breaker is open.
+    """
+
+
+class GovernorTimeout(Exception):
+    """
+    Raised when a call waited longer than ACQUIRE_TIMEOUT for a slot.
+    """
+
+
+class CallInterrupted(Exception):
+    """
+    Raised to callers sharing a call whose leader was interrupted (by a
+    BaseException such as SystemExit) before it produced an answer.
+    """
+
+
+def is_retryable(exc):
+    # tenacity sees BaseExceptions too: a cancelled call (client gone) or an
+    # interrupted worker must end the call, not start another upstream attempt
+    if not isinstance(exc, Exception):
+        return False
+    if isinstance(exc, (CircuitOpenError, GovernorTimeout, CallInterrupted)):
+        return False
+    # google-genai errors carry the HTTP status; other 4xx errors will not get better on retry
+    code = getattr(exc, 'code', None)
+    if isinstance(code, int) and 400 <= code < 500 and code != 429:
+        return False
+    return True
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self):
+        """
+        Takes a token and returns how long the caller must wait before using it.
+        Tokens can go negative, which queues callers in arrival order.
+        """
+        if not self.rate:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class CircuitBreaker:
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, failure_threshold, reset_seconds):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def rejecting(self):
+        """
+        Cheap check used before queueing: True while open and not yet due a trial.
+        """
+        with self._lock:
+            return self.state == self.OPEN and time.monotonic() - self._opened_at < self.reset_seconds
+
+    def before_call(self):
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    raise CircuitOpenError("Model calls are temporarily suspended after repeated failures.")
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN:
+                # Let exactly one trial call through to probe the upstream
+                if self._trial_in_flight:
+                    raise CircuitOpenError("Model calls are temporarily suspended after repeated failures.")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._trial_in_flight = False
+
+    def abandon(self):
+        # The call ended without an answer either way (cancelled, timed out)
+        with self._lock:
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class _AsyncFlight:
+
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+
+
+class ModelCallGovernor:
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self.bucket = TokenBucket(self.config['RATE_PER_SECOND'], self.config['BURST'])
+        self.breaker = CircuitBreaker(
+            self.config['BREAKER_FAILURE_THRESHOLD'], self.config['BREAKER_RESET_SECONDS']
+        )
+        self._semaphore = threading.BoundedSemaphore(self.config['MAX_CONCURRENCY'])
+        self._async_semaphores = weakref.WeakKeyDictionary()
+        self._flights = {}
+        self._async_flights = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._stats = {
+            'calls': 0, 'upstream_calls': 0, 'coalesced': 0, 'errors': 0, 'retries': 0,
+            'rejected_open_circuit': 0, 'timeouts': 0,
+            'admitted': 0, 'in_flight': 0, 'queue_depth': 0, 'max_queue_depth': 0,
+            'wait_seconds_total': 0.0, 'wait_seconds_max': 0.0,
+        }
+
+    # --- stats ---
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._stats[name] += amount
+
+    def _enter_queue(self):
+        with self._lock:
+            self._stats['queue_depth'] += 1
+            self._stats['max_queue_depth'] = max(self._stats['max_queue_depth'], self._stats['queue_depth'])
+
+    def _leave_queue(self, waited, admitted):
+        with self._lock:
+            self._stats['queue_depth'] -= 1
+            self._stats['wait_seconds_total'] += waited
+            self._stats['wait_seconds_max'] = max(self._stats['wait_seconds_max'], waited)
+            if admitted:
+                self._stats['admitted'] += 1
+                self._stats['in_flight'] += 1
+            else:
+                self._stats['timeouts'] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats['breaker_state'] = self.breaker.state
+        waited = stats['admitted'] + stats['timeouts']
+        stats['wait_seconds_avg'] = stats['wait_seconds_total'] / waited if waited else 0.0
+        return stats
+
+    def _retrying_kwargs(self):
+        return dict(
+            stop=stop_after_attempt(self.config['RETRY_ATTEMPTS']),
+            wait=wait_random_exponential(multiplier=0.5, max=self.config['RETRY_MAX_WAIT']),
+            retry=retry_if_exception(is_retryable),
+            before_sleep=lambda state: self._count('retries'),
+            reraise=True,
+        )
+
+    def _precheck(self):
+        # Fail fast instead of queueing for a slot while the circuit is open
+        if self.breaker.rejecting():
+            self._count('rejected_open_circuit')
+            raise CircuitOpenError("Model calls are temporarily suspended after repeated failures.")
+
+    def _guard(self):
+        try:
+            self.breaker.before_call()
+        except CircuitOpenError:
+            self._count('rejected_open_circuit')
+            raise
+
+    # --- sync path ---
+
+    def call(self, key, fn):
+        """
+        Runs fn() under the governor. Callers passing the same key while a call
+        is in flight wait for it and get its result (or exception).
+        """
+        self._count('calls')
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+            else:
+                self._stats['coalesced'] += 1
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._execute(fn)
+            return flight.result
+        except Exception as e:
+            flight.error = e
+            raise
+        except BaseException:
+            flight.error = CallInterrupted("The shared model call was interrupted.")
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def _execute(self, fn):
+        self._precheck()
+        self._enter_queue()
+        started = time.monotonic()
+        admitted = self._semaphore.acquire(timeout=self.config['ACQUIRE_TIMEOUT'])
+        self._leave_queue(time.monotonic() - started, admitted)
+        if not admitted:
+            raise GovernorTimeout("Timed out waiting for a model call slot.")
+
+        try:
+            for attempt in Retrying(**self._retrying_kwargs()):
+                with attempt:
+                    time.sleep(self.bucket.reserve())
+                    result = self._attempt(fn)
+            return result
+        except Exception as e:
+            self._call_failed(e)
+            raise
+        finally:
+            self._semaphore.release()
+            self._count('in_flight', -1)
+
+    def _attempt(self, fn):
+        self._guard()
+        self._count('upstream_calls')
+        try:
+            result = fn()
+        except BaseException as e:
+            if isinstance(e, Exception):
+                self._count('errors')
+            # The breaker counts failed calls, not attempts (see _call_failed)
+            self.breaker.abandon()
+            raise
+        self.breaker.record_success()
+        return result
+
+    def _call_failed(self, exc):
+        # Once per call, after the retries: a call failing every attempt is
+        # one failure towards BREAKER_FAILURE_THRESHOLD
+        if not isinstance(exc, (CircuitOpenError, GovernorTimeout)):
+            self.breaker.record_failure()
+
+    def admit(self):
+        """
+        Context manager for calls that cannot be coalesced or retried, such as
+        streams: applies the breaker, the concurrency cap and the rate limit.
+        """
+        return _Admission(self)
+
+    # --- async path ---
+
+    def _loop_semaphore(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            semaphore = self._async_semaphores.get(loop)
+            if semaphore is None:
+                semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.config['MAX_CONCURRENCY'])
+            return semaphore
+
+    async def acall(self, key, coro_fn):
+        """
+        Async call(); coro_fn is a coroutine function. Coalescing happens
+        within one event loop: the upstream call runs as its own task, which
+        every caller (the first one included) awaits under a shield, so one
+        caller's cancellation never reaches the others. The task is
+        cancelled only when its last caller is.
+        """
+        self._count('calls')
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            flights = self._async_flights.setdefault(loop, {})
+            flight = flights.get(key)
+            if flight is None:
+                flight = flights[key] = _AsyncFlight(loop.create_task(self._aexecute(coro_fn)))
+                flight.task.add_done_callback(lambda task: self._land(flights, key, flight))
+            else:
+                self._stats['coalesced'] += 1
+            flight.waiters += 1
+
+        try:
+            return await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            with self._lock:
+                abandoned = flight.waiters == 1
+            if abandoned and not flight.task.done():
+                # Nobody is left waiting, e.g. the client disconnected
+                flight.task.cancel()
+            raise
+        finally:
+            with self._lock:
+                flight.waiters -= 1
+
+    def _land(self, flights, key, flight):
+        with self._lock:
+            if flights.get(key) is flight:
+                del flights[key]
+        if not flight.task.cancelled():
+            # Mark it retrieved so a result nobody awaited does not log a warning
+            flight.task.exception()
+
+    async def _aexecute(self, coro_fn):
+        self._precheck()
+        semaphore = self._loop_semaphore()
+        self._enter_queue()
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.config['ACQUIRE_TIMEOUT'])
+        except asyncio.TimeoutError:
+            self._leave_queue(time.monotonic() - started, False)
+            raise GovernorTimeout("Timed out waiting for a model call slot.")
+        self._leave_queue(time.monotonic() - started, True)
+
+        try:
+            async for attempt in AsyncRetrying(**self._retrying_kwargs()):
+                with attempt:
+                    await asyncio.sleep(self.bucket.reserve())
+                    self._guard()
+                    self._count('upstream_calls')
+                    try:
+                        result = await coro_fn()
+                    except BaseException as e:
+                        # Cancelled (the last caller went away) or failed;
+                        # the breaker counts failed calls, not attempts
+                        if isinstance(e, Exception):
+                            self._count('errors')
+                        self.breaker.abandon()
+                        raise
+                    self.breaker.record_success()
+            return result
+        except Exception as e:
+            self._call_failed(e)
+            raise
+        finally:
+            semaphore.release()
+            self._count('in_flight', -1)
+
+
+class _Admission:
+
+    def __init__(self, governor):
+        self.governor = governor
+
+    def __enter__(self):
+        governor = self.governor
+        governor._count('calls')
+        governor._precheck()
+        governor._enter_queue()
+        started = time.monotonic()
+        admitted = governor._semaphore.acquire(timeout=governor.config['ACQUIRE_TIMEOUT'])
+        governor._leave_queue(time.monotonic() - started, admitted)
+        if not admitted:
+            raise GovernorTimeout("Timed out waiting for a model call slot.")
+        try:
+            time.sleep(governor.bucket.reserve())
+            governor._guard()
+        except BaseException:
+            governor._semaphore.release()
+            governor._count('in_flight', -1)
+            raise
+        governor._count('upstream_calls')
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        governor = self.governor
+        governor._semaphore.release()
+        governor._count('in_flight', -1)
+        if exc_type is None:
+            governor.breaker.record_success()
+        elif issubclass(exc_type, Exception):
+            governor._count('errors')
+            governor.breaker.record_failure()
+        else:
+            # GeneratorExit when the client stops reading a stream
+            governor.breaker.abandon()
+        return False
+
+
+_governor = None
+_governor_lock = threading.Lock()
+
+
+def get_governor():
+    global _governor
+    with _governor_lock:
+        if _governor is None:
+            _governor = ModelCallGovernor()
+        return _governor
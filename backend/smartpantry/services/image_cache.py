@@ -0,0 +1,281 @@
+import hashlib
+import io
+import logging
+import threading
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import DatabaseError
+from django.db.models import F, Q
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+from ..models import ScanResultCache
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through settings.IMAGE_CACHE
+DEFAULTS = {
+    'ENABLED': True,
+    'MAX_DISTANCE': 3,        # max Hamming distance between dHashes to count as the same photo (at most 3)
+    'MIN_DETAIL': 1.0,        # mean brightness step between hash pixels below which a photo is not cached
+    'TTL': 60 * 60 * 24 * 7,  # seconds before a cached detection expires
+    'MAX_ENTRIES': 5000,      # rows kept; least recently used rows are evicted beyond this
+    'EVICT_EVERY': 100,       # new rows stored between eviction passes
+}
+
+HASH_BITS = 64
+BAND_BITS = 16
+BAND_MASK = (1 << BAND_BITS) - 1
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'IMAGE_CACHE', {}))
+    # Four bands only guarantee a shared band (pigeonhole) up to distance 3
+    if not 0 <= config['MAX_DISTANCE'] < HASH_BITS // BAND_BITS:
+        raise ImproperlyConfigured(
+            f"IMAGE_CACHE['MAX_DISTANCE'] must be between 0 and {HASH_BITS // BAND_BITS - 1}, "
+            f"got {config['MAX_DISTANCE']}."
+        )
+    return config
+
+
+def content_digest(image_bytes):
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def dhash(image, hash_size=8):
+    """
+    Difference hash: shrink to (hash_size + 1) x hash_size greyscale and record
+    whether each pixel is brighter than its right neighbour. Robust to resizing,
+    re-encoding and small exposure changes.
+    """
+    return dhash_with_detail(image, hash_size)[0]
+
+
+def dhash_with_detail(image, hash_size=8):
+    """
+    dhash() and the mean brightness step (0-255) between the neighbours it
+    compares. Flat and solid-colour photos have a detail near 0 and a hash
+    near 0 whatever they show, so their hashes can't be compared.
+    """
+    image = ImageOps.exif_transpose(image)
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = small.tobytes()
+    value = 0
+    steps = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            left, right = pixels[offset + col], pixels[offset + col + 1]
+            value = (value << 1) | (left > right)
+            steps += abs(left - right)
+    return value, steps / (hash_size * hash_size)
+
+
+def hamming(a, b):
+    return (a ^ b).bit_count()
+
+
+def split_bands(value):
+    return [(value >> (i * BAND_BITS)) & BAND_MASK for i in range(HASH_BITS // BAND_BITS)]
+
+
+def _to_signed(value):
+    # BigIntegerField is a signed 64-bit column
+    return value - (1 << HASH_BITS) if value >= 1 << (HASH_BITS - 1) else value
+
+
+def _to_unsigned(value):
+    return value + (1 << HASH_BITS) if value < 0 else value
+
+
+class ImageDedupeCache:
+    """
+    Content-addressed cache of identify_ingredients results: exact SHA-256
+    match first, then perceptual-hash match within MAX_DISTANCE. Photos with
+    less detail than MIN_DETAIL are never cached: all of them would match
+    each other.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self._stats_lock = threading.Lock()
+        self._unevicted = 0  # rows created since the last eviction pass
+        self._stats = {
+            'exact_hits': 0, 'similar_hits': 0, 'misses': 0, 'bypassed': 0, 'low_detail': 0, 'evicted': 0,
+        }
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def fingerprint(self, image_bytes, image=None):
+        """
+        Returns (digest, phash), or None for a photo too flat to cache.
+        """
+        if image is None:
+            with Image.open(io.BytesIO(image_bytes)) as image:
+                phash, detail = dhash_with_detail(image)
+        else:
+            phash, detail = dhash_with_detail(image)
+        if detail < self.config['MIN_DETAIL']:
+            self._count('low_detail')
+            return None
+        return content_digest(image_bytes), phash
+
+    def _fresh(self):
+        cutoff = timezone.now() - timedelta(seconds=self.config['TTL'])
+        return ScanResultCache.objects.filter(last_used_at__gte=cutoff)
+
+    def lookup(self, digest, phash):
+        try:
+            return self._lookup(digest, phash)
+        except DatabaseError as e:
+            # The cache is an optimization; a busy database means a miss, not a failed scan
+            logger.warning("Image cache lookup failed: %s", e)
+            self._count('misses')
+            return None
+
+    def _lookup(self, digest, phash):
+        fresh = self._fresh()
+
+        entry = fresh.filter(digest=digest).first()
+        if entry is not None:
+            self._touch(entry)
+            self._count('exact_hits')
+            return entry.result
+
+        bands = split_bands(phash)
+        band_match = Q()
+        for i, band in enumerate(bands):
+            band_match |= Q(**{f'band{i}': band})
+
+        best = None
+        best_distance = self.config['MAX_DISTANCE'] + 1
+        for entry in fresh.filter(band_match).only('id', 'phash', 'result'):
+            distance = hamming(phash, _to_unsigned(entry.phash))
+            if distance < best_distance:
+                best, best_distance = entry, distance
+
+        if best is not None:
+            self._touch(best)
+            self._count('similar_hits')
+            return best.result
+
+        self._count('misses')
+        return None
+
+    def _touch(self, entry):
+        ScanResultCache.objects.filter(pk=entry.pk).update(
+            hits=F('hits') + 1, last_used_at=timezone.now()
+        )
+
+    def store(self, digest, phash, result):
+        try:
+            self._store(digest, phash, result)
+        except DatabaseError as e:
+            logger.warning("Image cache store failed: %s", e)
+
+    def _store(self, digest, phash, result):
+        bands = split_bands(phash)
+        _, created = ScanResultCache.objects.update_or_create(
+            digest=digest,
+            defaults={
+                'phash': _to_signed(phash),
+                'band0': bands[0],
+                'band1': bands[1],
+                'band2': bands[2],
+                'band3': bands[3],
+                'result': result,
+            },
+        )
+        # Evicting scans and sorts the whole table, so it runs once every
+        # EVICT_EVERY new rows; the table overshoots MAX_ENTRIES by at most that
+        if created and self._eviction_due():
+            self.evict()
+
+    def _eviction_due(self):
+        with self._stats_lock:
+            self._unevicted += 1
+            if self._unevicted < self.config['EVICT_EVERY']:
+                return False
+            self._unevicted = 0
+            return True
+
+    def evict(self):
+        """
+        Drops expired rows, then the least recently used rows beyond MAX_ENTRIES.
+        """
+        cutoff = timezone.now() - timedelta(seconds=self.config['TTL'])
+        expired, _ = ScanResultCache.objects.filter(last_used_at__lt=cutoff).delete()
+
+        overflow = 0
+        stale_ids = list(
+            ScanResultCache.objects.order_by('-last_used_at')
+            .values_list('id', flat=True)[self.config['MAX_ENTRIES']:]
+        )
+        if stale_ids:
+            overflow, _ = ScanResultCache.objects.filter(id__in=stale_ids).delete()
+
+        if expired or overflow:
+            self._count('evicted', expired + overflow)
+
+    def get_or_identify(self, image_bytes, identify, bypass=False, image=None):
+        """
+        Returns the cached detection for this image (or a near-identical one),
+        calling identify() and storing its result on a miss. Pass the already
+        decoded `image` to avoid decoding the bytes a second time.
+        """
+        fingerprint = self.fingerprint(image_bytes, image) if self.config['ENABLED'] else None
+        if fingerprint is None:
+            return identify()
+
+        digest, phash = fingerprint
+        if bypass:
+            self._count('bypassed')
+        else:
+            cached = self.lookup(digest, phash)
+            if cached is not None:
+                return cached
+
+        result = identify()
+        if result and result.strip():
+            self.store(digest, phash, result)
+        return result
+
+    async def aget_or_identify(self, image_bytes, identify, bypass=False, image=None):
+        """
+        Async get_or_identify; identify is a coroutine function. Lookups and
+        stores go through the ORM in Django's sync thread.
+        """
+        fingerprint = self.fingerprint(image_bytes, image) if self.config['ENABLED'] else None
+        if fingerprint is None:
+            return await identify()
+
+        digest, phash = fingerprint
+        if bypass:
+            self._count('bypassed')
+        else:
+            cached = await sync_to_async(self.lookup)(digest, phash)
+            if cached is not None:
+                return cached
+
+        result = await identify()
+        if result and result.strip():
+            await sync_to_async(self.store)(digest, phash, result)
+        return result
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['exact_hits'] + stats['similar_hits'] + stats['misses']
+        hits = stats['exact_hits'] + stats['similar_hits']
+        stats['hit_rate'] = hits / lookups if lookups else 0.0
+        return stats
+
+
+image_cache = ImageDedupeCache()
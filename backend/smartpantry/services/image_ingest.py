@@ -0,0 +1,86 @@
+import io
+from collections import namedtuple
+
+from django.conf import settings
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .metrics import timed
+
+# Defaults, overridable through settings.IMAGE_INGEST
+DEFAULTS = {
+    'MAX_UPLOAD_BYTES': 10 * 1024 * 1024,  # rejected before decoding
+    'MAX_PIXELS': 40_000_000,              # rejected from the header, before decoding
+    'MAX_EDGE': 1024,                      # longest side sent upstream
+    'FORMAT': 'JPEG',                      # JPEG or WEBP
+    'QUALITY': 85,
+    'MIN_QUALITY': 50,
+    'MAX_BYTES': 300 * 1024,               # target size of the re-encoded image
+}
+
+MIME_TYPES = {'JPEG': 'image/jpeg', 'WEBP': 'image/webp'}
+
+PreparedImage = namedtuple('PreparedImage', ['data', 'mime_type', 'image', 'original_size'])
+
+
+class ImageIngestError(Exception):
+    """
+    Raised for uploads that are rejected before reaching the model.
+    """
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'IMAGE_INGEST', {}))
+    return config
+
+
+def _encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    image.save(buffer, format=image_format, quality=quality, optimize=True)
+    return buffer.getvalue()
+
+
+@timed('ingest')
+def prepare_image(raw, config=None):
+    """
+    Decodes an upload straight from memory, applies EXIF orientation, downscales
+    it to MAX_EDGE and re-encodes it, lowering quality until it fits MAX_BYTES.
+    `raw` is the uploaded bytes or a file-like object.
+    """
+    config = config or get_config()
+
+    if hasattr(raw, 'size') and raw.size is not None and raw.size > config['MAX_UPLOAD_BYTES']:
+        raise ImageIngestError("Image is too large.", status_code=413)
+    data = raw if isinstance(raw, bytes) else raw.read()
+    if len(data) > config['MAX_UPLOAD_BYTES']:
+        raise ImageIngestError("Image is too large.", status_code=413)
+
+    try:
+        image = Image.open(io.BytesIO(data))
+        original_size = image.size
+        # Only the header has been parsed at this point, so this check is cheap
+        if original_size[0] * original_size[1] > config['MAX_PIXELS']:
+            raise ImageIngestError("Image dimensions are too large.", status_code=413)
+
+        # JPEG can decode at a reduced scale directly, which skips most of the work
+        max_edge = config['MAX_EDGE']
+        image.draft('RGB', (max_edge, max_edge))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise ImageIngestError("Could not read image.") from e
+
+    image_format = config['FORMAT'].upper()
+    quality = config['QUALITY']
+    encoded = _encode(image, image_format, quality)
+    while len(encoded) > config['MAX_BYTES'] and quality > config['MIN_QUALITY']:
+        quality = max(config['MIN_QUALITY'], quality - 10)
+        encoded = _encode(image, image_format, quality)
+
+    return PreparedImage(encoded, MIME_TYPES[image_format], image, original_size)
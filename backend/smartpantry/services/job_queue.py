@@ -0,0 +1,238 @@
+"""
+A small background job queue for scans, backed by the ScanJob table so it
+needs no broker. Jobs are claimed with a conditional UPDATE (which works on
+SQLite as well as Postgres) that sets a lease; the lease is renewed after
+every stage, and a job whose lease runs out is claimed again by another
+worker. Each stage records its output on the row, so a retried job resumes
+from the stage it crashed in.
+"""
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+from django.db.models import F, Q
+from django.utils import timezone
+
+from ..models import ScanJob
+from .scan_pipeline import identify_stage, load_recipes, merge_stage, recipes_stage
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through settings.SCAN_JOBS
+DEFAULTS = {
+    'CONCURRENCY': 2,        # worker threads per process
+    'LEASE_SECONDS': 120,    # how long a stage may run before the job is considered abandoned
+    'MAX_ATTEMPTS': 3,
+    'POLL_INTERVAL': 1.0,    # seconds an idle worker waits before looking for work again
+    'IN_PROCESS': True,      # start workers inside the web process on first use
+    'RETENTION_HOURS': 24,   # finished jobs are kept this long for status polls (`manage.py purge_scan_jobs`)
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'SCAN_JOBS', {}))
+    return config
+
+
+class LeaseLost(Exception):
+    """
+    The job was reclaimed by another worker while this one was working on it.
+    """
+
+
+def _claimable(now):
+    return Q(status=ScanJob.STATUS_QUEUED) | Q(status=ScanJob.STATUS_RUNNING, lease_expires_at__lt=now)
+
+
+def fail_exhausted_jobs(max_attempts):
+    now = timezone.now()
+    return ScanJob.objects.filter(
+        status=ScanJob.STATUS_RUNNING, lease_expires_at__lt=now, attempts__gte=max_attempts
+    ).update(
+        status=ScanJob.STATUS_FAILED,
+        error="The scan was abandoned too many times.",
+        image=b'',
+        lease_owner='',
+        lease_expires_at=None,
+        updated_at=now,
+    )
+
+
+def claim_next_job(owner, config):
+    """
+    Leases the oldest claimable job to `owner` and returns it, or None.
+    """
+    now = timezone.now()
+    candidates = list(
+        ScanJob.objects.filter(_claimable(now), attempts__lt=config['MAX_ATTEMPTS'])
+        .order_by('created_at')
+        .values_list('id', flat=True)[:5]
+    )
+    for job_id in candidates:
+        # Only one worker's UPDATE can match while the job is still claimable
+        claimed = ScanJob.objects.filter(_claimable(now), pk=job_id).update(
+            status=ScanJob.STATUS_RUNNING,
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=config['LEASE_SECONDS']),
+            attempts=F('attempts') + 1,
+            updated_at=now,
+        )
+        if claimed:
+            return ScanJob.objects.select_related('user').get(pk=job_id)
+    return None
+
+
+def run_job(job, owner, config):
+    lease = timedelta(seconds=config['LEASE_SECONDS'])
+
+    def advance(**fields):
+        now = timezone.now()
+        fields.setdefault('lease_expires_at', now + lease)
+        fields['updated_at'] = now
+        if not ScanJob.objects.filter(pk=job.pk, lease_owner=owner).update(**fields):
+            raise LeaseLost()
+
+    try:
+        stage = job.stage
+        names = job.detected_ingredients
+
+        if stage == ScanJob.STAGE_IDENTIFY or names is None:
+            names = identify_stage(bytes(job.image), job.mime_type, bypass=job.bypass_cache)
+            stage = ScanJob.STAGE_MERGE
+            advance(stage=stage, detected_ingredients=names)
+
+        if stage == ScanJob.STAGE_MERGE:
+            merge_stage(job.user, names)
+            stage = ScanJob.STAGE_RECIPES
+            advance(stage=stage)
+
+        recipes_json = recipes_stage(names, job.model_name, bypass=job.bypass_cache)
+        advance(
+            status=ScanJob.STATUS_SUCCEEDED,
+            stage=ScanJob.STAGE_DONE,
+            result={
+                "detected_ingredients": names,
+                "pantry_updated": True,
+                "suggested_recipes": load_recipes(recipes_json),
+            },
+            error='',
+            # The image is no longer needed once the scan has finished
+            image=b'',
+            lease_owner='',
+            lease_expires_at=None,
+        )
+
+    except LeaseLost:
+        return
+
+    except Exception as e:
+        logger.exception("Scan job %s failed on attempt %d", job.pk, job.attempts)
+        retry = job.attempts < config['MAX_ATTEMPTS']
+        fields = {} if retry else {'image': b''}
+        ScanJob.objects.filter(pk=job.pk, lease_owner=owner).update(
+            status=ScanJob.STATUS_QUEUED if retry else ScanJob.STATUS_FAILED,
+            error=str(e),
+            lease_owner='',
+            lease_expires_at=None,
+            updated_at=timezone.now(),
+            **fields,
+        )
+
+
+class ScanWorkerPool:
+    """
+    A fixed number of daemon threads that claim and run scan jobs.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self.pid = os.getpid()
+        self._owner_prefix = f"{socket.gethostname()}:{self.pid}"
+        self._threads = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+    @property
+    def started(self):
+        return bool(self._threads)
+
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            for index in range(self.config['CONCURRENCY']):
+                thread = threading.Thread(
+                    target=self._work, args=(f"{self._owner_prefix}:{index}",),
+                    name=f"scan-worker-{index}", daemon=True,
+                )
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self, timeout=None):
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def notify(self):
+        # Wake idle workers instead of letting them sleep out the poll interval
+        self._wakeup.set()
+
+    def _work(self, owner):
+        try:
+            while not self._stop.is_set():
+                close_old_connections()
+                try:
+                    fail_exhausted_jobs(self.config['MAX_ATTEMPTS'])
+                    job = claim_next_job(owner, self.config)
+                except Exception:
+                    logger.exception("Scan worker could not claim a job")
+                    job = None
+
+                if job is None:
+                    self._wakeup.wait(self.config['POLL_INTERVAL'])
+                    self._wakeup.clear()
+                    continue
+
+                run_job(job, owner, self.config)
+        finally:
+            connection.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """
+    The process-wide pool. Threads do not survive a fork, so a pool inherited
+    from a parent process is replaced.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.pid != os.getpid():
+            _pool = ScanWorkerPool()
+        return _pool
+
+
+def enqueue_scan(user, prepared, model_name, bypass=False):
+    job = ScanJob.objects.create(
+        user=user,
+        image=prepared.data,
+        mime_type=prepared.mime_type,
+        model_name=model_name,
+        bypass_cache=bypass,
+    )
+    if get_config()['IN_PROCESS']:
+        pool = get_pool()
+        pool.start()
+        pool.notify()
+    return job
@@ -0,0 +1,29 @@
+"""
+JSON encoding and decoding through orjson when it is installed, the
+standard library otherwise. Both give the same compact, UTF-8 output for
+the plain dicts, lists, strings and numbers passed here.
+"""
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(obj):
+    """
+    Returns `obj` as JSON text.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj).decode('utf-8')
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'))
+
+
+def loads(data):
+    """
+    Parses JSON from str or bytes. Raises ValueError on invalid input.
+    """
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,97 @@
+"""
+Prometheus metrics for the scan and recipe paths, served at /metrics.
+
+    with timed('identify'):
+        ...
+
+    @timed('ingest')
+    def prepare_image(...):
+        ...
+
+Under a multi-process server (gunicorn, several uvicorn workers) set
+PROMETHEUS_MULTIPROC_DIR to an empty, writable directory before the workers
+start; each process then writes its samples there and /metrics aggregates
+them, whichever worker answers. Clear the directory on every restart.
+"""
+import os
+import time
+from contextlib import ContextDecorator
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+# Model calls take seconds; decode and DB stages milliseconds
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+
+STAGE_SECONDS = Histogram(
+    'smartpantry_stage_seconds',
+    "Time spent in each stage of a scan or recipe request.",
+    ['stage', 'model'],
+    buckets=LATENCY_BUCKETS,
+)
+UPSTREAM_ERRORS = Counter(
+    'smartpantry_upstream_errors_total',
+    "Failed upstream model calls, per attempt.",
+    ['operation', 'model'],
+)
+PARSE_FAILURES = Counter(
+    'smartpantry_json_parse_failures_total',
+    "Model answers that were not valid JSON.",
+    ['source'],
+)
+INVALID_RECIPES = Counter(
+    'smartpantry_invalid_recipes_total',
+    "Recipes dropped from a parsed answer for not matching the recipe schema.",
+    ['source'],
+)
+RECIPE_ANSWERS = Counter(
+    'smartpantry_recipe_answers_total',
+    "Recipe suggestions answered from the local pool or by a model call.",
+    ['source'],
+)
+DB_WRITE_RETRIES = Counter(
+    'smartpantry_db_write_retries_total',
+    "Write transactions rerun after failing on a locked database.",
+    ['operation'],
+)
+
+
+class timed(ContextDecorator):
+    """
+    Observes the time spent inside the block (or call) in STAGE_SECONDS.
+    """
+
+    def __init__(self, stage, model=''):
+        self.stage = stage
+        self.model = model
+
+    def _recreate_cm(self):
+        # A fresh instance per decorated call, so concurrent calls don't share _start
+        return type(self)(self.stage, self.model)
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        STAGE_SECONDS.labels(self.stage, self.model).observe(time.perf_counter() - self._start)
+        return False
+
+
+def export():
+    """
+    Returns (body, content type) in the Prometheus text format.
+    """
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry), CONTENT_TYPE_LATEST
@@ -0,0 +1,171 @@
+"""
+Process-wide google-genai clients, created on first use.
+
+Importing google-genai pulls in a large dependency tree, so nothing in the
+request path imports it at module level: views, manage.py commands and
+workers that never call the model don't pay for it. The first model call
+builds one client per API key. All clients share a single pooled httpx
+transport (one sync, one async), so connections to the API are kept alive
+and reused across calls and across providers.
+
+A forked worker never reuses the parent's clients or sockets: the registry
+is dropped in the child and rebuilt on first use. To take that first-use
+cost off the first request, enable MODEL_CLIENTS['WARM_UP']; the WSGI/ASGI
+entry points then call schedule_warm_up(), which builds the clients (and,
+with WARM_UP_CONNECT, opens a connection) in a background thread once per
+worker process, including workers forked from a preloaded app.
+"""
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through settings.MODEL_CLIENTS
+DEFAULTS = {
+    'MAX_CONNECTIONS': 20,
+    'MAX_KEEPALIVE_CONNECTIONS': 10,
+    'KEEPALIVE_EXPIRY': 60,       # seconds an idle connection stays open
+    'TIMEOUT': 60,                # seconds, per request
+    'WARM_UP': False,
+    'WARM_UP_CONNECT': False,     # also open a connection to the API while warming up
+    'BASE_URL': None,             # the API's own URL unless set
+}
+
+API_URL = 'https://generativelanguage.googleapis.com/'
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MODEL_CLIENTS', {}))
+    return config
+
+
+_clients = {}
+_transports = None
+_lock = threading.Lock()
+_stats = {'clients_created': 0, 'init_seconds': 0.0, 'warmed_up': False}
+
+
+def _build_transports(config):
+    import httpx
+
+    limits = httpx.Limits(
+        max_connections=config['MAX_CONNECTIONS'],
+        max_keepalive_connections=config['MAX_KEEPALIVE_CONNECTIONS'],
+        keepalive_expiry=config['KEEPALIVE_EXPIRY'],
+    )
+    timeout = httpx.Timeout(config['TIMEOUT'])
+    return httpx.Client(limits=limits, timeout=timeout), httpx.AsyncClient(limits=limits, timeout=timeout)
+
+
+def get_client(api_key=None):
+    """
+    Returns the shared genai.Client for `api_key` (default: GOOGLE_API_KEY),
+    creating it, and the pooled transport, on first use.
+    """
+    global _transports
+    api_key = api_key or os.getenv("GOOGLE_API_KEY")
+    client = _clients.get(api_key)
+    if client is not None:
+        return client
+
+    with _lock:
+        client = _clients.get(api_key)
+        if client is None:
+            start = time.perf_counter()
+            from google import genai
+            from google.genai import types
+
+            config = get_config()
+            if _transports is None:
+                _transports = _build_transports(config)
+            sync_transport, async_transport = _transports
+            client = genai.Client(
+                api_key=api_key,
+                http_options=types.HttpOptions(
+                    base_url=config['BASE_URL'],
+                    httpx_client=sync_transport,
+                    httpx_async_client=async_transport,
+                ),
+            )
+            _clients[api_key] = client
+            _stats['clients_created'] += 1
+            _stats['init_seconds'] += time.perf_counter() - start
+        return client
+
+
+def reset_clients():
+    """
+    Forgets the clients and the transport. Used in forked children, where
+    the parent's connections must not be reused, and in tests.
+    """
+    global _transports
+    with _lock:
+        _clients.clear()
+        _transports = None
+        _stats['warmed_up'] = False
+
+
+def _reset_after_fork():
+    # The lock may have been held by another thread at fork time
+    global _lock, _transports
+    _lock = threading.Lock()
+    _clients.clear()
+    _transports = None
+    _stats['warmed_up'] = False
+
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def warm_up():
+    """
+    Builds the active provider and, for the remote provider, its client, so
+    the first request doesn't. With WARM_UP_CONNECT, also opens a
+    keep-alive connection to the API.
+    """
+    from .providers import get_provider
+
+    config = get_config()
+    try:
+        provider = get_provider()
+        if hasattr(provider, 'api_key'):
+            get_client(provider.api_key)
+            if config['WARM_UP_CONNECT']:
+                import httpx
+
+                try:
+                    _transports[0].head(config['BASE_URL'] or API_URL)
+                except httpx.HTTPError as e:
+                    logger.warning("Could not open a connection to the model API while warming up: %s", e)
+        _stats['warmed_up'] = True
+    except Exception:
+        logger.exception("Model client warm-up failed")
+
+
+def _warm_up_in_background():
+    threading.Thread(target=warm_up, name='model-client-warm-up', daemon=True).start()
+
+
+_scheduled = False
+
+
+def schedule_warm_up():
+    """
+    Warms up in a background thread now and in every child forked from this
+    process (gunicorn --preload), if MODEL_CLIENTS['WARM_UP'] is on.
+    """
+    global _scheduled
+    if _scheduled or not get_config()['WARM_UP']:
+        return
+    _scheduled = True
+    os.register_at_fork(after_in_child=_warm_up_in_background)
+    _warm_up_in_background()
+
+
+def stats():
+    return {**_stats, 'clients': len(_clients)}
@@ -0,0 +1,132 @@
+"""
+One tolerant parser for the recipe JSON a model writes.
+
+Models wrap the array in ```json fences, add a sentence before or after
+it, or answer with a single object. parse_recipes() cuts the JSON out of
+all of that, then parses and validates it against RecipeSchema in one pass
+(pydantic-core's JSON parser). Entries that don't fit the schema are
+dropped one by one instead of the whole answer. Answers with no usable JSON
+are counted in /metrics and logged, never silently turned into [].
+"""
+import logging
+from typing import Annotated, Optional
+
+from pydantic import BaseModel, ConfigDict, Field, TypeAdapter, ValidationError, WrapValidator, field_validator
+
+from .metrics import INVALID_RECIPES, PARSE_FAILURES
+
+logger = logging.getLogger(__name__)
+
+
+class RecipeSchema(BaseModel):
+    """
+    A recipe as the API returns it. Extra keys (coverage, missing, source...
+    on local answers) are kept.
+    """
+    model_config = ConfigDict(extra='allow', str_strip_whitespace=True)
+
+    title: str = Field(min_length=1)
+    instructions: str = Field(min_length=1)
+    ingredients: list[str] = Field(default_factory=list)
+
+    @field_validator('instructions', mode='before')
+    @classmethod
+    def join_steps(cls, value):
+        # Some models answer with a list of steps
+        if isinstance(value, list):
+            return "\n".join(str(step) for step in value)
+        return value
+
+    @field_validator('ingredients', mode='before')
+    @classmethod
+    def ingredient_names(cls, value):
+        if isinstance(value, str):
+            value = value.split(',')
+        if not isinstance(value, list):
+            return value
+        names = []
+        for entry in value:
+            if isinstance(entry, dict):
+                entry = entry.get('name') or entry.get('item') or ''
+            entry = str(entry).strip()
+            if entry:
+                names.append(entry)
+        return names
+
+
+def _skip_invalid(value, handler):
+    try:
+        return handler(value)
+    except ValidationError:
+        return None
+
+
+RECIPE_LIST = TypeAdapter(list[Annotated[Optional[RecipeSchema], WrapValidator(_skip_invalid)]])
+
+
+def extract_json(text):
+    """
+    Returns the JSON array in `text` (a lone object is wrapped in one), or
+    None when there is none.
+    """
+    # Inside a ``` fence; a language tag such as "json" is skipped below
+    fence = text.find('```')
+    if fence != -1:
+        close = text.find('```', fence + 3)
+        if close != -1:
+            text = text[fence + 3:close]
+    array_start, object_start = text.find('['), text.find('{')
+    if array_start != -1 and (object_start == -1 or array_start < object_start):
+        end = text.rfind(']')
+        return text[array_start:end + 1] if end > array_start else None
+    if object_start != -1:
+        end = text.rfind('}')
+        return f"[{text[object_start:end + 1]}]" if end > object_start else None
+    return None
+
+
+def _failed(source, reason):
+    PARSE_FAILURES.labels(source).inc()
+    logger.warning("Could not parse the %s answer: %s", source, reason)
+
+
+def parse_recipes(text, source='recipes'):
+    """
+    Returns the valid recipes in a model answer (or a stored answer) as
+    dicts. `source` labels the failure counters.
+    """
+    if isinstance(text, bytes):
+        text = text.decode('utf-8', errors='replace')
+    if not isinstance(text, str) or not text.strip():
+        _failed(source, "empty answer")
+        return []
+
+    candidate = extract_json(text)
+    if candidate is None:
+        _failed(source, f"no JSON array in {text[:80]!r}")
+        return []
+    try:
+        items = RECIPE_LIST.validate_json(candidate)
+    except ValidationError as e:
+        _failed(source, e.errors(include_url=False)[0]['msg'])
+        return []
+
+    recipes = [item.model_dump(exclude_unset=True) for item in items if item is not None]
+    if len(recipes) < len(items):
+        INVALID_RECIPES.labels(source).inc(len(items) - len(recipes))
+    return recipes
+
+
+def parse_recipe(text, source='stream'):
+    """
+    Validates one recipe object. Returns a dict, or None when it is not a
+    usable recipe.
+    """
+    try:
+        return RecipeSchema.model_validate_json(text).model_dump(exclude_unset=True)
+    except ValidationError as e:
+        if any(error['type'] == 'json_invalid' for error in e.errors()):
+            _failed(source, e.errors(include_url=False)[0]['msg'])
+        else:
+            INVALID_RECIPES.labels(source).inc()
+        return None
@@ -0,0 +1,216 @@
+"""
+Chooses the model for each recipe request and keeps its prompt within a
+token budget.
+
+The ingredient list is deduplicated and, if its prompt would exceed
+PROMPT_TOKEN_BUDGET, cut down to the ingredients that fit (in the order
+given). The model the client asked for is only a hint: it is used when it
+is one of the configured MODELS and currently healthy, and refused
+otherwise. Without an accepted hint, small prompts go to the model with the
+lowest rolling median latency and larger ones to the first healthy model in
+MODELS order that can take the prompt. A model is unhealthy while its error
+rate over the last WINDOW calls exceeds MAX_ERROR_RATE. Calls older than
+SAMPLE_MAX_AGE no longer count, so an excluded model, which records no new
+calls, is tried again once its failures have aged out.
+
+Every decision is counted and the most recent ones are kept for /api/stats/.
+"""
+import statistics
+import threading
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+
+from django.conf import settings
+
+from .canonical import canonical_names
+
+# Defaults, overridable through settings.MODEL_ROUTER
+DEFAULTS = {
+    # Candidate models in order of preference for large prompts, with the
+    # latency to assume before any call has been observed
+    'MODELS': {
+        'gemini-3-flash-preview': {'MAX_PROMPT_TOKENS': 8000, 'EXPECTED_LATENCY_MS': 2500},
+        'gemini-2.5-flash': {'MAX_PROMPT_TOKENS': 8000, 'EXPECTED_LATENCY_MS': 2000},
+        'gemini-2.0-flash': {'MAX_PROMPT_TOKENS': 8000, 'EXPECTED_LATENCY_MS': 1500},
+        'gemma-3-12b-it': {'MAX_PROMPT_TOKENS': 4000, 'EXPECTED_LATENCY_MS': 3000},
+    },
+    'DEFAULT_MODEL': 'gemini-2.0-flash',   # used when no model is healthy
+    'ALLOW_CLIENT_HINTS': True,
+    'PROMPT_TOKEN_BUDGET': 600,
+    'SMALL_PROMPT_TOKENS': 250,             # at or below this, latency decides
+    'WINDOW': 50,                           # calls per model kept for the rolling stats
+    'MIN_SAMPLES': 5,                       # calls before a model can be judged unhealthy
+    'SAMPLE_MAX_AGE': 300,                  # seconds a call counts towards the rolling stats
+    'MAX_ERROR_RATE': 0.5,
+    'RECENT_DECISIONS': 50,
+}
+
+# Rough size of a token in characters, close enough for English ingredient lists
+CHARS_PER_TOKEN = 4
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'MODEL_ROUTER', {}))
+    return config
+
+
+def estimate_tokens(text):
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+def normalize_model_name(name):
+    # The frontend sends API resource names such as "models/gemini-2.0-flash"
+    name = str(name or '').strip()
+    return name[len('models/'):] if name.startswith('models/') else name
+
+
+@dataclass
+class RouteDecision:
+    model: str
+    ingredients: list
+    reason: str
+    requested: str = ''
+    prompt_tokens: int = 0
+    dropped: int = 0
+    at: float = field(default_factory=time.time)
+
+    def as_dict(self):
+        return {
+            'at': self.at,
+            'requested': self.requested,
+            'model': self.model,
+            'reason': self.reason,
+            'prompt_tokens': self.prompt_tokens,
+            'ingredients': len(self.ingredients),
+            'dropped': self.dropped,
+        }
+
+
+class ModelRouter:
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self._lock = threading.Lock()
+        self._calls = {name: deque(maxlen=self.config['WINDOW']) for name in self.config['MODELS']}
+        self._reasons = Counter()
+        self._chosen = Counter()
+        self._recent = deque(maxlen=self.config['RECENT_DECISIONS'])
+
+    # --- observations ---
+
+    def record(self, model_name, latency, ok):
+        """
+        Records the outcome of one upstream call to `model_name`.
+        """
+        calls = self._calls.get(normalize_model_name(model_name))
+        if calls is not None:
+            with self._lock:
+                calls.append((time.monotonic(), latency, ok))
+
+    def _model_stats(self, name):
+        cutoff = time.monotonic() - self.config['SAMPLE_MAX_AGE']
+        calls = [(latency, ok) for at, latency, ok in self._calls[name] if at >= cutoff]
+        errors = sum(1 for _, ok in calls if not ok)
+        latencies = [latency for latency, ok in calls if ok]
+        expected = self.config['MODELS'][name].get('EXPECTED_LATENCY_MS', 1000) / 1000
+        return {
+            'calls': len(calls),
+            'error_rate': errors / len(calls) if calls else 0.0,
+            'median_latency': statistics.median(latencies) if latencies else expected,
+        }
+
+    def _healthy(self, stats):
+        return stats['calls'] < self.config['MIN_SAMPLES'] or stats['error_rate'] <= self.config['MAX_ERROR_RATE']
+
+    # --- routing ---
+
+    def condense(self, ingredients, budget):
+        """
+        Returns (ingredients that fit the budget, prompt tokens, how many were dropped).
+        """
+        from .google_gemini_service import _recipe_prompt
+
+        names = canonical_names(ingredients)
+        tokens = estimate_tokens(_recipe_prompt(names))
+        if tokens <= budget:
+            return names, tokens, 0
+
+        # The prompt grows by about one item (plus separator) per ingredient
+        kept = []
+        tokens = estimate_tokens(_recipe_prompt([]))
+        for name in names:
+            cost = estimate_tokens(name + ', ')
+            if tokens + cost > budget:
+                break
+            kept.append(name)
+            tokens += cost
+        if not kept and names:
+            kept, tokens = names[:1], estimate_tokens(_recipe_prompt(names[:1]))
+        return kept, tokens, len(names) - len(kept)
+
+    def route(self, ingredients, hint=None):
+        config = self.config
+        requested = normalize_model_name(hint)
+        names, tokens, dropped = self.condense(ingredients, config['PROMPT_TOKEN_BUDGET'])
+
+        with self._lock:
+            stats = {name: self._model_stats(name) for name in config['MODELS']}
+        healthy = [
+            name for name in config['MODELS']
+            if self._healthy(stats[name]) and tokens <= config['MODELS'][name].get('MAX_PROMPT_TOKENS', tokens)
+        ]
+
+        model = None
+        if requested:
+            if not config['ALLOW_CLIENT_HINTS'] or requested not in config['MODELS']:
+                reason = 'hint refused: not allowed'
+            elif requested not in healthy:
+                reason = 'hint refused: unhealthy'
+            else:
+                model, reason = requested, 'hint'
+        if model is None:
+            if not healthy:
+                model, reason = config['DEFAULT_MODEL'], 'fallback: no healthy model'
+            elif tokens <= config['SMALL_PROMPT_TOKENS']:
+                model = min(healthy, key=lambda name: stats[name]['median_latency'])
+                reason = 'fastest' if not requested else f"{reason}; fastest"
+            else:
+                model = healthy[0]
+                reason = 'preferred' if not requested else f"{reason}; preferred"
+
+        decision = RouteDecision(
+            model=model, ingredients=names, reason=reason, requested=requested,
+            prompt_tokens=tokens, dropped=dropped,
+        )
+        with self._lock:
+            self._reasons[reason.split(';')[0]] += 1
+            self._chosen[model] += 1
+            self._recent.append(decision)
+        return decision
+
+    def stats(self):
+        with self._lock:
+            models = {name: self._model_stats(name) for name in self.config['MODELS']}
+            for name, model_stats in models.items():
+                model_stats['healthy'] = self._healthy(model_stats)
+                model_stats['chosen'] = self._chosen[name]
+            return {
+                'models': models,
+                'reasons': dict(self._reasons),
+                'recent': [decision.as_dict() for decision in self._recent],
+            }
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                _router = ModelRouter()
+    return _router
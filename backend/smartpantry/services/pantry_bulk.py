@@ -0,0 +1,128 @@
+"""
+Applies a validated list of create / update / delete operations to a user's
+pantry in one transaction, with one query per operation type whatever the
+batch size: one read of the referenced rows, one name-conflict check, one
+bulk INSERT, one bulk UPDATE, one soft-delete UPDATE and one version bump.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from ..models import Ingredient, bump_pantry_version
+from .storage import retry_on_locked
+
+UPDATABLE_FIELDS = ('name', 'quantity', 'expiration_date')
+
+
+class BulkOperationError(Exception):
+    """
+    Raised before anything is written; `errors` maps operation index to messages.
+    """
+
+    def __init__(self, errors):
+        super().__init__("Some operations could not be applied.")
+        self.errors = errors
+
+
+def _check(user, operations):
+    """
+    Resolves the rows the batch refers to and rejects operations on unknown
+    ids and names that would clash. Returns the referenced rows by id.
+    """
+    errors = {}
+    referenced_ids = {op['id'] for op in operations if op['op'] != 'create'}
+    rows = Ingredient.objects.filter(user=user).in_bulk(referenced_ids) if referenced_ids else {}
+
+    touched = set()
+    for index, op in enumerate(operations):
+        if op['op'] == 'create':
+            continue
+        if op['id'] not in rows:
+            errors[index] = {'id': ["Ingredient not found."]}
+        elif op['id'] in touched:
+            errors[index] = {'id': ["Ingredient appears more than once in this batch."]}
+        touched.add(op['id'])
+
+    # Names the batch will hold once applied, checked against each other and
+    # against the rows the batch does not rename or delete
+    target_names = {}
+    for index, op in enumerate(operations):
+        if 'name' not in op or op['op'] == 'delete':
+            continue
+        if op['name'] in target_names:
+            errors.setdefault(index, {})['name'] = ["Name used more than once in this batch."]
+        target_names[op['name']] = index
+
+    if target_names:
+        released = {
+            op['id'] for op in operations
+            if op['op'] == 'delete' or (op['op'] == 'update' and 'name' in op)
+        }
+        clashes = (
+            Ingredient.objects.filter(user=user, name__in=target_names)
+            .exclude(pk__in=released)
+            .values_list('pk', 'name')
+        )
+        for pk, name in clashes:
+            index = target_names[name]
+            op = operations[index]
+            if op['op'] == 'update' and op['id'] == pk:
+                continue
+            errors.setdefault(index, {})['name'] = ["This ingredient is already in your pantry."]
+
+    if errors:
+        raise BulkOperationError(errors)
+    return rows
+
+
+@retry_on_locked
+def apply_operations(user, operations):
+    """
+    Returns one result per operation, in order.
+    """
+    with transaction.atomic():
+        rows = _check(user, operations)
+        now = timezone.now()
+
+        creates = []
+        updated = {}
+        deleted_ids = []
+        for op in operations:
+            if op['op'] == 'create':
+                creates.append(Ingredient(
+                    user=user,
+                    name=op['name'],
+                    quantity=op['quantity'],
+                    expiration_date=op['expiration_date'],
+                ))
+            elif op['op'] == 'update':
+                row = rows[op['id']]
+                for field in UPDATABLE_FIELDS:
+                    if field in op:
+                        setattr(row, field, op[field])
+                row.updated_at = now
+                updated[row.pk] = row
+            else:
+                deleted_ids.append(op['id'])
+
+        # Soft-delete first so a created or renamed row can take a deleted name
+        if deleted_ids:
+            Ingredient.objects.filter(user=user, pk__in=deleted_ids).update(deleted_at=now, updated_at=now)
+        if updated:
+            Ingredient.objects.bulk_update(list(updated.values()), [*UPDATABLE_FIELDS, 'updated_at'])
+        if creates:
+            Ingredient.objects.bulk_create(creates)
+        if creates or updated or deleted_ids:
+            # Bulk queries send no signals, so bump the version here
+            bump_pantry_version(user.pk)
+
+    created = iter(creates)
+    results = []
+    for index, op in enumerate(operations):
+        if op['op'] == 'create':
+            row = next(created)
+            results.append({'index': index, 'op': 'create', 'id': row.pk, 'status': 'created'})
+        elif op['op'] == 'update':
+            results.append({'index': index, 'op': 'update', 'id': op['id'], 'status': 'updated'})
+        else:
+            results.append({'index': index, 'op': 'delete', 'id': op['id'], 'status': 'deleted'})
+    return results
@@ -0,0 +1,177 @@
+"""
+Model providers behind google_gemini_service's public functions.
+
+A provider turns an image into a comma-separated ingredient list and an
+ingredient list into raw recipe JSON. The active one is picked with the
+MODEL_PROVIDER setting from the entries in MODEL_PROVIDERS, the same way
+Django picks a cache backend.
+"""
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class ProviderError(Exception):
+    """
+    Raised by a provider when the upstream model call fails.
+    """
+
+
+class ModelProvider:
+    """
+    Base class. Subclasses implement identify() and suggest_recipes();
+    the async and streaming variants fall back to those.
+    """
+
+    def identify(self, image_bytes, mime_type, model_name):
+        raise NotImplementedError
+
+    def suggest_recipes(self, ingredients_list, model_name):
+        raise NotImplementedError
+
+    def stream_recipes(self, ingredients_list, model_name):
+        yield self.suggest_recipes(ingredients_list, model_name)
+
+    async def aidentify(self, image_bytes, mime_type, model_name):
+        return await sync_to_async(self.identify, thread_sensitive=False)(image_bytes, mime_type, model_name)
+
+    async def asuggest_recipes(self, ingredients_list, model_name):
+        return await sync_to_async(self.suggest_recipes, thread_sensitive=False)(ingredients_list, model_name)
+
+
+# A fixed vocabulary so offline detections look like real pantry items
+OFFLINE_INGREDIENTS = [
+    'egg', 'milk', 'bread', 'butter', 'cheese', 'tomato', 'onion', 'garlic',
+    'potato', 'carrot', 'spinach', 'chicken', 'rice', 'pasta', 'apple',
+    'banana', 'yogurt', 'pepper', 'mushroom', 'lemon', 'beans', 'flour',
+]
+
+
+class OfflineProvider(ModelProvider):
+    """
+    Deterministic stand-in for the remote model, for tests, benchmarks and
+    load tests without network access or an API key.
+
+    Answers depend only on the input (the same image or ingredient list
+    always gives the same result). Latency is log-normally distributed
+    around `latency_ms` (`latency_sigma=0` makes it fixed) and a fraction
+    `error_rate` of calls raise ProviderError. Both are drawn from a
+    generator seeded with `seed`, so a run can be reproduced.
+    """
+
+    def __init__(self, latency_ms=0, latency_sigma=0.0, error_rate=0.0, seed=0, stream_chunks=4):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.stream_chunks = stream_chunks
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self):
+        """
+        Returns (latency in seconds, whether this call fails).
+        """
+        with self._lock:
+            if self.latency_sigma:
+                latency = self._random.lognormvariate(0, self.latency_sigma) * self.latency_ms
+            else:
+                latency = self.latency_ms
+            failed = self._random.random() < self.error_rate
+        return latency / 1000, failed
+
+    @staticmethod
+    def _seed_for(*parts):
+        digest = hashlib.sha256('|'.join(str(p) for p in parts).encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big')
+
+    def _identify_text(self, image_bytes):
+        rng = random.Random(self._seed_for(hashlib.sha256(image_bytes).hexdigest()))
+        return ', '.join(rng.sample(OFFLINE_INGREDIENTS, rng.randint(3, 6)))
+
+    def _recipes_text(self, ingredients_list):
+        names = sorted({str(name).strip().lower() for name in ingredients_list if str(name).strip()})
+        rng = random.Random(self._seed_for(*names))
+        recipes = []
+        for number in range(min(3, max(1, len(names)))):
+            used = rng.sample(names, min(len(names), rng.randint(2, 4))) if names else []
+            lines = ["Ingredients:"] + [f"- {name}" for name in used]
+            lines += ["", "Step-by-Step:", "1. Prepare the ingredients.", "2. Cook and serve."]
+            recipes.append({
+                "title": f"{' & '.join(name.title() for name in used[:2]) or 'Pantry'} Dish {number + 1}",
+                "ingredients": used,
+                "instructions": "\n".join(lines),
+            })
+        return json.dumps(recipes)
+
+    def identify(self, image_bytes, mime_type, model_name):
+        latency, failed = self._draw()
+        time.sleep(latency)
+        if failed:
+            raise ProviderError("Simulated upstream error")
+        return self._identify_text(image_bytes)
+
+    def suggest_recipes(self, ingredients_list, model_name):
+        latency, failed = self._draw()
+        time.sleep(latency)
+        if failed:
+            raise ProviderError("Simulated upstream error")
+        return self._recipes_text(ingredients_list)
+
+    def stream_recipes(self, ingredients_list, model_name):
+        latency, failed = self._draw()
+        if failed:
+            time.sleep(latency)
+            raise ProviderError("Simulated upstream error")
+        text = self._recipes_text(ingredients_list)
+        size = max(1, -(-len(text) // self.stream_chunks))
+        for start in range(0, len(text), size):
+            time.sleep(latency / self.stream_chunks)
+            yield text[start:start + size]
+
+    async def aidentify(self, image_bytes, mime_type, model_name):
+        latency, failed = self._draw()
+        await asyncio.sleep(latency)
+        if failed:
+            raise ProviderError("Simulated upstream error")
+        return self._identify_text(image_bytes)
+
+    async def asuggest_recipes(self, ingredients_list, model_name):
+        latency, failed = self._draw()
+        await asyncio.sleep(latency)
+        if failed:
+            raise ProviderError("Simulated upstream error")
+        return self._recipes_text(ingredients_list)
+
+
+_providers = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(alias=None):
+    """
+    Returns the provider instance for `alias` (default: settings.MODEL_PROVIDER),
+    creating it on first use.
+    """
+    alias = alias or settings.MODEL_PROVIDER
+    with _providers_lock:
+        provider = _providers.get(alias)
+        if provider is None:
+            config = settings.MODEL_PROVIDERS[alias]
+            provider = import_string(config['BACKEND'])(**config.get('OPTIONS', {}))
+            _providers[alias] = provider
+        return provider
+
+
+def reset_providers():
+    """
+    Drops the provider instances, e.g. after changing settings in tests.
+    """
+    with _providers_lock:
+        _providers.clear()
@@ -0,0 +1,200 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import InvalidCacheBackendError
+
+from .canonical import canonical_names
+
+# Defaults, overridable through settings.RECIPE_CACHE
+DEFAULTS = {
+    'ENABLED': True,
+    'TTL': 60 * 60 * 24,          # seconds a cached answer stays valid
+    'LOCAL_MAX_ENTRIES': 512,     # size of the in-process LRU tier
+    'SHARED_CACHE_ALIAS': 'recipes',  # Django cache alias for the shared tier
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'RECIPE_CACHE', {}))
+    return config
+
+
+def make_key(ingredients, model_name):
+    """
+    Builds a cache key from the canonical, sorted ingredient set and the model.
+    "Milk, eggs" and "eggs, fresh milk, egg" map to the same key.
+    """
+    names = sorted(canonical_names(ingredients))
+    raw = f"{model_name}|{','.join(names)}"
+    return "recipes:" + hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+class LocalLRUCache:
+    """
+    Small thread-safe LRU with per-entry expiry, used as the first tier.
+    """
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class RecipeCache:
+    """
+    Two-tier cache for recipe suggestions: an in-process LRU in front of a
+    shared Django cache (file or DB backed, see CACHES in settings).
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_config()
+        self.local = LocalLRUCache(self.config['LOCAL_MAX_ENTRIES'], self.config['TTL'])
+        self._stats_lock = threading.Lock()
+        self._stats = {'local_hits': 0, 'shared_hits': 0, 'misses': 0, 'bypassed': 0, 'stores': 0}
+
+    @property
+    def shared(self):
+        try:
+            return caches[self.config['SHARED_CACHE_ALIAS']]
+        except InvalidCacheBackendError:
+            return None
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None:
+            self._count('local_hits')
+            return value
+
+        shared = self.shared
+        if shared is not None:
+            value = shared.get(key)
+            if value is not None:
+                # Promote to the local tier so the next hit skips the shared lookup
+                self.local.set(key, value)
+                self._count('shared_hits')
+                return value
+
+        self._count('misses')
+        return None
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        shared = self.shared
+        if shared is not None:
+            shared.set(key, value, timeout=self.config['TTL'])
+        self._count('stores')
+
+    def delete(self, key):
+        self.local.delete(key)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(key)
+
+    def lookup(self, ingredients, model_name):
+        """
+        Returns the cached recipe JSON for this pantry, or None. For callers
+        that produce the value themselves, such as the streaming view.
+        """
+        if not self.config['ENABLED']:
+            return None
+        return self.get(make_key(ingredients, model_name))
+
+    def remember(self, ingredients, model_name, value):
+        if self.config['ENABLED'] and value and value.strip() not in ('', '[]'):
+            self.set(make_key(ingredients, model_name), value)
+
+    def get_or_compute(self, ingredients, model_name, compute, bypass=False):
+        """
+        Returns the cached recipe JSON for this pantry, calling compute() on a miss.
+        With bypass=True the cache is not read, but a fresh answer is still stored.
+        """
+        if not self.config['ENABLED']:
+            return compute()
+
+        key = make_key(ingredients, model_name)
+        if bypass:
+            self._count('bypassed')
+        else:
+            cached = self.get(key)
+            if cached is not None:
+                return cached
+
+        value = compute()
+        # Empty answers are what the service returns on upstream errors; never cache them
+        if value and value.strip() not in ('', '[]'):
+            self.set(key, value)
+        return value
+
+    async def aget_or_compute(self, ingredients, model_name, compute, bypass=False):
+        """
+        Async get_or_compute; compute is a coroutine function. The shared tier
+        does file I/O, so it runs in a worker thread.
+        """
+        if not self.config['ENABLED']:
+            return await compute()
+
+        key = make_key(ingredients, model_name)
+        if bypass:
+            self._count('bypassed')
+        else:
+            cached = await sync_to_async(self.get, thread_sensitive=False)(key)
+            if cached is not None:
+                return cached
+
+        value = await compute()
+        if value and value.strip() not in ('', '[]'):
+            await sync_to_async(self.set, thread_sensitive=False)(key, value)
+        return value
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['local_hits'] + stats['shared_hits'] + stats['misses']
+        stats['hit_rate'] = (stats['local_hits'] + stats['shared_hits']) / lookups if lookups else 0.0
+        stats['local_entries'] = len(self.local)
+        return stats
+
+
+recipe_cache = RecipeCache()
+
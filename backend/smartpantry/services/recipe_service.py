@@ -1,37 +1,494 @@
+"""
+Local recipe engine: answers suggestions from the Recipe table before falling
+back to the model.
+
+The table is read once into an in-memory inverted index. Ingredients and
+recipes get compact integer ids; each recipe keeps its ingredients as a bit
+mask, and each ingredient keeps the recipes that use it as a bit mask (Python
+ints serve as arbitrary-length bitsets). A query ORs together the postings of
+the pantry's ingredients to find candidate recipes, then scores each one by
+the share of its ingredients the pantry covers with a single AND and
+popcount. No NumPy needed, and a query over a few thousand recipes takes well
+under a millisecond.
+
+Recipes the model generates are validated, deduplicated and added to the
+table too, so the pool grows with use and a later pantry that covers one of
+them is answered without a model call. They are appended to the live index
+rather than triggering a rebuild. The WSGI/ASGI entry points build the index
+in the background at startup (BUILD_AT_STARTUP), so no request waits for it.
+"""
+import csv
+import hashlib
+import json
+import logging
 import os
-from google import genai
-from google.genai import types
-
-# Reuse the client initialization
-client = genai.Client(api_key=os.getenv("GOOGLE_API_KEY"))
-
-def suggest_recipes_from_ingredients(ingredients_list):
-    """
-    Accepts a list of ingredient names (e.g., ['tomato', 'egg', 'onion'])
-    and returns a structured JSON list of recipes.
-    """
-    prompt = f"""
-    I have these ingredients: {', '.join(ingredients_list)}.
-    Suggest 3 recipes I can make. 
-    Return ONLY raw JSON. Do not use Markdown formatting.
-    Structure:
-    [
-        {{
-            "title": "Recipe Name",
-            "ingredients_needed": ["item1", "item2"]
-            "instructions": "Step 1..."
-        }}
-    ]
-    """
-    
+import re
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+
+from django.db import DatabaseError, connection
+
+from ..models import Recipe
+from .canonical import canonical_name, canonical_names
+from .google_gemini_service import suggest_recipes_from_ingredients, suggest_recipes_from_ingredients_async
+from .jsonio import dumps
+from .metrics import RECIPE_ANSWERS
+from .model_output import parse_recipes
+from .model_router import get_router
+from .recipe_cache import recipe_cache
+from .storage import retry_on_locked
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through settings.RECIPE_ENGINE
+DEFAULTS = {
+    'ENABLED': True,
+    'MIN_COVERAGE': 0.75,     # share of a recipe's ingredients the pantry must hold
+    'MAX_RESULTS': 3,
+    'REFRESH_SECONDS': 300,   # rebuild the index this often to pick up other processes' changes
+    'CORPUS_PATH': None,      # default file for `manage.py load_recipe_corpus`
+    'STORE_GENERATED': True,  # keep model-generated recipes for later requests
+    'BUILD_AT_STARTUP': True,  # build the index in the background when a server starts
+}
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'RECIPE_ENGINE', {}))
+    return config
+
+
+def normalize_name(name):
+    return ' '.join(str(name).strip().lower().split())
+
+
+def recipe_fingerprint(title, ingredients):
+    """
+    Identifies a recipe by its normalized title and canonical ingredient set.
+    """
+    names = sorted(canonical_names(ingredients))
+    raw = f"{normalize_name(title)}|{','.join(names)}"
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+
+def format_instructions(ingredients, steps):
+    """
+    Renders a corpus entry in the same layout the model is asked for.
+    """
+    lines = ["Ingredients:"] + [f"- {name}" for name in ingredients]
+    lines += ["Step-by-Step:"] + [f"{number}. {step}" for number, step in enumerate(steps, 1)]
+    return "\n".join(lines)
+
+
+def read_corpus(path):
+    """
+    Reads recipes from a JSON list of {"title", "ingredients", "steps" or
+    "instructions"} objects, or a CSV file with title, ingredients
+    (semicolon-separated) and instructions columns.
+    """
+    with open(path, encoding='utf-8', newline='') as f:
+        if str(path).lower().endswith('.csv'):
+            rows = [{**row, 'ingredients': row.get('ingredients', '').split(';')} for row in csv.DictReader(f)]
+        else:
+            rows = json.load(f)
+
+    recipes = []
+    for row in rows:
+        ingredients = canonical_names(row.get('ingredients', []))
+        instructions = row.get('instructions') or format_instructions(ingredients, row.get('steps', []))
+        if row.get('title') and ingredients:
+            recipes.append(Recipe(
+                title=row['title'].strip(),
+                fingerprint=recipe_fingerprint(row['title'], ingredients),
+                ingredients=ingredients,
+                instructions=instructions,
+            ))
+    return recipes
+
+
+# Leading amounts and units in ingredient lines such as "2 cups of milk"
+QUANTITY_PATTERN = re.compile(
+    r'^[\d\s/.,½¼¾-]*'
+    r'(?:(?:cups?|tbsp|tsp|tablespoons?|teaspoons?|g|kg|grams?|ml|l|litres?|liters?|oz|ounces?|'
+    r'lbs?|pounds?|cloves?|pinch(?:es)?|slices?|cans?|handfuls?)\b\.?\s*)?(?:of\s+)?',
+    re.IGNORECASE,
+)
+MAX_GENERATED_INGREDIENTS = 30
+
+
+def _ingredient_lines(instructions):
+    """
+    The "- item" lines of the Ingredients: section the model is asked to write.
+    """
+    items = []
+    in_section = False
+    for line in instructions.splitlines():
+        stripped = line.strip()
+        lowered = stripped.lower()
+        if lowered.startswith('ingredients'):
+            in_section = True
+        elif lowered.startswith('step') or (in_section and items and not stripped):
+            in_section = False
+        elif in_section and stripped[:1] in ('-', '*', '•'):
+            items.append(stripped[1:])
+    return items
+
+
+def _canonical_item(text, known):
+    """
+    Reduces an ingredient line to a name, preferring a `known` pantry name
+    that starts a word in it ("2 large eggs" -> "egg" if "egg" is known).
+    """
+    text = normalize_name(re.sub(r'\(.*?\)', ' ', str(text)).split(',')[0])
+    for name in known:
+        if re.search(rf'\b{re.escape(name)}', text):
+            return name
+    return canonical_name(QUANTITY_PATTERN.sub('', text))
+
+
+def parse_generated(recipes_json, requested_ingredients, model_name=''):
+    """
+    Turns a model answer into unsaved Recipe rows, dropping entries that are
+    not usable: no title, no instructions or no recognizable ingredients.
+    """
+    items = parse_recipes(recipes_json, source='generated')
+
+    # Longest first, so "goat cheese" wins over "cheese"
+    known = sorted(canonical_names(requested_ingredients), key=len, reverse=True)
+    recipes = {}
+    for item in items:
+        title = item['title'][:200]
+        instructions = item['instructions']
+        listed = item.get('ingredients') or _ingredient_lines(instructions)
+        names = list(dict.fromkeys(
+            name for name in (_canonical_item(entry, known) for entry in listed) if name and len(name) <= 100
+        ))
+        if not names or len(names) > MAX_GENERATED_INGREDIENTS:
+            continue
+        fingerprint = recipe_fingerprint(title, names)
+        recipes[fingerprint] = Recipe(
+            title=title,
+            fingerprint=fingerprint,
+            ingredients=names,
+            instructions=instructions,
+            source=Recipe.SOURCE_GENERATED,
+            model_name=model_name[:100],
+        )
+    return list(recipes.values())
+
+
+@retry_on_locked
+def _insert_new(recipes):
+    existing = set(
+        Recipe.objects.filter(fingerprint__in=[recipe.fingerprint for recipe in recipes])
+        .values_list('fingerprint', flat=True)
+    )
+    new = [recipe for recipe in recipes if recipe.fingerprint not in existing]
+    if new:
+        # ignore_conflicts covers a concurrent request storing the same recipe
+        Recipe.objects.bulk_create(new, ignore_conflicts=True)
+        _count('stored', len(new))
+        add_to_index(new)
+    return len(new)
+
+
+def store_generated(recipes_json, requested_ingredients, model_name):
+    """
+    Keeps the usable recipes of a model answer that are not stored yet.
+    Returns how many were added. Failures are logged, never raised: the
+    answer has already been produced.
+    """
+    if not get_config()['STORE_GENERATED']:
+        return 0
+    try:
+        recipes = parse_generated(recipes_json, requested_ingredients, model_name)
+        return _insert_new(recipes) if recipes else 0
+    except DatabaseError as e:
+        logger.warning("Could not store the recipes generated by %s: %s", model_name, e)
+        return 0
+
+
+class RecipeIndex:
+    """
+    Append-only inverted index over a list of recipes. add() may run while
+    other threads call match(): every id is published before anything
+    points at it.
+    """
+
+    def __init__(self, recipes):
+        self.recipes = []         # recipe id -> payload
+        self.masks = []           # recipe id -> bitset of ingredient ids
+        self.sizes = []           # recipe id -> number of ingredients
+        self.vocabulary = {}      # ingredient name -> ingredient id
+        self.postings = []        # ingredient id -> bitset of recipe ids
+        self.fingerprints = set()
+        self.built_at = time.monotonic()
+        self.add(recipes)
+
+    def add(self, recipes):
+        """
+        Indexes recipes not indexed yet. Callers serialize add() calls.
+        """
+        for recipe in recipes:
+            if recipe.fingerprint in self.fingerprints:
+                continue
+            names = canonical_names(recipe.ingredients)
+            mask = 0
+            for name in names:
+                ingredient_id = self.vocabulary.get(name)
+                if ingredient_id is None:
+                    self.postings.append(0)
+                    ingredient_id = self.vocabulary[name] = len(self.postings) - 1
+                mask |= 1 << ingredient_id
+            if not mask:
+                continue
+            recipe_bit = 1 << len(self.recipes)
+            self.recipes.append({
+                'title': recipe.title,
+                'instructions': recipe.instructions,
+                'ingredients': names,
+                'source': recipe.source,
+            })
+            self.masks.append(mask)
+            self.sizes.append(mask.bit_count())
+            self.fingerprints.add(recipe.fingerprint)
+            for name in names:
+                self.postings[self.vocabulary[name]] |= recipe_bit
+
+    def __len__(self):
+        return len(self.recipes)
+
+    def match(self, ingredients, min_coverage=0.0, limit=3):
+        """
+        Returns up to `limit` recipes covered at least `min_coverage` by
+        `ingredients`, best first: highest coverage, then most ingredients
+        used, then title.
+        """
+        pantry = 0
+        candidates = 0
+        for name in ingredients:
+            ingredient_id = self.vocabulary.get(canonical_name(name))
+            if ingredient_id is not None:
+                pantry |= 1 << ingredient_id
+                candidates |= self.postings[ingredient_id]
+
+        scored = []
+        while candidates:
+            low = candidates & -candidates
+            recipe_id = low.bit_length() - 1
+            candidates ^= low
+            matched = (self.masks[recipe_id] & pantry).bit_count()
+            coverage = matched / self.sizes[recipe_id]
+            if coverage >= min_coverage:
+                scored.append((-coverage, -matched, self.recipes[recipe_id]['title'], recipe_id))
+
+        scored.sort()
+        results = []
+        for negative_coverage, _, _, recipe_id in scored[:limit]:
+            recipe = self.recipes[recipe_id]
+            missing_mask = self.masks[recipe_id] & ~pantry
+            results.append({
+                'title': recipe['title'],
+                'instructions': recipe['instructions'],
+                'coverage': round(-negative_coverage, 3),
+                'missing': [name for name in recipe['ingredients'] if (1 << self.vocabulary[name]) & missing_mask],
+                'source': 'local',
+                'origin': recipe['source'],
+            })
+        return results
+
+
+_index = None
+_index_lock = threading.Lock()   # guards _index, _generation and _pending
+_build_lock = threading.Lock()   # one build at a time
+_generation = 0                  # bumped by invalidate_index()
+_pending = None                  # recipes added while a build reads the table
+
+
+def _is_fresh(index):
+    return index is not None and time.monotonic() - index.built_at < get_config()['REFRESH_SECONDS']
+
+
+def get_index():
+    """
+    The process-wide index, built from the Recipe table on first use and
+    rebuilt after invalidate_index() or every REFRESH_SECONDS. The build
+    runs outside _index_lock; while it does, other threads keep matching
+    against the stale index, if there is one.
+    """
+    global _index, _pending
+    index = _index
+    if _is_fresh(index):
+        return index
+    if not _build_lock.acquire(blocking=index is None):
+        return index
     try:
-        response = client.models.generate_content(
-            model="gemini-2.0-flash", # or "gemini-1.5-flash"
-            contents=prompt,
-            config=types.GenerateContentConfig(
-                response_mime_type="application/json"
-            )
+        with _index_lock:
+            if _is_fresh(_index):
+                return _index
+            generation = _generation
+            _pending = []
+        built = RecipeIndex(
+            Recipe.objects.only('title', 'fingerprint', 'ingredients', 'instructions', 'source').order_by('pk')
         )
-        return response.text
-    except Exception as e:
-        return []
\ No newline at end of file
+        with _index_lock:
+            # Recipes stored after the table was read; add() skips the ones it has
+            built.add(_pending)
+            _pending = None
+            if generation == _generation:
+                _index = built
+        return built
+    finally:
+        _build_lock.release()
+
+
+def add_to_index(recipes):
+    """
+    Adds newly stored recipes to the live index, if one is built; otherwise
+    the next build reads them from the table.
+    """
+    with _index_lock:
+        if _index is not None:
+            _index.add(recipes)
+        if _pending is not None:
+            _pending.extend(recipes)
+
+
+def invalidate_index():
+    global _index, _generation
+    with _index_lock:
+        _index = None
+        _generation += 1
+
+
+def _build_index_in_background():
+    def build():
+        try:
+            get_index()
+        except DatabaseError as e:
+            logger.warning("Could not build the recipe index at startup: %s", e)
+        finally:
+            connection.close()
+
+    threading.Thread(target=build, name='recipe-index-build', daemon=True).start()
+
+
+def _reset_after_fork():
+    # The build thread may have held the locks at fork time
+    global _index_lock, _build_lock, _pending
+    _index_lock = threading.Lock()
+    _build_lock = threading.Lock()
+    _pending = None
+
+
+_scheduled = False
+
+
+def schedule_index_build():
+    """
+    Builds the index in a background thread now, if RECIPE_ENGINE's ENABLED
+    and BUILD_AT_STARTUP are on. Workers forked afterwards (gunicorn
+    --preload) inherit it.
+    """
+    global _scheduled
+    config = get_config()
+    if _scheduled or not (config['ENABLED'] and config['BUILD_AT_STARTUP']):
+        return
+    _scheduled = True
+    os.register_at_fork(after_in_child=_reset_after_fork)
+    _build_index_in_background()
+
+
+_stats_lock = threading.Lock()
+_stats = {'local_hits': 0, 'model_fallbacks': 0, 'served_corpus': 0, 'served_generated': 0, 'stored': 0}
+
+
+def _count(name, amount=1):
+    with _stats_lock:
+        _stats[name] += amount
+
+
+def stats():
+    """
+    Per-process counters: how often the local pool answered instead of the
+    model, and how many generated recipes were added to it.
+    """
+    with _stats_lock:
+        result = dict(_stats)
+    requests = result['local_hits'] + result['model_fallbacks']
+    result['hit_rate'] = result['local_hits'] / requests if requests else 0.0
+    index = _index
+    result['indexed_recipes'] = len(index) if index is not None else None
+    return result
+
+
+def local_recipes(ingredients, index=None):
+    """
+    Recipes from the local pool good enough to answer with, or [].
+    """
+    config = get_config()
+    if not config['ENABLED']:
+        return []
+    if index is None:
+        index = get_index()
+    recipes = index.match(ingredients, config['MIN_COVERAGE'], config['MAX_RESULTS'])
+    if recipes:
+        _count('local_hits')
+        for recipe in recipes:
+            _count(f"served_{recipe['origin']}")
+    else:
+        _count('model_fallbacks')
+    return recipes
+
+
+async def alocal_recipes(ingredients):
+    index = _index
+    if _is_fresh(index):
+        return local_recipes(ingredients, index)
+    # Building the index reads the database
+    return await sync_to_async(local_recipes)(ingredients)
+
+
+def _generate(ingredients, model_name):
+    RECIPE_ANSWERS.labels('model').inc()
+    recipes_json = suggest_recipes_from_ingredients(ingredients, model_name=model_name)
+    store_generated(recipes_json, ingredients, model_name)
+    return recipes_json
+
+
+async def _agenerate(ingredients, model_name):
+    RECIPE_ANSWERS.labels('model').inc()
+    recipes_json = await suggest_recipes_from_ingredients_async(ingredients, model_name=model_name)
+    await sync_to_async(store_generated)(recipes_json, ingredients, model_name)
+    return recipes_json
+
+
+def suggest_recipes(ingredients, model_name, bypass=False):
+    """
+    Answers from the local pool when it covers the pantry well enough,
+    otherwise asks the model picked by the router (through the recipe cache)
+    and keeps what it generates. `model_name` is the client's hint. Returns
+    JSON text either way, like suggest_recipes_from_ingredients.
+    """
+    recipes = local_recipes(ingredients)
+    if recipes:
+        RECIPE_ANSWERS.labels('local').inc()
+        return dumps(recipes)
+    route = get_router().route(ingredients, hint=model_name)
+    return recipe_cache.get_or_compute(
+        route.ingredients, route.model, lambda: _generate(route.ingredients, route.model), bypass=bypass
+    )
+
+
+async def asuggest_recipes(ingredients, model_name, bypass=False):
+    recipes = await alocal_recipes(ingredients)
+    if recipes:
+        RECIPE_ANSWERS.labels('local').inc()
+        return dumps(recipes)
+    route = get_router().route(ingredients, hint=model_name)
+    return await recipe_cache.aget_or_compute(
+        route.ingredients, route.model, lambda: _agenerate(route.ingredients, route.model), bypass=bypass
+    )
@@ -0,0 +1,63 @@
+from .model_output import parse_recipe
+
+
+class RecipeArrayParser:
+    """
+    Incremental parser for a streamed JSON array of recipe objects.
+
+    feed() takes text chunks as they arrive and returns the top-level objects
+    completed by that chunk, so the first recipe can be sent before the model
+    has finished the rest. Anything before the opening '[' (such as a ```json
+    fence) and between objects is skipped. Objects are validated like
+    complete answers (services/model_output.py); `failures` counts the
+    ones dropped.
+    """
+
+    def __init__(self):
+        self.started = False
+        self.failures = 0
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, chunk):
+        completed = []
+        for char in chunk:
+            if not self.started:
+                self.started = char == '['
+                continue
+
+            if self._depth == 0:
+                # Between objects: only an opening brace matters
+                if char == '{':
+                    self._depth = 1
+                    self._buffer = [char]
+                continue
+
+            self._buffer.append(char)
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == '\\':
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 0:
+                    completed.append(''.join(self._buffer))
+                    self._buffer = []
+
+        recipes = []
+        for text in completed:
+            recipe = parse_recipe(text)
+            if recipe is None:
+                self.failures += 1
+            else:
+                recipes.append(recipe)
+        return recipes
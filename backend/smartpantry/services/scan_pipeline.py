@@ -0,0 +1,89 @@
+"""
+The stages of an ingredient scan, shared by the scan view and the
+background scan workers (services/job_queue.py).
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection
+
+from ..models import Ingredient
+from .google_gemini_service import identify_ingredients
+from .image_cache import image_cache
+from .canonical import canonical_names
+from .expiry import default_expiration_date
+from .image_ingest import ImageIngestError, prepare_image
+from .metrics import timed
+from .model_output import parse_recipes
+from .recipe_service import suggest_recipes
+
+logger = logging.getLogger(__name__)
+
+
+def parse_detected_names(raw_text):
+    return canonical_names(raw_text.split(','))
+
+
+def load_recipes(recipes_json):
+    return parse_recipes(recipes_json, source='recipes')
+
+
+@timed('identify')
+def identify_stage(image_bytes, mime_type, bypass=False, image=None):
+    # Re-uploads of the same (or a near-identical) photo skip the vision call
+    raw_text = image_cache.get_or_identify(
+        image_bytes,
+        lambda: identify_ingredients(image_bytes, mime_type=mime_type),
+        bypass=bypass,
+        image=image,
+    )
+    return parse_detected_names(raw_text)
+
+
+def _identify_upload(index, upload, bypass):
+    try:
+        prepared = prepare_image(upload)
+        names = identify_stage(prepared.data, prepared.mime_type, bypass=bypass, image=prepared.image)
+        return {"index": index, "name": upload.name, "detected_ingredients": names}
+    except ImageIngestError as e:
+        return {"index": index, "name": upload.name, "error": str(e)}
+    except Exception as e:
+        logger.exception("Batch scan of image %d failed", index)
+        return {"index": index, "name": upload.name, "error": str(e)}
+    finally:
+        # Each pool thread opens its own DB connection for the image cache
+        connection.close()
+
+
+def identify_batch(uploads, concurrency, bypass=False):
+    """
+    Runs the identify stage on several uploads at once, at most `concurrency`
+    at a time. Returns one result per upload, in order; a failed image gets an
+    "error" entry instead of failing the whole batch.
+    """
+    if not uploads:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(uploads)))) as pool:
+        return list(pool.map(
+            lambda item: _identify_upload(item[0], item[1], bypass), enumerate(uploads)
+        ))
+
+
+def union_detected(results):
+    # Keeps first-seen order so the response reads like the photos were taken
+    return list(dict.fromkeys(
+        name for result in results for name in result.get("detected_ingredients", [])
+    ))
+
+
+@timed('merge')
+def merge_stage(user, detected_names):
+    # Rescanning the same shelf should not double what is already there
+    Ingredient.objects.merge_pantry(
+        user, detected_names, expiration_date=default_expiration_date(), increment=False
+    )
+
+
+@timed('recipes')
+def recipes_stage(detected_names, model_name, bypass=False):
+    return suggest_recipes(detected_names, model_name, bypass=bypass)
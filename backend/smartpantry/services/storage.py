@@ -0,0 +1,101 @@
+"""
+Storage tuning for concurrent writers.
+
+SQLite (the default database) is set up on every new connection through
+the connection_created signal (see signals.py):
+
+- journal_mode=WAL lets readers carry on while a writer commits;
+- busy_timeout makes a writer wait for the lock instead of failing at once;
+- synchronous=NORMAL, safe with WAL, skips an fsync per commit.
+
+DATABASES also opens SQLite transactions with BEGIN IMMEDIATE, so a
+transaction takes the write lock up front instead of failing with "database
+is locked" when it tries to upgrade a read lock held alongside another
+writer. A writer can still give up after busy_timeout under a burst;
+functions decorated with @retry_on_locked then rerun their whole
+transaction with jittered backoff. The same decorator retries Postgres
+serialization failures and deadlocks.
+
+Postgres is selected with DATABASE_ENGINE=postgres (see settings.py).
+"""
+import functools
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from tenacity import Retrying, retry_if_exception, stop_after_attempt, wait_random_exponential
+
+from .metrics import DB_WRITE_RETRIES
+
+# Defaults, overridable through settings.STORAGE
+DEFAULTS = {
+    # PRAGMAs run on every new SQLite connection, in this order
+    'SQLITE_PRAGMAS': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,       # milliseconds
+        'synchronous': 'NORMAL',
+    },
+    'WRITE_RETRY_ATTEMPTS': 4,      # total attempts, including the first
+    'WRITE_RETRY_BASE_WAIT': 0.05,  # seconds, doubled per attempt before jitter
+    'WRITE_RETRY_MAX_WAIT': 1.0,
+}
+
+LOCKED_MESSAGES = ('database is locked', 'database table is locked')
+# Postgres serialization_failure and deadlock_detected
+RETRYABLE_PGCODES = ('40001', '40P01')
+
+
+def get_config():
+    config = dict(DEFAULTS)
+    config.update(getattr(settings, 'STORAGE', {}))
+    return config
+
+
+def configure_connection(connection):
+    """
+    Applies SQLITE_PRAGMAS to a new SQLite connection; other backends are
+    left alone.
+    """
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for name, value in get_config()['SQLITE_PRAGMAS'].items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+
+
+def is_lock_error(exc):
+    if not isinstance(exc, OperationalError):
+        return False
+    if any(message in str(exc) for message in LOCKED_MESSAGES):
+        return True
+    return getattr(exc.__cause__, 'pgcode', None) in RETRYABLE_PGCODES
+
+
+def retry_on_locked(func=None, *, using=DEFAULT_DB_ALIAS):
+    """
+    Reruns `func` when it fails on a locked database. Only retries when the
+    failed transaction was the outermost one: inside a caller's atomic
+    block the error is raised as is, since that transaction is already
+    broken.
+    """
+    if func is None:
+        return functools.partial(retry_on_locked, using=using)
+
+    def retryable(exc):
+        return is_lock_error(exc) and not connections[using].in_atomic_block
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        config = get_config()
+        for attempt in Retrying(
+            stop=stop_after_attempt(config['WRITE_RETRY_ATTEMPTS']),
+            wait=wait_random_exponential(
+                multiplier=config['WRITE_RETRY_BASE_WAIT'], max=config['WRITE_RETRY_MAX_WAIT']
+            ),
+            retry=retry_if_exception(retryable),
+            before_sleep=lambda state: DB_WRITE_RETRIES.labels(func.__name__).inc(),
+            reraise=True,
+        ):
+            with attempt:
+                return func(*args, **kwargs)
+
+    return wrapper
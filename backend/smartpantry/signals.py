@@ -0,0 +1,41 @@
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .authentication import evict_user
+from .middleware import install_query_timer
+from .models import CustomUser, Ingredient, Recipe, bump_pantry_version
+from .services.recipe_service import invalidate_index
+from .services.storage import configure_connection
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_changed(sender, instance, **kwargs):
+    bump_pantry_version(instance.user_id)
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(sender, instance, **kwargs):
+    # Removing a tombstone leaves the visible pantry as it was
+    if instance.deleted_at is None:
+        bump_pantry_version(instance.user_id)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def user_changed(sender, instance, **kwargs):
+    # Covers deactivation and password changes; pantry_version bumps are
+    # queryset updates and send no signal, so they don't evict
+    evict_user(instance.pk)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    invalidate_index()
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    configure_connection(connection)
+    install_query_timer(connection)
@@ -0,0 +1,48 @@
+"""
+Test helpers.
+
+query_budget(n) fails a test when the block or test method runs more than n
+SQL queries, listing the queries it saw. Unlike assertNumQueries it allows
+fewer, so a budget only has to be touched when a path gets slower:
+
+    @query_budget(3)
+    def test_pantry_list(self):
+        ...
+
+    with query_budget(2):
+        self.client.get(url)
+"""
+from contextlib import ContextDecorator
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import CaptureQueriesContext
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class query_budget(ContextDecorator):
+
+    def __init__(self, limit, using=DEFAULT_DB_ALIAS):
+        self.limit = limit
+        self.using = using
+
+    def _recreate_cm(self):
+        return type(self)(self.limit, self.using)
+
+    def __enter__(self):
+        self.context = CaptureQueriesContext(connections[self.using])
+        self.context.__enter__()
+        return self.context
+
+    def __exit__(self, exc_type, exc, tb):
+        self.context.__exit__(exc_type, exc, tb)
+        if exc_type is None and len(self.context) > self.limit:
+            queries = "\n".join(
+                f"{number}. {query['sql']}" for number, query in enumerate(self.context.captured_queries, 1)
+            )
+            raise QueryBudgetExceeded(
+                f"{len(self.context)} queries executed, budget is {self.limit}:\n{queries}"
+            )
+        return False
@@ -1,3 +1,959 @@
-from django.test import TestCase
+import asyncio
+import base64
+import io
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.core.exceptions import ImproperlyConfigured
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import IntegrityError, transaction
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from PIL import Image, ImageDraw
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from .authentication import user_cache
+from .models import CustomUser, Ingredient, Recipe, ScanJob, ScanResultCache
+from .serializers import IngredientOperationSerializer
+from .services import google_gemini_service, recipe_service, scan_pipeline
+from .services.canonical import Canonicalizer, singular
+from .services.governor import DEFAULTS as GOVERNOR_DEFAULTS, CallInterrupted, ModelCallGovernor
+from .services.image_cache import ImageDedupeCache, get_config as image_cache_config
+from .services.image_ingest import ImageIngestError, get_config as ingest_config, prepare_image
+from .services.model_output import parse_recipes
+from .services.model_router import ModelRouter, get_config as router_config
+from .services.providers import OFFLINE_INGREDIENTS, OfflineProvider, ProviderError, reset_providers
+from .services.recipe_cache import RecipeCache, get_config as recipe_cache_config, recipe_cache
+from .testing import QueryBudgetExceeded, query_budget
+
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-default'},
+    'recipes': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tests-recipes'},
+}
+OFFLINE_PROVIDERS = {
+    'offline': {'BACKEND': 'smartpantry.services.providers.OfflineProvider', 'OPTIONS': {}},
+}
+
+
+def make_image(color):
+    # A shape on a plain background: a solid-colour photo is too flat for the image cache
+    image = Image.new('RGB', (64, 64), color)
+    ImageDraw.Draw(image).rectangle((8, 8, 40, 56), fill=(20, 200, 20))
+    buffer = io.BytesIO()
+    image.save(buffer, 'JPEG')
+    buffer.seek(0)
+    buffer.name = 'shelf.jpg'
+    return buffer
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    MODEL_PROVIDER='offline',
+    MODEL_PROVIDERS=OFFLINE_PROVIDERS,
+    SCAN_JOBS={'IN_PROCESS': False},
+)
+class QueryBudgetTests(TestCase):
+    """
+    Upper bounds on the SQL queries of the hot endpoints, measured with a
+    cold user cache. None of them may grow with the size of the pantry or
+    the number of detected ingredients.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        expires = date.today() + timedelta(days=3)
+        Ingredient.objects.bulk_create([
+            Ingredient(user=cls.user, name=f'item {chr(97 + n)}', quantity=1, expiration_date=expires)
+            for n in range(26)
+        ])
+
+    def setUp(self):
+        reset_providers()
+        user_cache.clear()
+        recipe_service.invalidate_index()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_pantry_list(self):
+        with query_budget(3):
+            response = self.client.get('/api/ingredients/?page_size=50', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 26)
+
+    def test_pantry_list_not_modified(self):
+        etag = self.client.get('/api/ingredients/', **self.auth)['ETag']
+        user_cache.clear()
+        with query_budget(2):
+            response = self.client.get('/api/ingredients/', HTTP_IF_NONE_MATCH=etag, **self.auth)
+        self.assertEqual(response.status_code, 304)
+
+    def test_ingredient_detail(self):
+        ingredient = Ingredient.objects.filter(user=self.user).first()
+        with query_budget(2):
+            response = self.client.get(f'/api/ingredients/{ingredient.pk}/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_ingredient_create(self):
+        body = {'name': 'Fresh Tomatoes', 'quantity': 2, 'expiration_date': '2030-01-01'}
+        with query_budget(6):
+            response = self.client.post('/api/ingredients/', body, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['name'], 'tomato')
+
+    def test_bulk_operations(self):
+        ids = list(Ingredient.objects.filter(user=self.user).values_list('pk', flat=True)[:10])
+        operations = (
+            [{'op': 'create', 'name': f'new {chr(97 + n)}', 'quantity': 1, 'expiration_date': '2030-01-01'} for n in range(10)]
+            + [{'op': 'update', 'id': pk, 'quantity': 5} for pk in ids[:5]]
+            + [{'op': 'delete', 'id': pk} for pk in ids[5:]]
+        )
+        with query_budget(10):
+            response = self.client.post(
+                '/api/ingredients/bulk/', {'operations': operations}, content_type='application/json', **self.auth
+            )
+        self.assertEqual(response.status_code, 200)
+
+    def test_changes_feed(self):
+        with query_budget(3):
+            response = self.client.get('/api/ingredients/changes/', **self.auth)
+        self.assertEqual(response.status_code, 200)
+
+    def test_expiring_soon(self):
+        with query_budget(2):
+            response = self.client.get('/api/ingredients/expiring/?within=7d', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['items']), 26)
+
+    def test_scan(self):
+        # A cold scan: image-cache miss and store, the pantry merge (a fixed
+        # number of queries however many items are detected), the recipe
+        # index build and storing the generated recipes
+        with query_budget(18):
+            response = self.client.post('/api/ingredients/scan/', {'image': make_image((200, 40, 40))}, **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['detected_ingredients'])
+
+    def test_suggest_recipes_from_local_pool(self):
+        body = {'ingredients': ['egg', 'milk', 'butter']}
+        with query_budget(2):
+            response = self.client.post('/api/recipes/suggest/', body, content_type='application/json', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['recipes'][0]['source'], 'local')
+
+
+class QueryBudgetHelperTests(TestCase):
+
+    def test_allows_fewer_queries(self):
+        with query_budget(2) as queries:
+            CustomUser.objects.count()
+        self.assertEqual(len(queries), 1)
+
+    def test_fails_over_budget(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            with query_budget(1):
+                CustomUser.objects.count()
+                CustomUser.objects.exists()
+
+    def test_as_decorator(self):
+        @query_budget(0)
+        def runs_a_query():
+            CustomUser.objects.count()
+
+        with self.assertRaises(QueryBudgetExceeded):
+            runs_a_query()
+
+
+class GovernorTests(TestCase):
+
+    def test_cancelled_call_is_not_retried(self):
+        governor = ModelCallGovernor({**GOVERNOR_DEFAULTS, 'RATE_PER_SECOND': 0})
+        upstream_calls = []
+
+        async def slow_model():
+            upstream_calls.append(1)
+            await asyncio.sleep(10)
+            return 'ok'
+
+        async def cancel_mid_request():
+            task = asyncio.ensure_future(governor.acall('key', slow_model))
+            await asyncio.sleep(0.05)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        asyncio.run(cancel_mid_request())
+        self.assertEqual(len(upstream_calls), 1)
+        self.assertEqual(governor.stats()['retries'], 0)
+        self.assertEqual(governor.stats()['in_flight'], 0)
+
+    def test_cancelled_leader_leaves_followers_their_result(self):
+        governor = ModelCallGovernor({**GOVERNOR_DEFAULTS, 'RATE_PER_SECOND': 0})
+        upstream_calls = []
+
+        async def slow_model():
+            upstream_calls.append(1)
+            await asyncio.sleep(0.1)
+            return 'ok'
+
+        async def leader_disconnects():
+            leader = asyncio.ensure_future(governor.acall('key', slow_model))
+            await asyncio.sleep(0.01)
+            follower = asyncio.ensure_future(governor.acall('key', slow_model))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        self.assertEqual(asyncio.run(leader_disconnects()), 'ok')
+        self.assertEqual(len(upstream_calls), 1)
+        self.assertEqual(governor.stats()['coalesced'], 1)
+
+    def test_breaker_counts_calls_not_attempts(self):
+        governor = ModelCallGovernor({
+            **GOVERNOR_DEFAULTS, 'RATE_PER_SECOND': 0, 'RETRY_ATTEMPTS': 3, 'RETRY_MAX_WAIT': 0.01,
+            'BREAKER_FAILURE_THRESHOLD': 2,
+        })
+
+        def failing_model():
+            raise ConnectionError("upstream down")
+
+        with self.assertRaises(ConnectionError):
+            governor.call('key', failing_model)
+        self.assertEqual(governor.stats()['upstream_calls'], 3)
+        self.assertEqual(governor.stats()['breaker_state'], 'closed')
+
+        with self.assertRaises(ConnectionError):
+            governor.call('key', failing_model)
+        self.assertEqual(governor.stats()['breaker_state'], 'open')
+
+    def test_interrupted_leader_fails_its_followers(self):
+        governor = ModelCallGovernor({**GOVERNOR_DEFAULTS, 'RATE_PER_SECOND': 0})
+        started, release = threading.Event(), threading.Event()
+        outcome = {}
+
+        def interrupted_model():
+            started.set()
+            release.wait()
+            raise SystemExit()
+
+        def leader():
+            try:
+                governor.call('key', interrupted_model)
+            except SystemExit:
+                pass
+
+        def follower():
+            try:
+                outcome['result'] = governor.call('key', lambda: 'unused')
+            except CallInterrupted as e:
+                outcome['error'] = e
+
+        threads = [threading.Thread(target=leader)]
+        threads[0].start()
+        started.wait()
+        threads.append(threading.Thread(target=follower))
+        threads[1].start()
+        while governor.stats()['coalesced'] < 1:
+            time.sleep(0.001)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertIn('error', outcome)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ProfilingMiddlewareTests(TestCase):
+    profiling = {'ENABLED': True, 'SAMPLE_RATE': 1.0, 'PROFILE': False, 'OUTPUT_DIR': None}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        Ingredient.objects.create(user=cls.user, name='egg', quantity=1, expiration_date=date.today())
+
+    def setUp(self):
+        user_cache.clear()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_disabled_leaves_the_chain(self):
+        with override_settings(REQUEST_PROFILING={**self.profiling, 'ENABLED': False}):
+            response = self.client.get('/api/ingredients/', **self.auth)
+        self.assertNotIn('Server-Timing', response)
+
+    def test_sync_request_is_timed(self):
+        with override_settings(REQUEST_PROFILING=self.profiling):
+            response = self.client.get('/api/ingredients/', **self.auth)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+    async def test_async_request_is_timed(self):
+        with override_settings(REQUEST_PROFILING=self.profiling):
+            response = await self.async_client.get('/api/ingredients/', headers={'Authorization': self.auth['HTTP_AUTHORIZATION']})
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response['Server-Timing'], r'desc="[1-9]\d* queries"')
+
+
+@override_settings(CACHES=TEST_CACHES, MODEL_PROVIDER='offline', MODEL_PROVIDERS=OFFLINE_PROVIDERS)
+class RecipeStreamTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+
+    def setUp(self):
+        reset_providers()
+        user_cache.clear()
+        recipe_service.invalidate_index()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_failed_stream_is_not_cached(self):
+        def broken_stream(ingredients, model_name):
+            yield '[{"title": "Half", "ingredients": ["saffron"], "instructions": "Stir."},'
+            raise RuntimeError("connection reset")
+
+        body = {'ingredients': ['saffron', 'quince']}
+        with mock.patch('smartpantry.views.stream_recipes_from_ingredients', broken_stream), \
+                mock.patch.object(recipe_cache, 'remember') as remember, \
+                mock.patch.object(recipe_service, 'store_generated') as store_generated:
+            response = self.client.post(
+                '/api/recipes/suggest/stream/', body, content_type='application/json', **self.auth
+            )
+            events = b''.join(response.streaming_content).decode()
+
+        self.assertIn('event: recipe', events)
+        self.assertIn('event: error', events)
+        self.assertNotIn('event: done', events)
+        remember.assert_not_called()
+        store_generated.assert_not_called()
+
+
+class CanonicalizerTests(TestCase):
+
+    def test_plurals_become_singular(self):
+        cases = {
+            'tomatoes': 'tomato', 'berries': 'berry', 'peaches': 'peach', 'boxes': 'box', 'eggs': 'egg',
+            'leaves': 'leaf', 'olives': 'olive', 'cookies': 'cookie',
+            'hummus': 'hummus', 'swiss': 'swiss', 'molasses': 'molasses', 'greens': 'greens', 'peas': 'pea',
+        }
+        self.assertEqual({word: singular(word) for word in cases}, cases)
+
+    def test_qualifiers_and_amounts_are_dropped(self):
+        canonicalizer = Canonicalizer()
+        self.assertEqual(canonicalizer('2 Large Fresh Eggs'), 'egg')
+        self.assertEqual(canonicalizer('a bag of frozen peas'), 'pea')
+        self.assertEqual(canonicalizer('fresh sliced'), '')
+
+    def test_aliases_match_the_longest_trailing_phrase(self):
+        canonicalizer = Canonicalizer()
+        self.assertEqual(canonicalizer('Roma Tomatoes'), 'tomato')
+        self.assertEqual(canonicalizer('organic cherry tomatoes'), 'tomato')
+        self.assertEqual(canonicalizer('spring onions'), 'green onion')
+        self.assertEqual(canonicalizer('diced aubergine'), 'eggplant')
+        # The whole name becomes the target of its longest aliased tail
+        self.assertEqual(canonicalizer('free range chicken eggs'), 'egg')
+        self.assertEqual(canonicalizer('chicken breasts'), 'chicken')
+
+    def test_configured_aliases_and_qualifiers_extend_the_tables(self):
+        canonicalizer = Canonicalizer(aliases={'Cavolo Nero': 'kale'}, qualifiers=['Heirloom'])
+        self.assertEqual(canonicalizer('cavolo neros'), 'kale')
+        self.assertEqual(canonicalizer('heirloom tomatoes'), 'tomato')
+        self.assertEqual(canonicalizer.many(['Eggs', 'egg', '', 'fresh', 'milk']), ['egg', 'milk'])
+
+
+class OfflineProviderTests(TestCase):
+
+    def test_answers_depend_only_on_the_input(self):
+        first, second = OfflineProvider(seed=1), OfflineProvider(seed=2)
+        image = make_image((200, 40, 40)).getvalue()
+
+        detected = first.identify(image, 'image/jpeg', 'any-model')
+        self.assertEqual(second.identify(image, 'image/jpeg', 'other-model'), detected)
+        self.assertTrue(set(detected.split(', ')) <= set(OFFLINE_INGREDIENTS))
+        self.assertNotEqual(first.identify(make_image((10, 10, 10)).getvalue(), 'image/jpeg', 'any-model'), detected)
+
+        recipes = first.suggest_recipes(['Egg', 'milk', 'butter', 'egg'], 'any-model')
+        self.assertEqual(second.suggest_recipes([' butter', 'egg', 'milk'], 'other-model'), recipes)
+        self.assertEqual(''.join(second.stream_recipes(['egg', 'milk', 'butter'], 'any-model')), recipes)
+        for recipe in json.loads(recipes):
+            self.assertTrue(set(recipe['ingredients']) <= {'egg', 'milk', 'butter'})
+
+    def test_errors_are_reproducible_from_the_seed(self):
+        def outcomes(provider):
+            results = []
+            for _ in range(20):
+                try:
+                    provider.suggest_recipes(['egg'], 'any-model')
+                    results.append(True)
+                except ProviderError:
+                    results.append(False)
+            return results
+
+        run = outcomes(OfflineProvider(error_rate=0.5, seed=7))
+        self.assertEqual(outcomes(OfflineProvider(error_rate=0.5, seed=7)), run)
+        self.assertIn(True, run)
+        self.assertIn(False, run)
+
+    async def test_async_answers_match_the_sync_ones(self):
+        provider = OfflineProvider()
+        image = make_image((200, 40, 40)).getvalue()
+        self.assertEqual(
+            await provider.aidentify(image, 'image/jpeg', 'any-model'),
+            provider.identify(image, 'image/jpeg', 'any-model'),
+        )
+        self.assertEqual(
+            await provider.asuggest_recipes(['egg', 'milk'], 'any-model'),
+            provider.suggest_recipes(['egg', 'milk'], 'any-model'),
+        )
+
+
+@override_settings(CACHES=TEST_CACHES)
+class RecipeCacheTests(TestCase):
+
+    def setUp(self):
+        caches['recipes'].clear()
+        self.cache = RecipeCache(recipe_cache_config())
+        self.calls = []
+
+    def compute(self):
+        self.calls.append(1)
+        return f'[{{"title": "answer {len(self.calls)}"}}]'
+
+    def test_equivalent_pantries_share_an_entry(self):
+        first = self.cache.get_or_compute(['Milk', 'eggs'], 'gemini', self.compute)
+        self.assertEqual(self.cache.get_or_compute(['egg', 'fresh milk', 'eggs'], 'gemini', self.compute), first)
+        self.assertEqual(len(self.calls), 1)
+        self.cache.get_or_compute(['egg', 'milk'], 'other-model', self.compute)
+        self.assertEqual(len(self.calls), 2)
+
+    def test_shared_tier_hits_are_promoted_to_the_local_tier(self):
+        self.cache.remember(['egg'], 'gemini', '[{"title": "omelette"}]')
+        self.cache.local.clear()
+
+        self.assertEqual(self.cache.lookup(['egg'], 'gemini'), '[{"title": "omelette"}]')
+        self.assertEqual(self.cache.lookup(['egg'], 'gemini'), '[{"title": "omelette"}]')
+        stats = self.cache.stats()
+        self.assertEqual((stats['shared_hits'], stats['local_hits'], stats['local_entries']), (1, 1, 1))
+
+    def test_bypass_refreshes_the_entry(self):
+        self.cache.get_or_compute(['egg'], 'gemini', self.compute)
+        fresh = self.cache.get_or_compute(['egg'], 'gemini', self.compute, bypass=True)
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertEqual(self.cache.lookup(['egg'], 'gemini'), fresh)
+        self.assertEqual(self.cache.stats()['bypassed'], 1)
+
+    def test_empty_answers_are_not_stored(self):
+        for value in ('', '[]', ' [] '):
+            self.cache.remember(['egg'], 'gemini', value)
+            self.assertEqual(self.cache.get_or_compute(['egg'], 'gemini', lambda: value), value)
+        self.assertIsNone(self.cache.lookup(['egg'], 'gemini'))
+        stats = self.cache.stats()
+        self.assertEqual((stats['stores'], stats['misses'], stats['hit_rate']), (0, 4, 0.0))
+
+    def test_disabled_cache_always_computes(self):
+        cache = RecipeCache({**recipe_cache_config(), 'ENABLED': False})
+        for _ in range(2):
+            cache.get_or_compute(['egg'], 'gemini', self.compute)
+        cache.remember(['egg'], 'gemini', '[{"title": "omelette"}]')
+
+        self.assertEqual(len(self.calls), 2)
+        self.assertIsNone(cache.lookup(['egg'], 'gemini'))
+        self.assertEqual(cache.stats()['stores'], 0)
+
+
+class ImageCacheTests(TestCase):
+
+    def test_flat_photos_are_not_matched(self):
+        cache = ImageDedupeCache(image_cache_config())
+        calls = []
+
+        def identify():
+            calls.append(1)
+            return f"detection {len(calls)}"
+
+        for color in ((200, 40, 40), (10, 10, 10)):
+            image_bytes = make_image(color).getvalue()
+            flat = io.BytesIO()
+            Image.new('RGB', (64, 64), color).save(flat, 'JPEG')
+            cache.get_or_identify(flat.getvalue(), identify)
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(cache.stats()['low_detail'], 2)
+
+        self.assertEqual(cache.get_or_identify(image_bytes, identify), "detection 3")
+        self.assertEqual(cache.get_or_identify(image_bytes, identify), "detection 3")
+
+    def test_evicts_once_every_evict_every_new_rows(self):
+        cache = ImageDedupeCache({**image_cache_config(), 'MAX_ENTRIES': 1, 'EVICT_EVERY': 3})
+        for n in range(2):
+            cache.store(f'digest {n}', n, 'detection')
+        cache.store('digest 1', 1, 'detection')  # an update, not a new row
+        self.assertEqual(ScanResultCache.objects.count(), 2)
+
+        cache.store('digest 2', 2, 'detection')
+        self.assertEqual(ScanResultCache.objects.count(), 1)
+        self.assertEqual(cache.stats()['evicted'], 2)
+
+    def test_max_distance_is_limited_by_the_bands(self):
+        with override_settings(IMAGE_CACHE={'MAX_DISTANCE': 4}):
+            with self.assertRaises(ImproperlyConfigured):
+                image_cache_config()
+
+
+class ModelRouterTests(TestCase):
+
+    def test_unhealthy_model_recovers_when_its_failures_age_out(self):
+        router = ModelRouter(router_config())
+        model = 'gemini-2.5-flash'
+        with mock.patch('smartpantry.services.model_router.time.monotonic', return_value=1000.0):
+            for _ in range(10):
+                router.record(model, 1.0, ok=False)
+            self.assertEqual(router.route(['egg'], hint=model).reason, 'hint refused: unhealthy; fastest')
+
+        later = 1000.0 + router.config['SAMPLE_MAX_AGE'] + 1
+        with mock.patch('smartpantry.services.model_router.time.monotonic', return_value=later):
+            decision = router.route(['egg'], hint=model)
+        self.assertEqual((decision.model, decision.reason), (model, 'hint'))
+
+    def test_only_recipe_calls_feed_the_router(self):
+        with mock.patch('smartpantry.services.google_gemini_service.get_router') as get_router:
+            google_gemini_service._record('identify', 'gemini-2.5-flash', 1.0, ok=False)
+            get_router.return_value.record.assert_not_called()
+            google_gemini_service._record('recipes', 'gemini-2.5-flash', 1.0, ok=True)
+            get_router.return_value.record.assert_called_once_with('gemini-2.5-flash', 1.0, True)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ChangesFeedTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        Ingredient.objects.create(user=cls.user, name='egg', quantity=1, expiration_date=date.today())
+
+    def setUp(self):
+        user_cache.clear()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def test_limit_is_validated(self):
+        response = self.client.get('/api/ingredients/changes/?limit=-5', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['changes']), 1)
+        response = self.client.get('/api/ingredients/changes/?limit=ten', **self.auth)
+        self.assertEqual(response.status_code, 400)
+
+    def test_empty_feed_returns_a_cursor_from_the_start(self):
+        Ingredient.objects.filter(user=self.user).update(deleted_at=timezone.now())
+        response = self.client.get('/api/ingredients/changes/', **self.auth)
+        self.assertEqual(response.json()['changes'], [])
+        cursor = response.json()['cursor']
+        self.assertEqual(base64.urlsafe_b64decode(cursor).decode(), '1970-01-01T00:00:00+00:00|0')
+
+        # The start cursor is older than the tombstone retention but never expires
+        response = self.client.get(f'/api/ingredients/changes/?since={cursor}', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([change['deleted'] for change in response.json()['changes']], [True])
+
+    def test_naive_cursor_is_read_as_utc(self):
+        since = base64.urlsafe_b64encode(f"{date.today().isoformat()}T00:00:00|0".encode()).decode()
+        response = self.client.get(f'/api/ingredients/changes/?since={since}', **self.auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['changes']), 1)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class CachedAuthenticationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+
+    def setUp(self):
+        user_cache.clear()
+
+    def get(self, token):
+        return self.client.get('/api/ingredients/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_deactivated_user_is_rejected_within_the_ttl(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get(token).status_code, 200)
+
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save()
+
+        self.assertEqual(self.get(token).status_code, 401)
+
+    # simplejwt rebinds its settings on override_settings, which modules that
+    # imported api_settings never see, so the flag is patched in place
+    @mock.patch.object(jwt_settings, 'CHECK_REVOKE_TOKEN', True)
+    def test_password_change_revokes_cached_tokens(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get(token).status_code, 200)
+
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.set_password('changed')
+        user.save()
+
+        self.assertEqual(self.get(token).status_code, 401)
+        self.assertEqual(self.get(RefreshToken.for_user(user).access_token).status_code, 200)
+
+    def test_disabled_cache_loads_the_user_every_time(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.assertEqual(self.get(token).status_code, 200)
+        # Queryset updates send no signal, so only an uncached lookup sees this
+        CustomUser.objects.filter(pk=self.user.pk).update(is_active=False)
+        self.assertEqual(self.get(token).status_code, 200)
+
+        with override_settings(AUTH_USER_CACHE={'ENABLED': False}):
+            self.assertEqual(self.get(token).status_code, 401)
+
+
+class MergePantryTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+
+    def setUp(self):
+        Ingredient.objects.create(user=self.user, name='egg', quantity=2, expiration_date=date.today())
+
+    def version(self):
+        return CustomUser.objects.get(pk=self.user.pk).pantry_version
+
+    def quantities(self):
+        return dict(Ingredient.objects.filter(user=self.user).values_list('name', 'quantity'))
+
+    def test_increment_adds_to_existing_rows(self):
+        version = self.version()
+        # Plus the savepoint and its release, as TestCase runs inside a transaction
+        with query_budget(5):
+            Ingredient.objects.merge_pantry(self.user, ['egg', 'milk', ('egg', 2)], date.today())
+        self.assertEqual(self.quantities(), {'egg': 5, 'milk': 1})
+        self.assertEqual(self.version(), version + 1)
+
+    def test_without_increment_existing_rows_are_kept(self):
+        version = self.version()
+        Ingredient.objects.merge_pantry(self.user, ['egg', 'milk'], date.today(), increment=False)
+        self.assertEqual(self.quantities(), {'egg': 2, 'milk': 1})
+        self.assertEqual(self.version(), version + 1)
+
+        # Just the SELECT, inside its savepoint
+        with query_budget(3):
+            Ingredient.objects.merge_pantry(self.user, ['egg', 'milk'], date.today(), increment=False)
+        self.assertEqual(self.quantities(), {'egg': 2, 'milk': 1})
+        self.assertEqual(self.version(), version + 1)
+
+    def test_deleted_names_come_back_as_new_live_rows(self):
+        Ingredient.objects.filter(user=self.user, name='egg').update(deleted_at=timezone.now())
+        for increment in (False, True):
+            Ingredient.objects.merge_pantry(self.user, ['egg'], date.today(), increment=increment)
+        self.assertEqual(self.quantities(), {'egg': 2})
+        self.assertEqual(Ingredient.all_objects.filter(user=self.user, name='egg').count(), 2)
+
+    def test_one_live_row_per_name(self):
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Ingredient.objects.create(user=self.user, name='egg', quantity=1, expiration_date=date.today())
+
+
+class CanonicalizePantryTests(TestCase):
+
+    def test_merges_rows_that_share_a_canonical_name(self):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        other = CustomUser.objects.create_user(username='chef', email='chef@example.com', password='x')
+        today = date.today()
+        legacy = [('Tomatoes', 2, 3), ('tomato', 1, 5), ('Fresh Eggs', 6, 9), ('fresh', 1, 9), ('milk', 1, 2)]
+        rows = {
+            name: Ingredient.objects.create(
+                user=user, name=name, quantity=quantity, expiration_date=today + timedelta(days=days)
+            )
+            for name, quantity, days in legacy
+        }
+        tombstone = Ingredient.objects.create(user=user, name='tomatoes', quantity=1, expiration_date=today)
+        Ingredient.objects.filter(pk=tombstone.pk).update(deleted_at=timezone.now())
+        untouched = Ingredient.objects.create(user=other, name='milk', quantity=1, expiration_date=today)
+        version = CustomUser.objects.get(pk=user.pk).pantry_version
+
+        call_command('canonicalize_pantry', stdout=io.StringIO())
+
+        live = {row.name: row for row in Ingredient.objects.filter(user=user)}
+        self.assertEqual(set(live), {'tomato', 'egg', 'fresh', 'milk'})
+        self.assertEqual(live['tomato'].pk, rows['tomato'].pk)
+        self.assertEqual((live['tomato'].quantity, live['tomato'].expiration_date), (3, today + timedelta(days=3)))
+        self.assertEqual((live['egg'].pk, live['egg'].quantity), (rows['Fresh Eggs'].pk, 6))
+        self.assertIsNotNone(Ingredient.all_objects.get(pk=rows['Tomatoes'].pk).deleted_at)
+        self.assertEqual(Ingredient.all_objects.get(pk=tombstone.pk).name, 'tomatoes')
+        self.assertEqual(CustomUser.objects.get(pk=user.pk).pantry_version, version + 1)
+        self.assertEqual(Ingredient.objects.get(pk=untouched.pk).updated_at, untouched.updated_at)
+
+        out = io.StringIO()
+        call_command('canonicalize_pantry', stdout=out)
+        self.assertIn("Rewrote 0 ingredients", out.getvalue())
+
+
+class CompactTombstonesTests(TestCase):
+
+    def test_purges_old_tombstones_without_bumping_the_pantry_version(self):
+        user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        Ingredient.objects.bulk_create([
+            Ingredient(user=user, name=f'item {n}', quantity=1, expiration_date=date.today()) for n in range(3)
+        ])
+        Ingredient.all_objects.filter(user=user, name__in=['item 0', 'item 1']).update(
+            deleted_at=timezone.now() - timedelta(days=400)
+        )
+        version = CustomUser.objects.get(pk=user.pk).pantry_version
+
+        with query_budget(4):
+            call_command('compact_tombstones', days=30, stdout=io.StringIO())
+
+        self.assertEqual(list(Ingredient.all_objects.filter(user=user).values_list('name', flat=True)), ['item 2'])
+        self.assertEqual(CustomUser.objects.get(pk=user.pk).pantry_version, version)
+
+
+class RecipeIndexTests(TestCase):
+
+    def test_generated_recipes_extend_the_live_index(self):
+        recipe_service.invalidate_index()
+        index = recipe_service.get_index()
+        answer = '[{"title": "Quince Saffron Rice", "ingredients": ["quince", "saffron", "rice"], "instructions": "Cook."}]'
+
+        with query_budget(2):
+            self.assertEqual(recipe_service.store_generated(answer, ['quince', 'saffron', 'rice'], 'gemini-2.0-flash'), 1)
+        self.assertEqual(recipe_service.store_generated(answer, ['quince', 'saffron', 'rice'], 'gemini-2.0-flash'), 0)
+
+        self.assertIs(recipe_service.get_index(), index)
+        with query_budget(0):
+            recipes = recipe_service.local_recipes(['quince', 'saffron', 'rice'])
+        self.assertEqual([recipe['title'] for recipe in recipes], ['Quince Saffron Rice'])
+
+    def test_recipes_stored_during_a_rebuild_reach_the_new_index(self):
+        recipe_service.invalidate_index()
+        stale = recipe_service.get_index()
+        quince = Recipe(
+            title='Quince Saffron Rice', fingerprint='quince', ingredients=['quince', 'saffron', 'rice'],
+            instructions='Cook.', source=Recipe.SOURCE_GENERATED,
+        )
+        served = []
+        build = recipe_service.RecipeIndex
+
+        def build_slowly(rows):
+            index = build(rows)
+            # Readers keep the stale index while the table is being read
+            served.append(recipe_service.get_index())
+            recipe_service.add_to_index([quince])
+            return index
+
+        with mock.patch.object(stale, 'built_at', stale.built_at - 10 ** 6), \
+                mock.patch.object(recipe_service, 'RecipeIndex', build_slowly):
+            index = recipe_service.get_index()
+
+        self.assertIs(served[0], stale)
+        self.assertIsNot(index, stale)
+        self.assertIs(recipe_service.get_index(), index)
+        self.assertEqual([r['title'] for r in index.match(['quince', 'saffron', 'rice'], 1.0)], ['Quince Saffron Rice'])
+
+    async def test_async_lookup_builds_a_stale_index_off_the_event_loop(self):
+        recipe_service.invalidate_index()
+        loop_thread = threading.get_ident()
+        build = recipe_service.RecipeIndex
+        threads = []
+
+        def build_recording(rows):
+            threads.append(threading.get_ident())
+            return build(rows)
+
+        with mock.patch.object(recipe_service, 'RecipeIndex', build_recording):
+            await recipe_service.alocal_recipes(['egg'])
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], loop_thread)
+
+
+class ModelOutputTests(TestCase):
+
+    def test_unparseable_answer_is_counted_and_logged(self):
+        def failures():
+            return REGISTRY.get_sample_value('smartpantry_json_parse_failures_total', {'source': 'model'}) or 0
+
+        before = failures()
+        with self.assertLogs('smartpantry.services.model_output', 'WARNING') as logs:
+            self.assertEqual(parse_recipes("Sorry, I can't help with that.", source='model'), [])
+        self.assertEqual(failures(), before + 1)
+        self.assertIn('model answer', logs.output[0])
+
+
+@override_settings(
+    CACHES=TEST_CACHES,
+    MODEL_PROVIDER='offline',
+    MODEL_PROVIDERS=OFFLINE_PROVIDERS,
+    BATCH_SCAN={'MAX_IMAGES': 3, 'CONCURRENCY': 2},
+)
+class BatchScanTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+
+    def setUp(self):
+        reset_providers()
+        user_cache.clear()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+        # The pool threads would query the image cache on connections of their own
+        patcher = mock.patch.object(
+            scan_pipeline.image_cache, 'get_or_identify', lambda image_bytes, identify, **kwargs: identify()
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def post(self, images):
+        return self.client.post('/api/ingredients/scan/batch/', {'images': images}, **self.auth)
+
+    def test_a_failed_image_does_not_fail_the_batch(self):
+        broken = io.BytesIO(b'not an image')
+        broken.name = 'broken.jpg'
+        response = self.post([make_image((200, 40, 40)), broken])
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual([image['name'] for image in body['images']], ['shelf.jpg', 'broken.jpg'])
+        self.assertEqual(body['images'][1]['error'], "Could not read image.")
+        self.assertTrue(body['images'][0]['detected_ingredients'])
+        self.assertEqual(body['detected_ingredients'], body['images'][0]['detected_ingredients'])
+        self.assertEqual(
+            set(Ingredient.objects.filter(user=self.user).values_list('name', flat=True)),
+            set(body['detected_ingredients']),
+        )
+
+    def test_too_many_images_are_rejected(self):
+        response = self.post([make_image((200, 40, 40)) for _ in range(4)])
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Ingredient.objects.filter(user=self.user).exists())
+
+
+@override_settings(CACHES=TEST_CACHES)
+class ScanJobTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+
+    def setUp(self):
+        user_cache.clear()
+        self.token = str(RefreshToken.for_user(self.user).access_token)
+
+    def make_job(self, status, **fields):
+        return ScanJob.objects.create(
+            user=self.user, status=status, image=b'jpeg', mime_type='image/jpeg', model_name='', **fields
+        )
+
+    def test_purge_removes_old_finished_jobs(self):
+        old = timezone.now() - timedelta(days=2)
+        done = self.make_job(ScanJob.STATUS_SUCCEEDED)
+        failed = self.make_job(ScanJob.STATUS_FAILED)
+        queued = self.make_job(ScanJob.STATUS_QUEUED)
+        recent = self.make_job(ScanJob.STATUS_SUCCEEDED)
+        ScanJob.objects.filter(pk__in=[done.pk, failed.pk, queued.pk]).update(updated_at=old)
+
+        call_command('purge_scan_jobs', hours=24, stdout=io.StringIO())
+
+        self.assertEqual(set(ScanJob.objects.values_list('pk', flat=True)), {queued.pk, recent.pk})
+
+    async def test_async_status_returns_a_finished_job_at_once(self):
+        job = await sync_to_async(self.make_job)(ScanJob.STATUS_SUCCEEDED, result={'detected_ingredients': []})
+        response = await self.async_client.get(
+            f'/api/async/jobs/{job.pk}/?wait=30', headers={'Authorization': f'Bearer {self.token}'}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['status'], ScanJob.STATUS_SUCCEEDED)
+
+
+@override_settings(CACHES=TEST_CACHES)
+class BulkOperationsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='cook', email='cook@example.com', password='x')
+        cls.egg = Ingredient.objects.create(user=cls.user, name='egg', quantity=1, expiration_date=date.today())
+
+    def setUp(self):
+        user_cache.clear()
+        token = RefreshToken.for_user(self.user).access_token
+        self.auth = {'HTTP_AUTHORIZATION': f'Bearer {token}'}
+
+    def post(self, operations):
+        return self.client.post(
+            '/api/ingredients/bulk/', {'operations': operations}, content_type='application/json', **self.auth
+        )
+
+    def test_failing_operation_rolls_back_the_batch(self):
+        response = self.post([
+            {'op': 'create', 'name': 'milk', 'quantity': 1, 'expiration_date': '2030-01-01'},
+            {'op': 'update', 'id': self.egg.pk + 1000, 'quantity': 3},
+            {'op': 'delete', 'id': self.egg.pk},
+        ])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['errors']), ['1'])
+        self.assertEqual(
+            list(Ingredient.all_objects.filter(user=self.user).values_list('name', 'deleted_at')), [('egg', None)]
+        )
+
+    @override_settings(PANTRY_BULK={'MAX_OPERATIONS': 2})
+    def test_oversized_batch_is_rejected_before_validating_operations(self):
+        with mock.patch.object(IngredientOperationSerializer, 'validate') as validate:
+            response = self.post([{'op': 'delete', 'id': self.egg.pk}] * 3)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.json()['operations']['non_field_errors'], ["At most 2 operations per request."]
+        )
+        validate.assert_not_called()
+
+
+class PrepareImageTests(TestCase):
+
+    def encode(self, image, **params):
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', **params)
+        return buffer.getvalue()
+
+    def test_rejects_oversized_uploads(self):
+        data = self.encode(Image.new('RGB', (64, 64), (200, 40, 40)))
+        with self.assertRaises(ImageIngestError) as raised:
+            prepare_image(data, {**ingest_config(), 'MAX_UPLOAD_BYTES': len(data) - 1})
+        self.assertEqual(raised.exception.status_code, 413)
+
+    def test_rejects_too_many_pixels_from_the_header(self):
+        data = self.encode(Image.new('RGB', (200, 100)))
+        with mock.patch.object(Image.Image, 'load') as load:
+            with self.assertRaises(ImageIngestError) as raised:
+                prepare_image(data, {**ingest_config(), 'MAX_PIXELS': 200 * 100 - 1})
+        self.assertEqual(raised.exception.status_code, 413)
+        load.assert_not_called()
+
+    def test_applies_exif_orientation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # rotated 90 degrees clockwise
+        data = self.encode(Image.new('RGB', (200, 100)), exif=exif)
+        prepared = prepare_image(data)
+        self.assertEqual(prepared.image.size, (100, 200))
+        self.assertEqual(prepared.original_size, (200, 100))
+
+    def test_lowers_quality_to_fit_max_bytes(self):
+        noise = Image.frombytes('RGB', (256, 256), random.Random(0).randbytes(256 * 256 * 3))
+        best, worst = len(self.encode(noise, quality=85)), len(self.encode(noise, quality=50))
+        config = {**ingest_config(), 'MAX_EDGE': 256, 'MAX_BYTES': (best + worst) // 2}
+
+        prepared = prepare_image(self.encode(noise, quality=95), config)
+
+        self.assertLessEqual(len(prepared.data), config['MAX_BYTES'])
+        self.assertEqual(prepared.mime_type, 'image/jpeg')
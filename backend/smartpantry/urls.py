@@ -6,8 +6,17 @@ from .views import (
     IngredientListCreateView,
     IngredientDetailView,
     scan_ingredient_gemini,
-    suggest_recipes
+    suggest_recipes,
+    suggest_recipes_stream,
+    scan_job_status,
+    scan_ingredients_batch,
+    ai_stats,
+    ingredient_changes,
+    ingredient_bulk,
+    ingredients_expiring,
+    ingredients_expiry_digest
 )
+from .async_views import scan_ingredient_gemini_async, scan_job_status_async, suggest_recipes_async
 from rest_framework_simplejwt.views import TokenRefreshView
 
 urlpatterns = [
@@ -22,10 +31,31 @@ urlpatterns = [
     # --- Pantry Management ---
     path('ingredients/', IngredientListCreateView.as_view(), name='ingredient-list'),
     path('ingredients/<int:pk>/', IngredientDetailView.as_view(), name='ingredient-detail'),
+    # Delta sync: only what changed since ?since=<cursor>
+    path('ingredients/changes/', ingredient_changes, name='ingredient-changes'),
+    # Many creates / updates / deletes in one transaction
+    path('ingredients/bulk/', ingredient_bulk, name='ingredient-bulk'),
+    # e.g. /api/ingredients/expiring/?within=7d
+    path('ingredients/expiring/', ingredients_expiring, name='ingredient-expiring'),
+    path('ingredients/expiring/digest/', ingredients_expiry_digest, name='ingredient-expiry-digest'),
 
     # --- AI Features ---
     # This is the endpoint for your image upload
     path('ingredients/scan/', scan_ingredient_gemini, name='scan-ingredient'),
+    # Several photos in one request ("images" field, repeated)
+    path('ingredients/scan/batch/', scan_ingredients_batch, name='scan-ingredient-batch'),
+    # Status of a scan queued with /ingredients/scan/?async=1 (supports ?wait= long-polling)
+    path('jobs/<int:pk>/', scan_job_status, name='scan-job-status'),
     # This is the endpoint for recipe suggestions
     path('recipes/suggest/', suggest_recipes, name='suggest-recipes'),
+    # Same as above, but sends each recipe as a Server-Sent Event when it is ready
+    path('recipes/suggest/stream/', suggest_recipes_stream, name='suggest-recipes-stream'),
+
+    # --- Operations (staff only) ---
+    path('stats/', ai_stats, name='ai-stats'),
+
+    # --- AI Features (async, serve with backend/asgi.py) ---
+    path('async/ingredients/scan/', scan_ingredient_gemini_async, name='scan-ingredient-async'),
+    path('async/recipes/suggest/', suggest_recipes_async, name='suggest-recipes-async'),
+    path('async/jobs/<int:pk>/', scan_job_status_async, name='scan-job-status-async'),
 ]
\ No newline at end of file
@@ -7,11 +7,20 @@ interface Ingredient {
   quantity: number;
 }
 
+interface PantryPage {
+  next: string | null;
+  previous: string | null;
+  results: Ingredient[];
+}
+
 interface Recipe {
   title: string;
   instructions: string;
 }
 
+// Opt into the streaming recipe endpoint (recipes/suggest/stream/)
+const STREAM_RECIPES = true;
+
 const PantryList = () => {
   const [ingredients, setIngredients] = useState<Ingredient[]>([]);
   const [loading, setLoading] = useState<boolean>(true);
@@ -24,8 +33,16 @@ const PantryList = () => {
   const fetchPantry = async () => {
     try {
       setLoading(true);
-      const res = await api.get<Ingredient[]>('ingredients/');
-      setIngredients(res.data);
+      // The list is cursor-paginated; follow `next` until we have every page.
+      // Only the fields shown here are requested.
+      const items: Ingredient[] = [];
+      let url: string | null = 'ingredients/?fields=id,name,quantity&page_size=200';
+      while (url) {
+        const res: { data: PantryPage } = await api.get<PantryPage>(url);
+        items.push(...res.data.results);
+        url = res.data.next;
+      }
+      setIngredients(items);
     } catch (err) {
       console.error("Failed to fetch pantry", err);
     } finally {
@@ -46,11 +63,62 @@ const PantryList = () => {
     }
   };
 
+  // Streams recipes over Server-Sent Events so each one shows up as soon as it's ready.
+  // fetch is used instead of EventSource because we need POST + the auth header.
+  const streamPantryRecipes = async (ingredientNames: string[]) => {
+    const token = localStorage.getItem('access_token');
+    const res = await fetch(`${api.defaults.baseURL}recipes/suggest/stream/`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+        ...(token ? { Authorization: `Bearer ${token}` } : {}),
+      },
+      body: JSON.stringify({ ingredients: ingredientNames, model: selectedModel }),
+    });
+    if (!res.ok || !res.body) throw new Error(`Stream failed: ${res.status}`);
+
+    const reader = res.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    setRecipes([]);
+
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+      buffer += decoder.decode(value, { stream: true });
+
+      // Events are separated by a blank line
+      let boundary;
+      while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+        const rawEvent = buffer.slice(0, boundary);
+        buffer = buffer.slice(boundary + 2);
+        const event = rawEvent.match(/^event: (.*)$/m)?.[1];
+        const data = rawEvent.match(/^data: (.*)$/m)?.[1];
+        if (event === 'recipe' && data) {
+          const recipe: Recipe = JSON.parse(data);
+          setRecipes(prev => [...prev, recipe]);
+        } else if (event === 'error') {
+          throw new Error(data);
+        }
+      }
+    }
+  };
+
   // NEW FUNCTION: Send pantry items to Gemini
 const generatePantryRecipes = async () => {
   setLoadingRecipes(true);
   const ingredientNames = ingredients.map(item => item.name);
 
+  if (STREAM_RECIPES) {
+    try {
+      await streamPantryRecipes(ingredientNames);
+      setLoadingRecipes(false);
+      return;
+    } catch (err) {
+      console.error("Recipe stream failed, falling back to a regular request", err);
+    }
+  }
+
   try {
     // Send the model choice to the backend
     const res = await api.post('recipes/suggest/', { 